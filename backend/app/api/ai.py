@@ -1,20 +1,26 @@
 """
 AI API - AI 溯源简报生成接口
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
-import httpx
 import json
+from starlette.concurrency import run_in_threadpool
+from app.api.blockchain import get_trace
 from app.config import settings
+from app.services.ai_provider import AIProviderBusy, ai_provider
+from app.services.ai_summaries import (
+    FAILED_SUMMARY, generate_summary as generate_and_cache_summary, read_cached_summary,
+    stream_summary as stream_and_cache_summary, summary_cache, summary_content_hash
+)
 
 router = APIRouter(prefix="/ai", tags=["AI简报"])
 
 
 class AISummaryRequest(BaseModel):
-    """AI简报生成请求"""
+    """AI简报生成请求（溯源数据由服务端按溯源码读取）"""
     trace_code: str
-    chain_data: Optional[dict] = None
 
 
 class AISummaryResponse(BaseModel):
@@ -22,161 +28,21 @@ class AISummaryResponse(BaseModel):
     summary: str
     trace_code: str
     success: bool
+    cached: bool = False  # 是否命中简报缓存
 
 
 async def call_ai_api(messages: List[dict], temperature: float = 0.8, max_tokens: int = 300):
-    """通用 AI API 调用"""
-    headers = {
-        "Authorization": f"Bearer {settings.AI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": settings.AI_MODEL,
-        "messages": messages,
-        "temperature": temperature,
-        "max_tokens": max_tokens,
-        "stream": False
-    }
-    
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{settings.AI_BASE_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60.0
-        )
-        response.raise_for_status()
-        return response.json()
-
-
-def build_summary_prompt(trace_code: str, chain_data: dict) -> str:
-    """构建 AI 简报生成的提示词"""
-    from datetime import datetime
-
-    if not chain_data:
-        return f"请为溯源码为 {trace_code} 的农产品生成一份溯源简报。"
-
-    product_info = chain_data.get("product_info", {})
-    records = chain_data.get("chain_records", [])
-
-    # 基本信息
-    name = product_info.get("name", "未知产品")
-    origin = product_info.get("origin", "未知产地")
-    category = product_info.get("category", "")
-    quantity = product_info.get("quantity", 0)
-    unit = product_info.get("unit", "")
-    created_at = product_info.get("createdAt")
-    record_count = product_info.get("recordCountNum", len(records))
-
-    # 格式化创建时间
-    if created_at:
-        create_time = datetime.fromtimestamp(created_at).strftime("%Y年%m月%d日")
-    else:
-        create_time = "未知"
-
-    # 阶段和动作映射
-    stage_names = {
-        "producer": "原料种植",
-        "processor": "加工生产",
-        "inspector": "质量检测",
-        "seller": "销售"
-    }
-
-    action_names = {
-        "create": "创建产品",
-        "harvest": "收获",
-        "receive": "接收原料",
-        "process": "加工处理",
-        "send_inspect": "送检",
-        "start_inspect": "开始检测",
-        "inspect": "质量检测",
-        "stock_in": "入库",
-        "sell": "销售"
-    }
-
-    # 构建详细流程描述
-    process_details = []
-    for record in records:
-        stage = record.get("stage", "")
-        action = record.get("action", "")
-        operator_name = record.get("operatorName", "")
-        remark = record.get("remark", "")
-        data_str = record.get("data", "")
-        timestamp = record.get("timestamp")
-
-        # 格式化时间
-        if timestamp:
-            time_str = datetime.fromtimestamp(timestamp).strftime("%m月%d日 %H:%M")
-        else:
-            time_str = ""
-
-        # 解析 data 字段获取更多信息
-        extra_info = ""
-        if data_str:
-            try:
-                import json
-                data = json.loads(data_str) if isinstance(data_str, str) else data_str
-                # 提取关键信息
-                if "warehouse" in data:
-                    extra_info += f" → {data['warehouse']}"
-                if "buyer_name" in data:
-                    extra_info += f" → 买家: {data['buyer_name']}"
-                if "inspect_result" in data:
-                    extra_info += f" → {data['inspect_result']}"
-                if "quality_grade" in data:
-                    extra_info += f" → 等级: {data['quality_grade']}"
-                if "process_type" in data:
-                    extra_info += f" → 工艺: {data['process_type']}"
-                if "result_product" in data:
-                    extra_info += f" → 产出: {data['result_product']}"
-            except:
-                pass
-
-        stage_name = stage_names.get(stage, stage)
-        action_name = action_names.get(action, action)
-
-        # 构建记录描述
-        parts = [f"- {time_str}"] if time_str else []
-        parts.append(f"{stage_name}")
-        if action_name:
-            parts.append(action_name)
-        if operator_name:
-            parts.append(f"({operator_name})")
-        if remark:
-            parts.append(f": {remark}")
-        if extra_info:
-            parts.append(extra_info)
-
-        process_details.append(" ".join(parts))
-
-    process_text = "\n".join(process_details) if process_details else "暂无流转记录"
-
-    # 构建完整提示词
-    prompt = f"""你是一个农产品溯源专家。请根据以下产品的区块链溯源数据，生成一份简洁易懂的溯源简报。
-
-【产品基本信息】
-- 产品名称：{name}
-- 产品类别：{category}
-- 产地：{origin}
-- 数量：{quantity} {unit}
-- 溯源码：{trace_code}
-- 创建时间：{create_time}
-- 流转记录数：{record_count} 条
-
-【完整流转记录】
-{process_text}
-
-【要求】
-1. 生成3-5句话的简报
-2. 突出产品的安全性和可追溯性
-3. 语言简洁明了，让消费者容易理解
-4. 重点关注质检结果和流转环节的完整性
-5. 包含关键时间点和操作者信息
-6. 以自然流畅的段落形式输出，不要使用列表或项目符号
-
-请直接输出简报内容："""
-
-    return prompt
+    """通用 AI API 调用（共享连接池，受并发上限约束，429/5xx 自动重试）"""
+    return await ai_provider.chat(messages, temperature=temperature, max_tokens=max_tokens)
+
+
+async def load_trace_data(trace_code: str) -> dict:
+    """服务端读取溯源数据（与公开溯源接口同一缓存 / 快照），不存在时抛出 404"""
+    cached, _ = await get_trace(trace_code)
+    data = json.loads(cached.body)
+    if not data.get("exists", True):
+        raise HTTPException(status_code=404, detail="溯源码不存在")
+    return data
 
 
 @router.post("/summary", response_model=AISummaryResponse)
@@ -184,39 +50,24 @@ async def generate_summary(request: AISummaryRequest):
     """
     生成 AI 溯源简报
 
-    调用硅基流动 API (GLM-4.5-Air)，根据区块链溯源数据生成易读的中文简报
+    调用硅基流动 API (GLM-4.5-Air)，根据区块链溯源数据生成易读的中文简报；
+    相同溯源码且溯源数据未变化时直接返回缓存的简报
     """
     try:
         # 打印请求数据用于调试
         print(f"=== AI Summary Request ===")
         print(f"trace_code: {request.trace_code}")
-        
-        # 构建提示词
-        prompt = build_summary_prompt(request.trace_code, request.chain_data)
-        
-        # 调用 AI API
-        response_data = await call_ai_api(
-            messages=[
-                {
-                    "role": "system",
-                    "content": "你是一个农产品溯源专家，擅长用简洁易懂的语言生成产品溯源简报。"
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.8,
-            max_tokens=300
-        )
 
-        # 提取生成的简报
-        content = response_data["choices"][0]["message"]["content"]
+        chain_data = await load_trace_data(request.trace_code)
+        content_hash = summary_content_hash(request.trace_code, chain_data)
+        summary = summary_cache.get_local(request.trace_code, content_hash)
+        if summary is None:
+            summary = await run_in_threadpool(read_cached_summary, request.trace_code, content_hash)
+        if summary is not None:
+            return AISummaryResponse(summary=summary, trace_code=request.trace_code, success=True, cached=True)
 
-        if content:
-            summary = content.strip()
-        else:
-            summary = "AI生成失败，请稍后重试"
+        # 未命中：调用 AI API（相同内容的并发请求合并为一次调用）
+        summary = await generate_and_cache_summary(request.trace_code, chain_data, content_hash)
 
         return AISummaryResponse(
             summary=summary,
@@ -224,12 +75,69 @@ async def generate_summary(request: AISummaryRequest):
             success=True
         )
 
+    except HTTPException:
+        raise
+    except AIProviderBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"AI简报生成失败: {str(e)}")
 
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post("/summary/stream")
+async def stream_summary(body: AISummaryRequest, request: Request):
+    """
+    流式生成 AI 溯源简报（Server-Sent Events）
+
+    事件: delta（增量文本）、done（完整简报，cached 表示命中缓存）、error
+    相同内容的并发请求共享一次生成，生成完成后写入简报缓存；
+    所有请求方都断开时取消上游请求，不写缓存
+    """
+    trace_code = body.trace_code
+    chain_data = await load_trace_data(trace_code)
+    content_hash = summary_content_hash(trace_code, chain_data)
+    cached = summary_cache.get_local(trace_code, content_hash)
+    if cached is None:
+        cached = await run_in_threadpool(read_cached_summary, trace_code, content_hash)
+
+    async def events():
+        if cached is not None:
+            yield _sse("done", {"summary": cached, "trace_code": trace_code, "cached": True})
+            return
+
+        parts = []
+        deltas = stream_and_cache_summary(trace_code, chain_data, content_hash)
+        try:
+            async for delta in deltas:
+                if await request.is_disconnected():
+                    print(f"⚠️ AI 简报流式请求已断开: {trace_code}")
+                    return
+                parts.append(delta)
+                yield _sse("delta", {"content": delta})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield _sse("error", {"detail": f"AI简报生成失败: {str(e)}"})
+            return
+        finally:
+            # 断开或被取消时退出共享的生成（最后一个请求方退出时取消上游）
+            await deltas.aclose()
+
+        summary = "".join(parts).strip() or FAILED_SUMMARY
+        yield _sse("done", {"summary": summary, "trace_code": trace_code, "cached": False})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/health")
 async def ai_health():
     """检查 AI API 服务状态"""
@@ -1,18 +1,36 @@
 """
 Blockchain API - 区块链查询接口
 """
-from fastapi import APIRouter, HTTPException
-from typing import Optional, List
+import asyncio
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
 
 from app.blockchain import blockchain_client
-from app.database import get_db
+from app.config import settings
+from app.database import SessionLocal
+from app.services.read_routing import get_async_read_db
+from app.services.trace_cache import trace_cache, CachedTrace, make_etag
+from app.services.trace_snapshots import (
+    SOURCE_CHAIN, assemble_trace_async, load_db_trace, load_fresh_snapshot, render_body, snapshot_builder
+)
+from app.services.trace_code_filter import trace_code_filter
+from app.services.metrics import metrics
+from app.services.single_flight import AsyncSingleFlight
+from app.services.record_archive import RECORD_MODELS
 from app.models.product import Product, ProductStatus
 from app.models.user import User
+from app.services.user_directory import UserLookup
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(prefix="/blockchain", tags=["区块链"])
 
+# 公开溯源接口缓存未命中时的加载合并
+trace_load_flight = AsyncSingleFlight("trace_load")
+
 
 class ChainInfoResponse(BaseModel):
     """链信息响应"""
@@ -49,6 +67,8 @@ class VerifyResponse(BaseModel):
     exists: bool
     on_chain: bool
     product_info: Optional[dict] = None
+    source: str = "chain"  # chain=链上核验, database=链上超时/不可用时按数据库应答, filter=未签发
+    chain_verified: bool = True
 
 
 class ProductListItem(BaseModel):
@@ -79,7 +99,11 @@ async def get_chain_info():
 
 
 @router.get("/products", response_model=List[ProductListItem])
-async def get_on_chain_products(limit: int = 10, offset: int = 0):
+async def get_on_chain_products(
+    limit: int = 10,
+    offset: int = 0,
+    db: AsyncSession = Depends(get_async_read_db)
+):
     """
     获取已上架的产品列表（销售阶段的产品）
 
@@ -91,16 +115,16 @@ async def get_on_chain_products(limit: int = 10, offset: int = 0):
     """
     from app.models.product import ProductStage
 
-    db = next(get_db())
-
     try:
         # 查询已上架的产品（在销售阶段且状态正常的产品）
-        products = db.query(Product).filter(
-            Product.status == ProductStatus.ON_CHAIN,
-            Product.current_stage == ProductStage.SELLER
-        ).order_by(
-            Product.updated_at.desc()
-        ).limit(limit).offset(offset).all()
+        products = (await db.execute(
+            select(Product).where(
+                Product.status == ProductStatus.ON_CHAIN,
+                Product.current_stage == ProductStage.SELLER
+            ).order_by(
+                Product.updated_at.desc()
+            ).limit(limit).offset(offset)
+        )).scalars().all()
 
         result = []
         for product in products:
@@ -134,8 +158,6 @@ async def get_on_chain_products(limit: int = 10, offset: int = 0):
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取产品列表失败: {str(e)}")
-    finally:
-        db.close()
 
 
 @router.get("/transaction/{tx_hash}")
@@ -224,18 +246,58 @@ async def get_block(block_number: int):
         raise HTTPException(status_code=500, detail=f"查询区块失败: {str(e)}")
 
 
+# 数据库中已写入链上的产品状态（链上不可用时据此应答）
+WRITTEN_TO_CHAIN = (ProductStatus.ON_CHAIN, ProductStatus.INVALIDATED, ProductStatus.TERMINATED)
+
+
+def _verify_from_db(trace_code: str) -> VerifyResponse:
+    db = SessionLocal()
+    try:
+        product = db.query(Product.status).filter(Product.trace_code == trace_code).first()
+        on_chain = product is not None and product.status in WRITTEN_TO_CHAIN
+        db_trace = load_db_trace(db, trace_code) if on_chain else None
+    finally:
+        db.close()
+    return VerifyResponse(
+        trace_code=trace_code,
+        exists=on_chain,
+        on_chain=on_chain,
+        product_info=db_trace.product_info if db_trace else None,
+        source="database",
+        chain_verified=False
+    )
+
+
 @router.get("/verify/{trace_code}", response_model=VerifyResponse)
 async def verify_trace_code(trace_code: str):
     """
     验证溯源码是否在链上存在
+
+    存在性与产品信息并发查询；链上超出时延预算或不可用（节点熔断）时按数据库应答，
+    并在响应中标明未经链上核验（chain_verified=false）
     """
+    # 未签发的溯源码直接返回不存在（不访问链）
+    if not trace_code_filter.might_exist(trace_code):
+        return VerifyResponse(trace_code=trace_code, exists=False, on_chain=False, source="filter", chain_verified=False)
+
     try:
-        exists = blockchain_client.verify_trace_code(trace_code)
+        exists_task = asyncio.ensure_future(blockchain_client.verify_trace_code_async(trace_code))
+        product_task = asyncio.ensure_future(blockchain_client.get_product_rpc_async(trace_code))
+        try:
+            await asyncio.wait({exists_task, product_task}, timeout=settings.TRACE_VERIFY_BUDGET_MS / 1000)
+        finally:
+            for task in (exists_task, product_task):
+                task.cancel()
+
+        exists = exists_task.result() if exists_task.done() and not exists_task.cancelled() else None
+        if exists is None:
+            metrics.inc("trace_verify_source_total", source="database")
+            return await run_in_threadpool(_verify_from_db, trace_code)
 
         product_info = None
-        if exists:
-            product_info = blockchain_client.get_product(trace_code)
-
+        if exists and product_task.done() and not product_task.cancelled():
+            product_info = product_task.result()
+        metrics.inc("trace_verify_source_total", source="chain")
         return VerifyResponse(
             trace_code=trace_code,
             exists=exists,
@@ -246,118 +308,100 @@ async def verify_trace_code(trace_code: str):
         raise HTTPException(status_code=500, detail=f"验证失败: {str(e)}")
 
 
-@router.get("/product/{trace_code}/chain-data")
-async def get_product_chain_data(trace_code: str):
-    """
-    获取产品的链上原始数据（使用RPC直接调用，正确解码UTF-8中文）
-
-    如果RPC调用失败，回退到数据库查询（数据已通过上链接口写入数据库）
-    """
-    from app.database import get_db
-    from app.models.product import Product, ProductRecord
-    from app.models.user import User
-    from sqlalchemy.orm import Session
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
 
-    # 获取数据库会话
-    db = next(get_db())
 
+def _read_snapshot_body(trace_code: str) -> Optional[bytes]:
+    db = SessionLocal()
     try:
-        # 尝试使用 RPC 获取产品信息
-        product_info = blockchain_client.get_product_rpc(trace_code)
+        return load_fresh_snapshot(db, trace_code)
+    finally:
+        db.close()
 
-        # 如果 RPC 失败，从数据库获取
-        if not product_info:
-            product = db.query(Product).filter(Product.trace_code == trace_code).first()
-            if not product:
-                raise HTTPException(status_code=404, detail="溯源码不存在")
 
-            # 获取创建者和持有者的真实地址
-            creator = db.query(User).filter(User.id == product.creator_id).first()
-            holder = db.query(User).filter(User.id == product.current_holder_id).first()
-
-            product_info = {
-                "name": product.name or "",
-                "category": product.category or "",
-                "origin": product.origin or "",
-                "quantity": int((product.quantity or 0) * 1000),  # 转换为整数
-                "unit": product.unit or "",
-                "currentStage": product.current_stage.value if product.current_stage else 0,
-                "status": product.status.value if product.status else 0,
-                "creator": creator.blockchain_address if creator and creator.blockchain_address else "0x0000000000000000000000000000000000000000",
-                "currentHolder": holder.blockchain_address if holder and holder.blockchain_address else "0x0000000000000000000000000000000000000000",
-                "createdAt": int(product.created_at.timestamp()),
-                "recordCountNum": db.query(ProductRecord).filter(ProductRecord.product_id == product.id).count()
-            }
-
-        # 尝试使用 RPC 获取记录
-        records = blockchain_client.get_product_records_rpc(trace_code)
-
-        # RPC 记录补充 tx_hash（链上合约不存储 tx_hash，从数据库获取）
-        if records:
-            product_db = db.query(Product).filter(Product.trace_code == trace_code).first()
-            if product_db:
-                db_records = db.query(ProductRecord).filter(
-                    ProductRecord.product_id == product_db.id
-                ).order_by(ProductRecord.created_at.asc()).all()
-                tx_map = {r.id: (r.tx_hash, r.block_number) for r in db_records}
-                for rec in records:
-                    rid = rec.get("recordId")
-                    if rid and rid in tx_map:
-                        tx, bn = tx_map[rid]
-                        if tx: rec["txHash"] = tx
-                        if bn: rec["blockNumber"] = bn
-
-        # 如果 RPC 失败，从数据库获取
-        if not records:
-            product = db.query(Product).filter(Product.trace_code == trace_code).first()
-            if product:
-                db_records = db.query(ProductRecord).filter(
-                    ProductRecord.product_id == product.id
-                ).order_by(ProductRecord.created_at.asc()).all()
-
-                records = []
-                for i, record in enumerate(db_records):
-                    # 获取操作者的真实地址
-                    operator = db.query(User).filter(User.id == record.operator_id).first()
-                    operator_address = operator.blockchain_address if operator and operator.blockchain_address else "0x0000000000000000000000000000000000000000"
-
-                    records.append({
-                        "index": i,
-                        "recordId": record.id,
-                        "stage": record.stage.value if record.stage else 0,
-                        "action": record.action.value if record.action else 0,
-                        "data": record.data or "",
-                        "remark": record.remark or "",
-                        "operator": operator_address,
-                        "operatorName": record.operator_name or "",
-                        "timestamp": int(record.created_at.timestamp()),
-                        "previousRecordId": record.previous_record_id or 0,
-                        "amendReason": record.amend_reason or "",
-                        "txHash": record.tx_hash or "",
-                        "blockNumber": record.block_number
-                    })
+async def _load_trace(trace_code: str) -> Tuple[CachedTrace, str]:
+    """
+    缓存未命中时加载溯源响应并写回缓存（由合并请求的执行者调用）
 
-        return {
-            "trace_code": trace_code,
-            "exists": True,
-            "product_info": product_info,
-            "chain_records": records,
-            "record_count": len(records) if records else 0
-        }
+    Returns:
+        (响应, 来源 snapshot / chain / database / mixed)
+    """
+    generation = trace_cache.generation(trace_code)
+    try:
+        # 优先使用预渲染快照（主键读取）
+        body = await run_in_threadpool(_read_snapshot_body, trace_code)
+        if body is not None:
+            metrics.inc("trace_cache_requests_total", result="snapshot")
+            source = "snapshot"
+        else:
+            metrics.inc("trace_cache_requests_total", result="miss")
+            # 链上与数据库并发读取，链上超出时延预算时以数据库数据应答
+            data, source = await assemble_trace_async(trace_code, settings.TRACE_CHAIN_BUDGET_MS / 1000)
+            if data is None:
+                raise HTTPException(status_code=404, detail="溯源码不存在")
+            body = render_body(data)
+            snapshot_builder.enqueue([trace_code])
     except HTTPException:
         raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取链上数据失败: {str(e)}")
-    finally:
-        db.close()
+
+    metrics.inc("trace_source_total", source=source)
+    # 仅缓存完整来自链上的结果（数据库回退 / 部分回退的结果不缓存）
+    if source in ("snapshot", SOURCE_CHAIN):
+        return trace_cache.set(trace_code, body, generation), source
+    return CachedTrace(make_etag(body), body), source
+
+
+async def get_trace(trace_code: str) -> Tuple[CachedTrace, str]:
+    """
+    读取公开溯源响应（缓存 → 快照 → 链上/数据库组装），溯源码不存在时抛出 404
+
+    Returns:
+        (响应, 来源 cache / snapshot / chain / database / mixed)
+    """
+    # 未签发的溯源码（伪造 / 输错）直接返回 404，不访问链与数据库
+    if not trace_code_filter.might_exist(trace_code):
+        raise HTTPException(status_code=404, detail="溯源码不存在")
+
+    cached = trace_cache.get(trace_code)
+    if cached is not None:
+        metrics.inc("trace_cache_requests_total", result="hit")
+        return cached, "cache"
+    # 同一溯源码的并发未命中只加载一次，其余请求等待共享结果
+    return await trace_load_flight.do(trace_code, _load_trace, trace_code)
+
+
+@router.get("/product/{trace_code}/chain-data")
+async def get_product_chain_data(trace_code: str, request: Request):
+    """
+    获取产品的链上原始数据（使用RPC直接调用，正确解码UTF-8中文）
+
+    链上与数据库并发读取；RPC 调用失败或超出时延预算时回退到数据库数据（数据已通过上链接口写入数据库）
+    优先返回预渲染的溯源快照；响应按溯源码缓存，产品或记录变更时失效；
+    支持 ETag / If-None-Match 返回 304
+    """
+    cached, source = await get_trace(trace_code)
+
+    # X-Trace-Source: 应答来源 cache / snapshot / chain / database / mixed
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache", "X-Trace-Source": source}
+    if _etag_matches(request.headers.get("if-none-match"), cached.etag):
+        metrics.inc("trace_cache_requests_total", result="not_modified")
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
 
 
 @router.get("/products/invalidated")
 async def get_invalidated_products(
     user_role: str = None,
-    user_id: int = None
+    user_id: int = None,
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """
     获取已作废的产品列表
@@ -367,35 +411,40 @@ async def get_invalidated_products(
     - user_role: 可选，过滤参与角色
     - user_id: 可选，过滤参与用户ID
     """
-    from app.models.product import ProductRecord, RecordAction
-
-    db = next(get_db())
+    from app.models.product import RecordAction
 
     try:
         # 查询所有已作废的产品
-        products = db.query(Product).filter(
-            Product.status == ProductStatus.INVALIDATED
-        ).order_by(Product.invalidated_at.desc()).all()
+        products = (await db.execute(
+            select(Product).where(
+                Product.status == ProductStatus.INVALIDATED
+            ).order_by(Product.invalidated_at.desc())
+        )).scalars().all()
+
+        # 一次查询所有产品的参与者（从记录中提取）
+        participants_map = {}
+        if products:
+            for Record in RECORD_MODELS:
+                operator_rows = (await db.execute(
+                    select(Record.product_id, Record.operator_id).where(
+                        Record.product_id.in_([p.id for p in products]),
+                        Record.operator_id.isnot(None)
+                    ).distinct()
+                )).all()
+                for product_id, operator_id in operator_rows:
+                    participants_map.setdefault(product_id, set()).add(operator_id)
+
+        # 批量加载作废操作人和创建者的名称（在 run_sync 内完成全部查询）
+        user_ids = [p.invalidated_by for p in products] + [p.creator_id for p in products]
+        def load_names(session) -> dict:
+            users = UserLookup(session).load(user_ids)
+            return {uid: users.name(uid) for uid in user_ids if uid}
+
+        names = await db.run_sync(load_names)
 
         result = []
         for product in products:
-            # 获取作废操作人
-            invalidator = None
-            if product.invalidated_by:
-                invalidator = db.query(User).filter(User.id == product.invalidated_by).first()
-
-            # 获取创建者
-            creator = db.query(User).filter(User.id == product.creator_id).first()
-
-            # 获取参与者列表（从记录中提取）
-            records = db.query(ProductRecord).filter(
-                ProductRecord.product_id == product.id
-            ).all()
-
-            participants = set()
-            for record in records:
-                if record.operator_id:
-                    participants.add(record.operator_id)
+            participants = participants_map.get(product.id, set())
 
             # 如果指定了用户ID，检查是否参与过
             if user_id and user_id not in participants and product.creator_id != user_id:
@@ -411,8 +460,8 @@ async def get_invalidated_products(
                 "unit": product.unit,
                 "invalidated_at": product.invalidated_at.isoformat() if product.invalidated_at else None,
                 "invalidated_reason": product.invalidated_reason,
-                "invalidated_by": invalidator.real_name if invalidator else None,
-                "creator_name": creator.real_name if creator else None,
+                "invalidated_by": names.get(product.invalidated_by),
+                "creator_name": names.get(product.creator_id),
                 "tx_hash": product.tx_hash,
                 "block_number": product.block_number
             })
@@ -422,8 +471,6 @@ async def get_invalidated_products(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"获取已作废产品失败: {str(e)}")
-    finally:
-        db.close()
 
 
 @router.get("/health")
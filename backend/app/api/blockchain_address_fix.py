@@ -9,6 +9,7 @@ from typing import Dict, Any, Optional
 from sqlalchemy.orm import Session
 from app.models.user import User
 from app.models.product import Product
+from app.services.user_directory import UserLookup, ZERO_ADDRESS
 
 
 def fix_product_addresses(product_data: Dict[str, Any], db: Session) -> Dict[str, Any]:
@@ -35,44 +36,50 @@ def fix_product_addresses(product_data: Dict[str, Any], db: Session) -> Dict[str
     if not product:
         return product_data
 
-    # 获取创建者信息
-    creator = db.query(User).filter(User.id == product.creator_id).first()
-
-    # 获取持有者信息
-    holder = db.query(User).filter(User.id == product.current_holder_id).first()
+    # 批量获取创建者和持有者信息
+    users = UserLookup(db).load([product.creator_id, product.current_holder_id])
 
     # 替换零地址
     result = product_data.copy()
 
     # 替换 creator 地址
-    if product_data.get("creator") == "0x0000000000000000000000000000000000000000":
-        if creator and creator.blockchain_address:
-            result["creator"] = creator.blockchain_address
+    if product_data.get("creator") == ZERO_ADDRESS:
+        result["creator"] = users.address(product.creator_id)
 
     # 替换 currentHolder 地址
-    if product_data.get("currentHolder") == "0x0000000000000000000000000000000000000000":
-        if holder and holder.blockchain_address:
-            result["currentHolder"] = holder.blockchain_address
+    if product_data.get("currentHolder") == ZERO_ADDRESS:
+        result["currentHolder"] = users.address(product.current_holder_id)
 
     # 同样修复记录中的 operator 地址
     if "chain_records" in result:
         records = result["chain_records"]
         fixed_records = []
 
+        # 一次查询零地址记录涉及的所有操作人（通过 operator_name 匹配）
+        operator_names = {
+            r.get("operatorName") for r in records
+            if r.get("operator") == ZERO_ADDRESS and r.get("operatorName")
+        }
+        name_addresses = {}
+        if operator_names:
+            operators = db.query(User).filter(
+                User.real_name.in_(operator_names) | User.username.in_(operator_names)
+            ).order_by(User.id.asc()).all()
+            for operator in operators:
+                if not operator.blockchain_address:
+                    continue
+                for key in (operator.real_name, operator.username):
+                    if key in operator_names:
+                        name_addresses.setdefault(key, operator.blockchain_address)
+
         for record in records:
             fixed_record = record.copy()
 
-            # 如果 operator 是零地址，尝试从数据库查找
-            if record.get("operator") == "0x0000000000000000000000000000000000000000":
-                # 通过记录中的 operator_name 查找用户
-                operator_name = record.get("operatorName")
-                if operator_name:
-                    operator = db.query(User).filter(
-                        (User.real_name == operator_name) | (User.username == operator_name)
-                    ).first()
-
-                    if operator and operator.blockchain_address:
-                        fixed_record["operator"] = operator.blockchain_address
+            # 如果 operator 是零地址，使用数据库中的地址
+            if record.get("operator") == ZERO_ADDRESS:
+                address = name_addresses.get(record.get("operatorName"))
+                if address:
+                    fixed_record["operator"] = address
 
             fixed_records.append(fixed_record)
 
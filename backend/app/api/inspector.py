@@ -3,15 +3,24 @@ Inspector (质检员) API
 """
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 import json
 from app.database import get_db
+from app.services.read_routing import get_read_db
+from app.services.record_archive import product_history, query_history
 from app.models.user import User, UserRole
 from app.models.product import Product, ProductRecord, ProductStatus, ProductStage, RecordAction
 from app.api.auth import get_current_user
 from app.blockchain import blockchain_client
+from app.services.chain_reconciler import enqueue_chain_write, tracked_chain_write
+from app.services.ai_pregenerate import enqueue_if_selling
+from app.services.statistics import get_user_statistics
+from app.services.bulk_transitions import (
+    load_bulk_products, submit_bulk_transition, bulk_response, accepted_item, rejected_item
+)
+from app.config import settings
 
 router = APIRouter(prefix="/inspector", tags=["质检员"])
 
@@ -38,6 +47,11 @@ class InspectRequest(BaseModel):
     reject_reason: Optional[str] = None  # 退回/作废原因
 
 
+class BulkInspectRequest(BaseModel):
+    """批量完成检测请求"""
+    items: List[InspectRequest] = Field(..., min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
 def check_inspector_role(user: User):
     """检查是否为质检员"""
     if user.role != UserRole.INSPECTOR:
@@ -45,8 +59,8 @@ def check_inspector_role(user: User):
 
 
 @router.get("/products/pending")
-async def list_pending_products(
-    db: Session = Depends(get_db),
+def list_pending_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -105,14 +119,6 @@ async def list_pending_products(
                 is_pending = True
 
         if is_pending:
-            # 从记录数据中获取加工信息
-            process_info = {}
-            if latest_send_inspect.data:
-                try:
-                    process_info = json.loads(latest_send_inspect.data) if isinstance(latest_send_inspect.data, str) else latest_send_inspect.data
-                except:
-                    process_info = {}
-
             result.append({
                 "id": product.id,
                 "trace_code": product.trace_code,
@@ -120,16 +126,16 @@ async def list_pending_products(
                 "quantity": product.quantity,
                 "unit": product.unit,
                 "status": product.status if product.status == ProductStatus.PENDING_CHAIN else "pending",
-                "process_type": process_info.get("process_type", ""),
-                "inspect_type": process_info.get("inspection_type", "quality")
+                "process_type": latest_send_inspect.process_type or "",
+                "inspect_type": latest_send_inspect.inspection_type or "quality"
             })
 
     return result
 
 
 @router.get("/products/testing")
-async def list_testing_products(
-    db: Session = Depends(get_db),
+def list_testing_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -193,8 +199,8 @@ async def list_testing_products(
 
 
 @router.get("/products/completed")
-async def list_completed_products(
-    db: Session = Depends(get_db),
+def list_completed_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -204,23 +210,15 @@ async def list_completed_products(
     check_inspector_role(current_user)
 
     # 查询由我检测的产品
-    inspect_records = db.query(ProductRecord).filter(
-        ProductRecord.operator_id == current_user.id,
-        ProductRecord.action == RecordAction.INSPECT
-    ).all()
+    inspect_records = query_history(lambda Record: db.query(Record).filter(
+        Record.operator_id == current_user.id,
+        Record.action == RecordAction.INSPECT
+    ))
 
     result = []
     for record in inspect_records:
         product = db.query(Product).filter(Product.id == record.product_id).first()
         if product:
-            # 从记录数据中获取检测结果
-            inspect_info = {}
-            if record.data:
-                try:
-                    inspect_info = json.loads(record.data) if isinstance(record.data, str) else record.data
-                except:
-                    inspect_info = {}
-
             result.append({
                 "id": product.id,
                 "trace_code": product.trace_code,
@@ -228,8 +226,8 @@ async def list_completed_products(
                 "quantity": product.quantity,
                 "unit": product.unit,
                 "status": "completed",
-                "qualified": inspect_info.get("qualified", True),
-                "quality_grade": inspect_info.get("quality_grade", "A"),
+                "qualified": record.qualified if record.qualified is not None else True,
+                "quality_grade": record.quality_grade or "A",
                 "inspect_time": record.created_at.isoformat() if record.created_at else None
             })
 
@@ -237,7 +235,7 @@ async def list_completed_products(
 
 
 @router.post("/products/{product_id}/start-inspect")
-async def start_inspect(
+def start_inspect(
     product_id: int,
     inspect_data: StartInspectRequest,
     db: Session = Depends(get_db),
@@ -301,6 +299,7 @@ async def start_inspect(
     }
 
 
+@tracked_chain_write
 def background_inspect_product(product_id: int, user_id: int, operator_name: str, chain_data_str: str, inspect_data_dict: dict):
     """后台处理质检完成"""
     from app.database import SessionLocal
@@ -365,6 +364,7 @@ def background_inspect_product(product_id: int, user_id: int, operator_name: str
             tx_hash=final_tx, block_number=final_bn
         ))
         db.commit()
+        enqueue_if_selling(product)
     except Exception as e:
         print(f"❌ Background inspect error: {e}")
         db.rollback()
@@ -372,7 +372,7 @@ def background_inspect_product(product_id: int, user_id: int, operator_name: str
         db.close()
 
 @router.post("/products/{product_id}/inspect")
-async def inspect_product(
+def inspect_product(
     product_id: int,
     inspect_data: InspectRequest,
     background_tasks: BackgroundTasks,
@@ -389,8 +389,8 @@ async def inspect_product(
         "quality_grade": inspect_data.quality_grade, "inspect_result": inspect_data.inspect_result
     }, ensure_ascii=False)
 
-    background_tasks.add_task(
-        background_inspect_product,
+    enqueue_chain_write(
+        db, background_tasks, background_inspect_product,
         product.id, current_user.id, current_user.real_name or current_user.username,
         chain_data_str, inspect_data.model_dump()
     )
@@ -399,10 +399,48 @@ async def inspect_product(
     return {"message": "质检结果已提交，后台处理中"}
 
 
+@router.post("/bulk/inspect")
+def bulk_inspect_products(
+    request: BulkInspectRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量完成检测：一次校验，同一事务置为待上链，链上写入由后台批量执行"""
+    check_inspector_role(current_user)
+    products, results = load_bulk_products(db, request.items)
+
+    operator_name = current_user.real_name or current_user.username
+    accepted, tasks = [], []
+    for item in request.items:
+        product = products.pop(item.product_id, None)
+        if product is None:
+            continue
+        if product.current_stage != ProductStage.INSPECTOR:
+            results.append(rejected_item(product.id, "产品不在质检阶段"))
+            continue
+        if product.status == ProductStatus.PENDING_CHAIN:
+            results.append(rejected_item(product.id, "产品正在上链处理中"))
+            continue
+
+        chain_data_str = json.dumps({
+            "trace_code": product.trace_code, "qualified": item.qualified,
+            "quality_grade": item.quality_grade, "inspect_result": item.inspect_result
+        }, ensure_ascii=False)
+        accepted.append(product)
+        tasks.append((product.id, background_inspect_product, (
+            product.id, current_user.id, operator_name, chain_data_str, item.model_dump()
+        )))
+        results.append(accepted_item(product.id))
+
+    job = submit_bulk_transition(db, "bulk_inspect", current_user.id, accepted, tasks, background_tasks)
+    return bulk_response(job, results)
+
+
 @router.get("/products/{product_id}/records")
-async def get_product_records(
+def get_product_records(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -416,9 +454,7 @@ async def get_product_records(
         raise HTTPException(status_code=404, detail="产品不存在")
 
     # 获取所有记录
-    records = db.query(ProductRecord).filter(
-        ProductRecord.product_id == product_id
-    ).order_by(ProductRecord.created_at.asc()).all()
+    records = product_history(db, product_id)
 
     # 手动序列化
     result = []
@@ -439,8 +475,8 @@ async def get_product_records(
 
 
 @router.get("/statistics")
-async def get_statistics(
-    db: Session = Depends(get_db),
+def get_statistics(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -448,34 +484,14 @@ async def get_statistics(
     """
     check_inspector_role(current_user)
 
-    # 待检测数量
-    pending_count = db.query(Product).filter(
-        Product.current_stage == ProductStage.INSPECTOR,
-        Product.current_holder_id == current_user.id
-    ).count()
+    stats = get_user_statistics(db, current_user.id)
 
-    # 已完成检测数量
-    completed_count = db.query(ProductRecord).filter(
-        ProductRecord.operator_id == current_user.id,
-        ProductRecord.action == RecordAction.INSPECT
-    ).count()
+    # 待检测数量 / 已完成检测数量 / 合格数量
+    pending_count = stats.inspecting_count
+    completed_count = stats.inspected_count
+    qualified_count = stats.qualified_count
 
     # 合格率
-    qualified_count = 0
-    if completed_count > 0:
-        qualified_records = db.query(ProductRecord).filter(
-            ProductRecord.operator_id == current_user.id,
-            ProductRecord.action == RecordAction.INSPECT
-        ).all()
-
-        for record in qualified_records:
-            try:
-                data = json.loads(record.data) if isinstance(record.data, str) else record.data
-                if data.get("qualified"):
-                    qualified_count += 1
-            except:
-                pass
-
     pass_rate = (qualified_count / completed_count * 100) if completed_count > 0 else 0
 
     return {
@@ -0,0 +1,23 @@
+"""
+Jobs API - 批量任务进度查询
+"""
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.api.auth import get_current_user
+from app.models.user import User
+from app.services.bulk_jobs import bulk_jobs
+
+router = APIRouter(prefix="/jobs", tags=["批量任务"])
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    include_items: bool = True,
+    current_user: User = Depends(get_current_user)
+):
+    """查询批量任务进度与逐项结果（仅任务创建者可查看）"""
+    job = bulk_jobs.get(job_id)
+    if not job or job.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job.to_dict(include_items=include_items)
@@ -0,0 +1,35 @@
+"""
+Metrics API - 运行指标接口
+指标包含 SQL 指纹、慢查询、路由、节点地址与队列状态，仅限内部访问：
+请求需携带 METRICS_TOKEN，或来自 METRICS_ALLOWED_HOSTS 且未经反向代理转发
+"""
+from fastapi import APIRouter, Depends, HTTPException, Request
+
+from app.services.metrics import is_internal_request, metrics
+from app.services.sql_profiler import sql_profiler
+
+
+def require_internal_access(request: Request):
+    """运行指标访问控制"""
+    if not is_internal_request(request):
+        raise HTTPException(status_code=403, detail="运行指标仅限内部访问")
+
+
+router = APIRouter(prefix="/metrics", tags=["运行指标"], dependencies=[Depends(require_internal_access)])
+
+
+@router.get("")
+async def get_metrics():
+    """全部运行指标快照（计数器 / 仪表 / 耗时分布 / 各服务采集项）"""
+    return metrics.snapshot()
+
+
+@router.get("/sql")
+async def get_sql_metrics(top: int = 20):
+    """
+    SQL 统计
+    - top_statements: 按总耗时排序的语句指纹
+    - slow_queries: 最近的慢查询（含来源路由）
+    - n_plus_one: 疑似 N+1 的路由与语句
+    """
+    return sql_profiler.snapshot(top=top)
@@ -4,15 +4,24 @@ Processor (加工商) API
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 import json
 from app.database import get_db
+from app.services.read_routing import get_read_db
+from app.services.record_archive import product_history, query_history
 from app.models.user import User, UserRole
 from app.models.product import Product, ProductRecord, ProductStatus, ProductStage, RecordAction
 from app.api.auth import get_current_user
 from app.blockchain import blockchain_client
+from app.services.chain_reconciler import enqueue_chain_write, tracked_chain_write
+from app.services.statistics import get_user_statistics
+from app.services.user_directory import UserLookup, get_user_lookup
+from app.services.bulk_transitions import (
+    load_bulk_products, submit_bulk_transition, bulk_response, accepted_item, rejected_item
+)
+from app.config import settings
 
 router = APIRouter(prefix="/processor", tags=["加工商"])
 
@@ -60,6 +69,21 @@ class SendInspectRequest(BaseModel):
     notes: Optional[str] = None
 
 
+class BulkReceiveRequest(BaseModel):
+    """批量接收请求"""
+    items: List[ReceiveRequest] = Field(..., min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkProcessRequest(BaseModel):
+    """批量加工请求"""
+    items: List[ProcessRequest] = Field(..., min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkSendInspectRequest(BaseModel):
+    """批量送检请求"""
+    items: List[SendInspectRequest] = Field(..., min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
 def check_processor_role(user: User):
     """检查是否为加工商角色"""
     if user.role != UserRole.PROCESSOR:
@@ -70,8 +94,9 @@ def check_processor_role(user: User):
 
 
 @router.get("/products")
-async def list_available_products(
-    db: Session = Depends(get_db),
+def list_available_products(
+    db: Session = Depends(get_read_db),
+    users: UserLookup = Depends(get_user_lookup),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -93,12 +118,12 @@ async def list_available_products(
         )
     ).order_by(Product.created_at.desc()).all()
 
+    # 批量加载创建者信息
+    users.load(p.creator_id for p in products)
+
     # 手动序列化
     result = []
     for p in products:
-        # 获取创建者信息
-        creator = db.query(User).filter(User.id == p.creator_id).first()
-
         # 判断是公共池还是指定发送
         is_assigned = (p.distribution_type == "assigned" and p.assigned_processor_id == current_user.id)
 
@@ -115,15 +140,15 @@ async def list_available_products(
             "distribution_type": p.distribution_type or "pool",
             "is_assigned_to_me": is_assigned,  # 是否指定给当前用户
             "created_at": p.created_at.isoformat() if p.created_at else None,
-            "creator_name": creator.real_name if creator else "-"
+            "creator_name": users.name(p.creator_id, "-")
         })
 
     return result
 
 
 @router.get("/products/received")
-async def list_received_products(
-    db: Session = Depends(get_db),
+def list_received_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -156,6 +181,7 @@ async def list_received_products(
     return result
 
 
+@tracked_chain_write
 def background_receive_product(product_id: int, user_id: int, user_address: str, operator_name: str, chain_data_str: str, quality: str):
     """后台处理原料接收"""
     from app.database import SessionLocal
@@ -207,7 +233,7 @@ def background_receive_product(product_id: int, user_id: int, user_address: str,
 
 
 @router.post("/products/{product_id}/receive")
-async def receive_product(
+def receive_product(
     product_id: int,
     receive_data: ReceiveRequest,
     background_tasks: BackgroundTasks,
@@ -241,13 +267,9 @@ async def receive_product(
         "received_at": datetime.now().isoformat()
     }, default=str, ensure_ascii=False)
 
-    # 设置状态为正在处理
-    product.status = ProductStatus.PENDING_CHAIN
-    db.commit()
-
-    # 提交异步任务
-    background_tasks.add_task(
-        background_receive_product,
+    # 提交异步任务，设置状态为正在处理
+    enqueue_chain_write(
+        db, background_tasks, background_receive_product,
         product.id,
         current_user.id,
         current_user.blockchain_address,
@@ -255,10 +277,13 @@ async def receive_product(
         chain_data_str,
         receive_data.quality
     )
+    product.status = ProductStatus.PENDING_CHAIN
+    db.commit()
 
     return {"message": "接收请求已提交"}
 
 
+@tracked_chain_write
 def background_process_product(product_id: int, user_id: int, operator_name: str, chain_data_str: str, result_product: str, result_quantity: float, auto_send: bool):
     """后台处理加工"""
     from app.database import SessionLocal
@@ -302,6 +327,7 @@ def background_process_product(product_id: int, user_id: int, operator_name: str
     finally:
         db.close()
 
+@tracked_chain_write
 def background_send_inspect(product_id: int, user_id: int, operator_name: str, db: Session = None):
     """后台处理送检逻辑"""
     is_internal_session = False
@@ -356,7 +382,7 @@ def background_send_inspect(product_id: int, user_id: int, operator_name: str, d
             db.close()
 
 @router.post("/products/{product_id}/process")
-async def process_product(
+def process_product(
     product_id: int,
     process_data: ProcessRequest,
     background_tasks: BackgroundTasks,
@@ -383,8 +409,8 @@ async def process_product(
         has_reject = db.query(ProductRecord).filter(ProductRecord.product_id == product.id, ProductRecord.action == RecordAction.REJECT).first()
         auto_send = has_reject is not None
 
-    background_tasks.add_task(
-        background_process_product,
+    enqueue_chain_write(
+        db, background_tasks, background_process_product,
         product.id, current_user.id, current_user.real_name or current_user.username,
         chain_data_str, process_data.result_product, process_data.result_quantity, auto_send
     )
@@ -393,7 +419,7 @@ async def process_product(
     return {"message": "加工处理请求已提交"}
 
 @router.post("/products/{product_id}/send-inspect")
-async def send_inspect_product(
+def send_inspect_product(
     product_id: int,
     inspect_data: SendInspectRequest,
     background_tasks: BackgroundTasks,
@@ -407,8 +433,8 @@ async def send_inspect_product(
     if product.current_stage != ProductStage.PROCESSOR or product.current_holder_id != current_user.id:
         raise HTTPException(status_code=400, detail="无权操作或阶段错误")
 
-    background_tasks.add_task(
-        background_send_inspect,
+    enqueue_chain_write(
+        db, background_tasks, background_send_inspect,
         product.id, current_user.id, current_user.real_name or current_user.username
     )
     product.status = ProductStatus.PENDING_CHAIN
@@ -416,10 +442,143 @@ async def send_inspect_product(
     return {"message": "送检请求已提交"}
 
 
+# ==================== 批量操作 ====================
+
+def _held_product_error(product: Product, user: User) -> Optional[str]:
+    """加工商持有的产品能否执行加工/送检"""
+    if product.current_stage != ProductStage.PROCESSOR or product.current_holder_id != user.id:
+        return "无权操作或阶段错误"
+    if product.status == ProductStatus.PENDING_CHAIN:
+        return "产品正在上链处理中"
+    return None
+
+
+@router.post("/bulk/receive")
+def bulk_receive_products(
+    request: BulkReceiveRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量接收原料：一次校验，同一事务置为待上链，链上写入由后台批量执行"""
+    check_processor_role(current_user)
+    products, results = load_bulk_products(db, request.items)
+
+    # 预先确保地址
+    if not current_user.blockchain_address:
+        from app.blockchain.wallet import wallet_manager
+        account = wallet_manager.ensure_user_account(current_user.id, current_user.username)
+        current_user.blockchain_address = account["address"]
+
+    operator_name = current_user.real_name or current_user.username
+    accepted, tasks = [], []
+    for item in request.items:
+        product = products.pop(item.product_id, None)
+        if product is None:
+            continue
+        if product.status != ProductStatus.ON_CHAIN:
+            results.append(rejected_item(product.id, "产品未上链，无法接收"))
+            continue
+        if product.current_stage != ProductStage.PRODUCER:
+            results.append(rejected_item(product.id, "产品不在原料商阶段"))
+            continue
+
+        chain_data_str = json.dumps({
+            "received_quantity": item.received_quantity,
+            "quality": item.quality,
+            "notes": item.notes,
+            "received_at": datetime.now().isoformat()
+        }, default=str, ensure_ascii=False)
+        accepted.append(product)
+        tasks.append((product.id, background_receive_product, (
+            product.id, current_user.id, current_user.blockchain_address, operator_name, chain_data_str, item.quality
+        )))
+        results.append(accepted_item(product.id))
+
+    job = submit_bulk_transition(db, "bulk_receive", current_user.id, accepted, tasks, background_tasks)
+    return bulk_response(job, results)
+
+
+@router.post("/bulk/process")
+def bulk_process_products(
+    request: BulkProcessRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量加工处理"""
+    check_processor_role(current_user)
+    products, results = load_bulk_products(db, request.items)
+
+    # 一次查询有退回记录的产品（重新加工时默认自动送检）
+    rejected_ids = {row[0] for row in db.query(ProductRecord.product_id).filter(
+        ProductRecord.product_id.in_(list(products)),
+        ProductRecord.action == RecordAction.REJECT
+    ).distinct().all()}
+
+    operator_name = current_user.real_name or current_user.username
+    accepted, tasks = [], []
+    for item in request.items:
+        product = products.pop(item.product_id, None)
+        if product is None:
+            continue
+        error = _held_product_error(product, current_user)
+        if error:
+            results.append(rejected_item(product.id, error))
+            continue
+
+        chain_data_str = json.dumps({
+            "process_type": item.process_type,
+            "result_product": item.result_product,
+            "result_quantity": item.result_quantity,
+            "process_date": item.process_date.isoformat() if item.process_date else datetime.now().isoformat(),
+            "notes": item.notes
+        }, default=str, ensure_ascii=False)
+        auto_send = item.auto_send_inspect if item.auto_send_inspect is not None else product.id in rejected_ids
+        accepted.append(product)
+        tasks.append((product.id, background_process_product, (
+            product.id, current_user.id, operator_name, chain_data_str,
+            item.result_product, item.result_quantity, auto_send
+        )))
+        results.append(accepted_item(product.id))
+
+    job = submit_bulk_transition(db, "bulk_process", current_user.id, accepted, tasks, background_tasks)
+    return bulk_response(job, results)
+
+
+@router.post("/bulk/send-inspect")
+def bulk_send_inspect_products(
+    request: BulkSendInspectRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量送检"""
+    check_processor_role(current_user)
+    products, results = load_bulk_products(db, request.items)
+
+    operator_name = current_user.real_name or current_user.username
+    accepted, tasks = [], []
+    for item in request.items:
+        product = products.pop(item.product_id, None)
+        if product is None:
+            continue
+        error = _held_product_error(product, current_user)
+        if error:
+            results.append(rejected_item(product.id, error))
+            continue
+        accepted.append(product)
+        tasks.append((product.id, background_send_inspect, (product.id, current_user.id, operator_name)))
+        results.append(accepted_item(product.id))
+
+    job = submit_bulk_transition(db, "bulk_send_inspect", current_user.id, accepted, tasks, background_tasks)
+    return bulk_response(job, results)
+
+
 @router.get("/products/{product_id}/records")
-async def get_product_records(
+def get_product_records(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取产品的流转记录"""
@@ -429,9 +588,7 @@ async def get_product_records(
     if not product:
         raise HTTPException(status_code=404, detail="产品不存在")
 
-    records = db.query(ProductRecord).filter(
-        ProductRecord.product_id == product_id
-    ).order_by(ProductRecord.created_at.asc()).all()
+    records = product_history(db, product_id)
 
     # 手动序列化
     result = []
@@ -452,17 +609,14 @@ async def get_product_records(
 
 
 @router.get("/statistics")
-async def get_statistics(
-    db: Session = Depends(get_db),
+def get_statistics(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取加工商统计数据"""
     check_processor_role(current_user)
 
-    total = db.query(Product).filter(
-        Product.current_holder_id == current_user.id,
-        Product.current_stage == ProductStage.PROCESSOR
-    ).count()
+    total = get_user_statistics(db, current_user.id).processing_count
 
     return {
         "in_processing": total,
@@ -471,8 +625,8 @@ async def get_statistics(
 
 
 @router.get("/products/pending")
-async def list_pending_products(
-    db: Session = Depends(get_db),
+def list_pending_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -514,8 +668,8 @@ async def list_pending_products(
 
 
 @router.get("/products/processing")
-async def list_processing_products(
-    db: Session = Depends(get_db),
+def list_processing_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -557,9 +711,6 @@ async def list_processing_products(
                 # 最近的加工在送检之前，说明还没有重新加工
                 continue
 
-        # 从记录数据中获取加工信息
-        record_data = latest_process_record.data if isinstance(latest_process_record.data, dict) else json.loads(latest_process_record.data) if latest_process_record.data else {}
-
         result.append({
             "id": p.id,
             "trace_code": p.trace_code,
@@ -567,9 +718,9 @@ async def list_processing_products(
             "category": p.category,
             "quantity": p.quantity,  # 现在是成品数量
             "unit": p.unit,
-            "process_type": record_data.get("process_type", ""),
-            "output_product": record_data.get("result_product", ""),
-            "output_quantity": record_data.get("result_quantity", 0),
+            "process_type": latest_process_record.process_type or "",
+            "output_product": latest_process_record.result_product or "",
+            "output_quantity": latest_process_record.result_quantity or 0,
             "status": p.status if p.status == ProductStatus.PENDING_CHAIN else "processing"
         })
 
@@ -577,8 +728,8 @@ async def list_processing_products(
 
 
 @router.get("/products/sent")
-async def list_sent_products(
-    db: Session = Depends(get_db),
+def list_sent_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -590,12 +741,12 @@ async def list_sent_products(
     check_processor_role(current_user)
 
     # 查询加工商操作过的产品（通过记录表）
-    sent_product_ids = db.query(ProductRecord.product_id).filter(
-        ProductRecord.operator_id == current_user.id,
-        ProductRecord.action == RecordAction.SEND_INSPECT
-    ).distinct().all()
+    sent_product_ids = query_history(lambda Record: db.query(Record.product_id).filter(
+        Record.operator_id == current_user.id,
+        Record.action == RecordAction.SEND_INSPECT
+    ).distinct())
 
-    product_ids = [p[0] for p in sent_product_ids]
+    product_ids = list({p[0] for p in sent_product_ids})
 
     if not product_ids:
         return []
@@ -609,21 +760,14 @@ async def list_sent_products(
     result = []
     for p in products:
         # 检查是否有送检记录
-        inspect_record = db.query(ProductRecord).filter(
-            ProductRecord.product_id == p.id,
-            ProductRecord.action.in_([RecordAction.SEND_INSPECT, RecordAction.INSPECT])
-        ).first()
+        records = product_history(db, p.id)
+        inspect_record = next(
+            (r for r in records if r.action in (RecordAction.SEND_INSPECT, RecordAction.INSPECT)), None
+        )
 
         if inspect_record:
             # 获取加工信息
-            process_record = db.query(ProductRecord).filter(
-                ProductRecord.product_id == p.id,
-                ProductRecord.action == RecordAction.PROCESS
-            ).first()
-
-            record_data = {}
-            if process_record:
-                record_data = process_record.data if isinstance(process_record.data, dict) else json.loads(process_record.data) if process_record.data else {}
+            process_record = next((r for r in records if r.action == RecordAction.PROCESS), None)
 
             result.append({
                 "id": p.id,
@@ -632,9 +776,9 @@ async def list_sent_products(
                 "category": p.category,
                 "quantity": p.quantity,
                 "unit": p.unit,
-                "process_type": record_data.get("process_type", ""),
-                "output_product": record_data.get("result_product", ""),
-                "output_quantity": record_data.get("result_quantity", 0),
+                "process_type": (process_record.process_type or "") if process_record else "",
+                "output_product": (process_record.result_product or "") if process_record else "",
+                "output_quantity": (process_record.result_quantity or 0) if process_record else 0,
                 "status": p.status if p.status == ProductStatus.PENDING_CHAIN else "sent"
             })
 
@@ -642,8 +786,8 @@ async def list_sent_products(
 
 
 @router.get("/products/rejected")
-async def list_rejected_products(
-    db: Session = Depends(get_db),
+def list_rejected_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -707,8 +851,9 @@ async def list_rejected_products(
 
 
 @router.get("/products/invalidated")
-async def list_invalidated_products(
-    db: Session = Depends(get_db),
+def list_invalidated_products(
+    db: Session = Depends(get_read_db),
+    users: UserLookup = Depends(get_user_lookup),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -717,12 +862,12 @@ async def list_invalidated_products(
     check_processor_role(current_user)
 
     # 查询当前用户参与过的已作废产品
-    # 通过 ProductRecord 找出当前用户操作过的产品
-    operated_product_ids = db.query(ProductRecord.product_id).filter(
-        ProductRecord.operator_id == current_user.id
-    ).distinct().all()
+    # 通过流转记录（含归档）找出当前用户操作过的产品
+    operated_product_ids = query_history(lambda Record: db.query(Record.product_id).filter(
+        Record.operator_id == current_user.id
+    ).distinct())
 
-    product_ids = [p[0] for p in operated_product_ids]
+    product_ids = list({p[0] for p in operated_product_ids})
 
     if not product_ids:
         return []
@@ -733,13 +878,11 @@ async def list_invalidated_products(
         Product.status == ProductStatus.INVALIDATED
     ).order_by(Product.invalidated_at.desc()).all()
 
+    # 批量加载作废操作人
+    users.load(p.invalidated_by for p in products)
+
     result = []
     for p in products:
-        # 获取作废操作人
-        invalidator = None
-        if p.invalidated_by:
-            invalidator = db.query(User).filter(User.id == p.invalidated_by).first()
-
         result.append({
             "id": p.id,
             "trace_code": p.trace_code,
@@ -749,7 +892,7 @@ async def list_invalidated_products(
             "unit": p.unit,
             "invalidated_at": p.invalidated_at.isoformat() if p.invalidated_at else None,
             "invalidated_reason": p.invalidated_reason,
-            "invalidated_by": invalidator.real_name if invalidator else None,
+            "invalidated_by": users.name(p.invalidated_by),
             "status": "invalidated"
         })
 
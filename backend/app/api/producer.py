@@ -1,18 +1,35 @@
 """
 Producer (原料商) API
 """
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, ValidationError
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, List, Tuple, Iterator
 from datetime import datetime
+from functools import partial
+import csv
+import io
 import json
 import uuid
+from app.config import settings
 from app.database import get_db
+from app.services.read_routing import get_read_db
+from app.services.record_archive import product_history
 from app.models.user import User, UserRole
-from app.models.product import Product, ProductRecord, ProductStatus, ProductStage, RecordAction
+from app.models.product import (
+    Product, ProductRecord, ProductStatus, ProductStage, RecordAction, build_chain_payload, extract_record_fields
+)
 from app.api.auth import get_current_user
 from app.blockchain import blockchain_client
+from app.services.chain_reconciler import enqueue_chain_write, tracked_chain_write
+from app.services.statistics import get_user_statistics, increment_statistics
+from app.services.bulk_jobs import bulk_jobs, BulkJob
+from app.services.chain_batch import submit_chain_batch
+from app.services.user_directory import UserLookup, get_user_lookup
+from app.services.trace_code_filter import trace_code_filter
+from app.services.trace_bundles import withdraw_bundle
 
 router = APIRouter(prefix="/producer", tags=["原料商"])
 
@@ -119,12 +136,15 @@ def generate_trace_code() -> str:
     """生成溯源码"""
     date_str = datetime.now().strftime("%Y%m%d")
     unique_id = uuid.uuid4().hex[:8].upper()
-    return f"TRACE-{date_str}-{unique_id}"
+    trace_code = f"TRACE-{date_str}-{unique_id}"
+    # 签发即加入存在性过滤器（产品提交前公开接口也不会误判为不存在）
+    trace_code_filter.add(trace_code)
+    return trace_code
 
 
 @router.get("/processors")
-async def get_processors(
-    db: Session = Depends(get_db),
+def get_processors(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取加工商列表（用于指定发送）"""
@@ -142,10 +162,11 @@ async def get_processors(
 
 
 @router.get("/products", response_model=List[ProductResponse])
-async def list_products(
+def list_products(
     status: Optional[ProductStatus] = None,
     include_invalidated: bool = False,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
+    users: UserLookup = Depends(get_user_lookup),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -166,12 +187,8 @@ async def list_products(
 
     products = query.order_by(Product.created_at.desc()).all()
 
-    # 获取所有指定的加工商ID
-    processor_ids = [p.assigned_processor_id for p in products if p.assigned_processor_id]
-    processors_map = {}
-    if processor_ids:
-        processors = db.query(User).filter(User.id.in_(processor_ids)).all()
-        processors_map = {p.id: p.real_name or p.username for p in processors}
+    # 批量加载所有指定的加工商
+    users.load(p.assigned_processor_id for p in products)
 
     # 为每个产品添加加工商名称
     result = []
@@ -190,7 +207,7 @@ async def list_products(
             "current_stage": p.current_stage,
             "distribution_type": p.distribution_type or "pool",
             "assigned_processor_id": p.assigned_processor_id,
-            "assigned_processor_name": processors_map.get(p.assigned_processor_id) if p.assigned_processor_id else None,
+            "assigned_processor_name": users.name(p.assigned_processor_id),
             "tx_hash": p.tx_hash,
             "block_number": p.block_number,
             "created_at": p.created_at,
@@ -202,7 +219,7 @@ async def list_products(
 
 
 @router.post("/products", response_model=ProductResponse)
-async def create_product(
+def create_product(
     product_data: ProductCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -246,9 +263,9 @@ async def create_product(
 
 
 @router.get("/products/{product_id}", response_model=ProductResponse)
-async def get_product(
+def get_product(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取原料详情"""
@@ -266,7 +283,7 @@ async def get_product(
 
 
 @router.put("/products/{product_id}", response_model=ProductResponse)
-async def update_product(
+def update_product(
     product_id: int,
     product_data: ProductUpdate,
     db: Session = Depends(get_db),
@@ -296,6 +313,35 @@ async def update_product(
     return product
 
 
+def apply_submit_result(db: Session, product: Product, creator_id: int, operator_name: str,
+                        success: bool, tx_hash: Optional[str], block_number: Optional[int]):
+    """根据上链结果更新产品状态并追加上链记录（不提交事务）"""
+    if not success:
+        # 上链失败
+        product.status = ProductStatus.CHAIN_FAILED
+        return
+
+    product.status = ProductStatus.ON_CHAIN
+    product.tx_hash = tx_hash
+    product.block_number = block_number
+
+    # 创建上链记录
+    db.add(ProductRecord(
+        product_id=product.id,
+        stage=ProductStage.PRODUCER,
+        action=RecordAction.HARVEST,
+        data=json.dumps({
+            "trace_code": product.trace_code,
+            "action": "submit_to_chain"
+        }, ensure_ascii=False),
+        operator_id=creator_id,
+        operator_name=operator_name,
+        tx_hash=tx_hash,
+        block_number=block_number
+    ))
+
+
+@tracked_chain_write
 def background_submit_to_chain(product_id: int, creator_id: int, operator_name: str, chain_data_str: str, quantity_int: int):
     """后台异步执行上链任务"""
     from app.database import SessionLocal
@@ -319,33 +365,11 @@ def background_submit_to_chain(product_id: int, creator_id: int, operator_name:
             operator_name=operator_name
         )
 
-        if success:
-            product.status = ProductStatus.ON_CHAIN
-            product.tx_hash = tx_hash
-            product.block_number = block_number
-
-            # 创建上链记录
-            record = ProductRecord(
-                product_id=product.id,
-                stage=ProductStage.PRODUCER,
-                action=RecordAction.HARVEST,
-                data=json.dumps({
-                    "trace_code": product.trace_code,
-                    "action": "submit_to_chain"
-                }, ensure_ascii=False),
-                operator_id=creator_id,
-                operator_name=operator_name,
-                tx_hash=tx_hash,
-                block_number=block_number
-            )
-            db.add(record)
-            db.commit()
-        else:
-            # 上链失败
-            product.status = ProductStatus.CHAIN_FAILED
-            db.commit()
+        apply_submit_result(db, product, creator_id, operator_name, success, tx_hash, block_number)
+        db.commit()
+        if not success:
             print(f"❌ Background chain submission failed for product {product_id}")
-            
+
     except Exception as e:
         print(f"❌ Background task error: {e}")
         db.rollback()
@@ -354,7 +378,7 @@ def background_submit_to_chain(product_id: int, creator_id: int, operator_name:
 
 
 @router.post("/products/{product_id}/submit", response_model=ProductResponse)
-async def submit_to_chain(
+def submit_to_chain(
     product_id: int,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
@@ -374,43 +398,270 @@ async def submit_to_chain(
     if product.status != ProductStatus.DRAFT:
         raise HTTPException(status_code=400, detail="仅草稿状态可提交上链")
 
-    # 生成溯源码并设置状态为“待上链”
-    product.trace_code = generate_trace_code()
+    # 生成溯源码（早期批量导入的草稿可能已预分配）并设置状态为“待上链”
+    if not product.trace_code:
+        product.trace_code = generate_trace_code()
+        product.trace_code_issued_at = func.now()
     product.status = ProductStatus.PENDING_CHAIN
-    db.commit()
-    db.refresh(product)
 
     # 准备上链数据
     operator_name = current_user.real_name or current_user.username
-    chain_data_str = json.dumps({
-        "name": product.name,
-        "category": product.category,
-        "origin": product.origin,
-        "batch_no": product.batch_no,
-        "quantity": product.quantity,
-        "unit": product.unit,
-        "harvest_date": str(product.harvest_date) if product.harvest_date else None
-    }, ensure_ascii=False)
-    
-    quantity_int = int((product.quantity or 0) * 1000)
+    chain_data_str, quantity_int = build_chain_payload(product)
 
-    # 添加后台任务
-    background_tasks.add_task(
-        background_submit_to_chain,
+    # 添加后台任务（操作意图随状态一同提交）
+    enqueue_chain_write(
+        db, background_tasks, background_submit_to_chain,
         product.id,
         current_user.id,
         operator_name,
         chain_data_str,
         quantity_int
     )
+    db.commit()
+    db.refresh(product)
 
     return product
 
 
+# ==================== 批量导入 ====================
+
+def iter_import_rows(upload: UploadFile) -> Iterator[Tuple[int, dict]]:
+    """
+    流式读取导入文件，逐行产出 (行号, 字段字典)
+
+    - .csv: 首行为表头，字段名与 ProductCreate 一致，空值视为未填写
+    - .ndjson / .jsonl: 每行一个 JSON 对象
+    """
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    filename = (upload.filename or "").lower()
+
+    if filename.endswith(".csv") or upload.content_type == "text/csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k and v not in (None, "")}
+        return
+
+    for line_no, line in enumerate(text, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row if isinstance(row, dict) else {"__invalid__": line[:100]}
+
+
+def generate_trace_codes(db: Session, count: int) -> List[str]:
+    """批量生成溯源码（一次查询排除已存在的）"""
+    codes = set()
+    while len(codes) < count:
+        candidates = {generate_trace_code() for _ in range(count - len(codes))} - codes
+        existing = {row[0] for row in db.query(Product.trace_code).filter(Product.trace_code.in_(candidates)).all()}
+        codes |= candidates - existing
+    return list(codes)
+
+
+def insert_import_chunk(db: Session, items: List[ProductCreate], creator: User, submit: bool) -> List[int]:
+    """
+    使用 insert().values() 批量写入一批产品及其创建记录（单事务）
+    直接提交的产品签发溯源码；草稿与单条创建一致不签发（提交上链时生成），
+    写入时以临时键定位新行 ID，事务提交前清空
+
+    Returns:
+        新产品 ID 列表
+    """
+    operator_name = creator.real_name or creator.username
+    status_value = ProductStatus.PENDING_CHAIN if submit else ProductStatus.DRAFT
+    if submit:
+        codes = generate_trace_codes(db, len(items))
+    else:
+        codes = [f"IMPORT-{uuid.uuid4().hex}" for _ in items]
+
+    db.execute(insert(Product).values([
+        {
+            "trace_code": code,
+            "trace_code_issued_at": func.now() if submit else None,
+            "name": item.name,
+            "category": item.category,
+            "origin": item.origin,
+            "batch_no": item.batch_no,
+            "quantity": item.quantity,
+            "unit": item.unit,
+            "harvest_date": item.harvest_date,
+            "distribution_type": item.distribution_type or "pool",
+            "assigned_processor_id": item.assigned_processor_id if item.distribution_type == "assigned" else None,
+            "status": status_value,
+            "current_stage": ProductStage.PRODUCER,
+            "creator_id": creator.id,
+            "current_holder_id": creator.id,
+        }
+        for code, item in zip(codes, items)
+    ]))
+    ids = dict(db.query(Product.trace_code, Product.id).filter(Product.trace_code.in_(codes)).all())
+
+    records = []
+    for code, item in zip(codes, items):
+        data = json.dumps(item.model_dump(), default=str, ensure_ascii=False)
+        records.append({
+            "product_id": ids[code],
+            "stage": ProductStage.PRODUCER,
+            "action": RecordAction.CREATE,
+            "data": data,
+            "remark": item.remark,
+            "operator_id": creator.id,
+            "operator_name": operator_name,
+            **extract_record_fields(data),
+        })
+    db.execute(insert(ProductRecord).values(records))
+    if not submit:
+        db.execute(update(Product).where(Product.id.in_(ids.values())).values(trace_code=None))
+
+    # 批量写入不经过 ORM flush，统计计数手动累加
+    changes = {"product_total": len(items)}
+    if not submit:
+        changes["product_draft"] = len(items)
+    increment_statistics(db, {creator.id: changes})
+
+    db.commit()
+    return [ids[code] for code in codes]
+
+
+def run_product_import(db: Session, upload: UploadFile, creator: User, submit: bool, job: BulkJob) -> Tuple[List[int], int]:
+    """
+    逐行校验并分批写入，校验失败的行记录到任务错误中
+
+    Returns:
+        (新产品 ID 列表, 校验失败行数)
+    """
+    product_ids: List[int] = []
+    chunk: List[ProductCreate] = []
+    rows, invalid = 0, 0
+
+    for line_no, row in iter_import_rows(upload):
+        rows += 1
+        if rows > settings.IMPORT_MAX_ROWS:
+            job.add_error(line=line_no, error=f"超过单次导入上限 {settings.IMPORT_MAX_ROWS} 行，其余行未处理")
+            break
+        if "__invalid__" in row:
+            job.add_error(line=line_no, error="无效的 JSON 行")
+            invalid += 1
+            continue
+        try:
+            chunk.append(ProductCreate(**row))
+        except ValidationError as e:
+            job.add_error(line=line_no, error="; ".join(
+                f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+            ))
+            invalid += 1
+            continue
+
+        if len(chunk) >= settings.IMPORT_CHUNK_SIZE:
+            product_ids += insert_import_chunk(db, chunk, creator, submit)
+            chunk = []
+
+    if chunk:
+        product_ids += insert_import_chunk(db, chunk, creator, submit)
+    return product_ids, invalid
+
+
+def background_bulk_submit_to_chain(job_id: str, product_ids: List[int], creator_id: int, operator_name: str):
+    """后台分批上链：每批并发提交并统一确认回执"""
+    from app.database import SessionLocal
+    job = bulk_jobs.get(job_id)
+    db = SessionLocal()
+    try:
+        for start in range(0, len(product_ids), settings.CHAIN_BATCH_SIZE):
+            batch_ids = product_ids[start:start + settings.CHAIN_BATCH_SIZE]
+            products = db.query(Product).filter(
+                Product.id.in_(batch_ids),
+                Product.status == ProductStatus.PENDING_CHAIN
+            ).all()
+
+            writes = {}
+            for product in products:
+                chain_data_str, quantity_int = build_chain_payload(product)
+                writes[product.id] = partial(
+                    blockchain_client.create_product,
+                    trace_code=product.trace_code,
+                    name=product.name or "",
+                    category=product.category or "",
+                    origin=product.origin or "",
+                    quantity=quantity_int,
+                    unit=product.unit or "",
+                    data=chain_data_str,
+                    operator_name=operator_name,
+                    wait=False
+                )
+            results = submit_chain_batch(writes)
+
+            for product in products:
+                success, tx_hash, block_number = results[product.id]
+                apply_submit_result(db, product, creator_id, operator_name, success, tx_hash, block_number)
+            db.commit()
+
+            for product in products:
+                success, tx_hash, block_number = results[product.id]
+                job.item_done(product.id, success, trace_code=product.trace_code,
+                              tx_hash=tx_hash, block_number=block_number)
+        job.finish()
+    except Exception as e:
+        print(f"❌ Background bulk chain submission error: {e}")
+        db.rollback()
+        job.finish(error=str(e))
+    finally:
+        db.close()
+
+
+@router.post("/products/import")
+async def import_products(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    submit: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量导入原料（CSV / NDJSON）
+    - 逐行校验，校验失败的行跳过并在结果中返回行号与原因
+    - 每 IMPORT_CHUNK_SIZE 行批量写入一次
+    - submit=true 时导入后直接进入待上链状态，后台分批上链；进度通过 /api/jobs/{job_id} 查询
+    """
+    check_producer_role(current_user)
+
+    job = bulk_jobs.create("product_import", current_user.id)
+    try:
+        product_ids, invalid = await run_in_threadpool(run_product_import, db, file, current_user, submit, job)
+    except UnicodeDecodeError:
+        job.finish(error="文件编码错误")
+        raise HTTPException(status_code=400, detail="文件编码错误，请使用 UTF-8")
+
+    job.start(total=len(product_ids))
+    if submit and product_ids:
+        background_tasks.add_task(
+            background_bulk_submit_to_chain,
+            job.id,
+            product_ids,
+            current_user.id,
+            current_user.real_name or current_user.username
+        )
+    else:
+        job.add_progress(succeeded=len(product_ids))
+        job.finish()
+
+    return {
+        "job_id": job.id,
+        "imported": len(product_ids),
+        "invalid": invalid,
+        "errors": job.errors[:50],
+        "submitted": submit and bool(product_ids)
+    }
+
+
 @router.get("/products/{product_id}/records", response_model=List[RecordResponse])
-async def get_product_records(
+def get_product_records(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取产品流转记录"""
@@ -424,15 +675,13 @@ async def get_product_records(
     if not product:
         raise HTTPException(status_code=404, detail="原料不存在")
 
-    records = db.query(ProductRecord).filter(
-        ProductRecord.product_id == product_id
-    ).order_by(ProductRecord.created_at.asc()).all()
+    records = product_history(db, product_id)
 
     return records
 
 
 @router.delete("/products/{product_id}")
-async def delete_product(
+def delete_product(
     product_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -460,7 +709,7 @@ async def delete_product(
 
 
 @router.post("/products/{product_id}/invalidate")
-async def invalidate_product(
+def invalidate_product(
     product_id: int,
     invalidate_data: InvalidateRequest,
     db: Session = Depends(get_db),
@@ -518,6 +767,14 @@ async def invalidate_product(
     db.commit()
     db.refresh(product)
 
+    # 立即撤下静态溯源包，避免作废产品在下次导出前仍以有效签名包分发
+    if product.trace_code:
+        try:
+            if withdraw_bundle(product.trace_code):
+                print(f"📦 已撤下静态溯源包: {product.trace_code}")
+        except OSError as e:
+            print(f"⚠️ 撤下静态溯源包失败（下次导出时撤下）: {e}")
+
     return {
         "message": "产品已作废（链上数据无法删除，溯源码已失效）",
         "deleted": False,
@@ -533,8 +790,8 @@ async def invalidate_product(
 
 
 @router.get("/invalidated")
-async def get_invalidated_products(
-    db: Session = Depends(get_db),
+def get_invalidated_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取已作废产品列表"""
@@ -572,6 +829,7 @@ async def get_invalidated_products(
     return result
 
 
+@tracked_chain_write
 def background_amend_product(product_id: int, user_id: int, operator_name: str, amend_chain_data: str, reason: str, last_record_id: int, db_field: str, new_value: any):
     """后台处理修正记录"""
     from app.database import SessionLocal
@@ -619,7 +877,7 @@ def background_amend_product(product_id: int, user_id: int, operator_name: str,
         db.close()
 
 @router.post("/products/{product_id}/amend", response_model=RecordResponse)
-async def amend_product(
+def amend_product(
     product_id: int,
     amend_data: AmendRequest,
     background_tasks: BackgroundTasks,
@@ -639,8 +897,8 @@ async def amend_product(
 
     amend_chain_data = json.dumps({"field": amend_data.field, "old_value": amend_data.old_value, "new_value": amend_data.new_value}, ensure_ascii=False)
 
-    background_tasks.add_task(
-        background_amend_product,
+    enqueue_chain_write(
+        db, background_tasks, background_amend_product,
         product.id, current_user.id, current_user.real_name or current_user.username,
         amend_chain_data, amend_data.reason, last_record.id if last_record else 0,
         db_field, amend_data.new_value
@@ -656,6 +914,7 @@ async def amend_product(
         operator_name=current_user.real_name or current_user.username, created_at=datetime.now()
     )
 
+@tracked_chain_write
 def background_resubmit_product(product_id: int, user_id: int, operator_name: str, resubmit_data_str: str):
     """后台处理重新提交"""
     from app.database import SessionLocal
@@ -690,7 +949,7 @@ def background_resubmit_product(product_id: int, user_id: int, operator_name: st
         db.close()
 
 @router.post("/products/{product_id}/resubmit")
-async def resubmit_rejected_product(
+def resubmit_rejected_product(
     product_id: int,
     data: ResubmitRequest,
     background_tasks: BackgroundTasks,
@@ -714,8 +973,8 @@ async def resubmit_rejected_product(
         "origin": product.origin, "quantity": product.quantity, "unit": product.unit
     }, ensure_ascii=False)
 
-    background_tasks.add_task(
-        background_resubmit_product,
+    enqueue_chain_write(
+        db, background_tasks, background_resubmit_product,
         product.id, current_user.id, current_user.real_name or current_user.username,
         resubmit_data_str
     )
@@ -725,8 +984,8 @@ async def resubmit_rejected_product(
 
 
 @router.get("/rejected")
-async def get_rejected_products(
-    db: Session = Depends(get_db),
+def get_rejected_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -743,13 +1002,19 @@ async def get_rejected_products(
         Product.current_stage == ProductStage.PRODUCER
     ).all()
 
+    # 一次查询所有产品的退回记录，保留每个产品最近的一条
+    latest_rejects = {}
+    if products:
+        reject_records = db.query(ProductRecord).filter(
+            ProductRecord.product_id.in_([p.id for p in products]),
+            ProductRecord.action == RecordAction.REJECT
+        ).order_by(ProductRecord.created_at.asc()).all()
+        for record in reject_records:
+            latest_rejects[record.product_id] = record
+
     result = []
     for p in products:
-        # 检查是否有退回记录
-        reject_record = db.query(ProductRecord).filter(
-            ProductRecord.product_id == p.id,
-            ProductRecord.action == RecordAction.REJECT
-        ).order_by(ProductRecord.created_at.desc()).first()
+        reject_record = latest_rejects.get(p.id)
 
         if reject_record:
             # 解析退回信息
@@ -779,27 +1044,19 @@ async def get_rejected_products(
 
 
 @router.get("/statistics")
-async def get_statistics(
-    db: Session = Depends(get_db),
+def get_statistics(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取原料商统计数据"""
     check_producer_role(current_user)
 
-    # 统计各状态产品数量
-    total = db.query(Product).filter(Product.creator_id == current_user.id).count()
-    draft_count = db.query(Product).filter(
-        Product.creator_id == current_user.id,
-        Product.status == ProductStatus.DRAFT
-    ).count()
-    on_chain_count = db.query(Product).filter(
-        Product.creator_id == current_user.id,
-        Product.status == ProductStatus.ON_CHAIN
-    ).count()
+    # 读取增量维护的统计计数
+    stats = get_user_statistics(db, current_user.id)
 
     return {
-        "total": total,
-        "draft": draft_count,
-        "on_chain": on_chain_count,
-        "terminated": total - draft_count - on_chain_count
+        "total": stats.product_total,
+        "draft": stats.product_draft,
+        "on_chain": stats.product_on_chain,
+        "terminated": stats.product_total - stats.product_draft - stats.product_on_chain
     }
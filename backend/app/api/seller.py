@@ -3,15 +3,25 @@ Seller (销售商) API
 """
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 import json
 from app.database import get_db
+from app.services.read_routing import get_read_db
+from app.services.record_archive import product_history, query_history, record_order
 from app.models.user import User, UserRole
 from app.models.product import Product, ProductRecord, ProductStatus, ProductStage, RecordAction
 from app.api.auth import get_current_user
 from app.blockchain import blockchain_client
+from app.services.chain_reconciler import enqueue_chain_write, tracked_chain_write
+from app.services.ai_pregenerate import enqueue_if_selling
+from app.services.statistics import get_user_statistics
+from app.services.inventory import query_inventory
+from app.services.bulk_transitions import (
+    load_bulk_products, submit_bulk_transition, bulk_response, accepted_item, rejected_item
+)
+from app.config import settings
 
 router = APIRouter(prefix="/seller", tags=["销售商"])
 
@@ -34,6 +44,16 @@ class SellRequest(BaseModel):
     notes: Optional[str] = None
 
 
+class BulkStockInRequest(BaseModel):
+    """批量入库请求"""
+    items: List[StockInRequest] = Field(..., min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
+class BulkSellRequest(BaseModel):
+    """批量上架请求"""
+    items: List[SellRequest] = Field(..., min_length=1, max_length=settings.BULK_MAX_ITEMS)
+
+
 def check_seller_role(user: User):
     """检查是否为销售商"""
     if user.role != UserRole.SELLER:
@@ -41,8 +61,8 @@ def check_seller_role(user: User):
 
 
 @router.get("/products/inventory")
-async def list_inventory_products(
-    db: Session = Depends(get_db),
+def list_inventory_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -52,55 +72,11 @@ async def list_inventory_products(
     """
     check_seller_role(current_user)
 
-    # 查询当前在销售阶段且由当前销售商持有的产品
-    # 排除已经有销售/上架记录的产品
-    subquery = db.query(ProductRecord.product_id).filter(
-        ProductRecord.action == RecordAction.SELL
-    ).subquery()
-
-    products = db.query(Product).filter(
-        Product.current_stage == ProductStage.SELLER,
-        Product.current_holder_id == current_user.id,
-        ~Product.id.in_(subquery)
-    ).all()
+    # 一次聚合查询: 当前在销售阶段、由当前销售商持有且未上架的产品及其库存流水
+    rows = query_inventory(db, current_user.id)
 
     result = []
-    for product in products:
-        # 获取最近的入库记录
-        stock_in_record = db.query(ProductRecord).filter(
-            ProductRecord.product_id == product.id,
-            ProductRecord.action == RecordAction.STOCK_IN
-        ).first()
-
-        # 获取已销售总量
-        sell_records = db.query(ProductRecord).filter(
-            ProductRecord.product_id == product.id,
-            ProductRecord.action == RecordAction.SELL
-        ).all()
-
-        sold_quantity = 0
-        for record in sell_records:
-            try:
-                data = json.loads(record.data) if isinstance(record.data, str) else record.data
-                sold_quantity += data.get("quantity", 0)
-            except:
-                pass
-
-        # 计算剩余库存
-        available_quantity = (product.quantity or 0) - sold_quantity
-
-        # 解析入库记录数据
-        warehouse = "未入库"
-        if stock_in_record:
-            try:
-                if isinstance(stock_in_record.data, str):
-                    data = json.loads(stock_in_record.data)
-                else:
-                    data = stock_in_record.data
-                warehouse = data.get("warehouse", "未入库") if data else "未入库"
-            except:
-                warehouse = "未入库"
-
+    for product, warehouse, stock_in_time in rows:
         result.append({
             "id": product.id,
             "trace_code": product.trace_code,
@@ -108,19 +84,19 @@ async def list_inventory_products(
             "category": product.category,
             "quantity": product.quantity,
             "unit": product.unit,
-            "available_quantity": available_quantity,
+            "available_quantity": product.quantity or 0,  # 上架即整批离开库存，库存中的产品均为全量
             "origin": product.origin,
-            "warehouse": warehouse,
+            "warehouse": warehouse or "未入库",
             "status": product.status,
-            "stock_in_time": stock_in_record.created_at.isoformat() if stock_in_record else None
+            "stock_in_time": stock_in_time.isoformat() if stock_in_time else None
         })
 
     return result
 
 
 @router.get("/products/sold")
-async def list_sold_products(
-    db: Session = Depends(get_db),
+def list_sold_products(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -131,10 +107,10 @@ async def list_sold_products(
     check_seller_role(current_user)
 
     # 查询上架记录
-    sell_records = db.query(ProductRecord).filter(
-        ProductRecord.operator_id == current_user.id,
-        ProductRecord.action == RecordAction.SELL
-    ).order_by(ProductRecord.created_at.desc()).all()
+    sell_records = sorted(query_history(lambda Record: db.query(Record).filter(
+        Record.operator_id == current_user.id,
+        Record.action == RecordAction.SELL
+    )), key=record_order, reverse=True)
 
     result = []
     for record in sell_records:
@@ -164,7 +140,7 @@ async def list_sold_products(
                 "name": product.name,
                 "category": product.category,
                 "origin": product.origin,
-                "quantity": listing_info.get("quantity", product.quantity),
+                "quantity": record.quantity if record.quantity is not None else product.quantity,
                 "unit": product.unit,
                 "shelf_location": shelf_location,  # 上架位置
                 "price": price,  # 价格
@@ -176,6 +152,7 @@ async def list_sold_products(
     return result
 
 
+@tracked_chain_write
 def background_stock_in(product_id: int, user_id: int, operator_name: str, chain_data_str: str, warehouse: str):
     """后台处理入库"""
     from app.database import SessionLocal
@@ -199,12 +176,14 @@ def background_stock_in(product_id: int, user_id: int, operator_name: str, chain
                 tx_hash=tx_hash, block_number=block_number
             ))
             db.commit()
+            enqueue_if_selling(product)
     except Exception as e:
         print(f"❌ Background stock-in error: {e}")
         db.rollback()
     finally:
         db.close()
 
+@tracked_chain_write
 def background_sell_product(product_id: int, user_id: int, operator_name: str, chain_data_str: str, remark: str):
     """后台处理销售/上架"""
     from app.database import SessionLocal
@@ -228,6 +207,7 @@ def background_sell_product(product_id: int, user_id: int, operator_name: str, c
                 tx_hash=tx_hash, block_number=block_number
             ))
             db.commit()
+            enqueue_if_selling(product)
     except Exception as e:
         print(f"❌ Background sell error: {e}")
         db.rollback()
@@ -235,7 +215,7 @@ def background_sell_product(product_id: int, user_id: int, operator_name: str, c
         db.close()
 
 @router.post("/products/{product_id}/stock-in")
-async def stock_in_product(
+def stock_in_product(
     product_id: int,
     stock_data: StockInRequest,
     background_tasks: BackgroundTasks,
@@ -255,8 +235,8 @@ async def stock_in_product(
         "timestamp": datetime.now().isoformat()
     }, ensure_ascii=False)
 
-    background_tasks.add_task(
-        background_stock_in,
+    enqueue_chain_write(
+        db, background_tasks, background_stock_in,
         product.id, current_user.id, current_user.real_name or current_user.username,
         chain_data_str, stock_data.warehouse
     )
@@ -265,7 +245,7 @@ async def stock_in_product(
     return {"message": "入库请求已提交"}
 
 @router.post("/products/{product_id}/sell")
-async def sell_product(
+def sell_product(
     product_id: int,
     sell_data: SellRequest,
     background_tasks: BackgroundTasks,
@@ -285,8 +265,8 @@ async def sell_product(
         "timestamp": datetime.now().isoformat()
     }, ensure_ascii=False)
 
-    background_tasks.add_task(
-        background_sell_product,
+    enqueue_chain_write(
+        db, background_tasks, background_sell_product,
         product.id, current_user.id, current_user.real_name or current_user.username,
         chain_data_str, f"上架: {sell_data.buyer_name}, 价格: {sell_data.buyer_phone}"
     )
@@ -295,10 +275,98 @@ async def sell_product(
     return {"message": "上架请求已提交"}
 
 
+# ==================== 批量操作 ====================
+
+def _held_product_error(product: Product, user: User) -> Optional[str]:
+    """销售商持有的产品能否入库/上架"""
+    if product.current_stage != ProductStage.SELLER or product.current_holder_id != user.id:
+        return "产品不存在或无权操作"
+    if product.status == ProductStatus.PENDING_CHAIN:
+        return "产品正在上链处理中"
+    return None
+
+
+@router.post("/bulk/stock-in")
+def bulk_stock_in_products(
+    request: BulkStockInRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量入库：一次校验，同一事务置为待上链，链上写入由后台批量执行"""
+    check_seller_role(current_user)
+    products, results = load_bulk_products(db, request.items)
+
+    operator_name = current_user.real_name or current_user.username
+    accepted, tasks = [], []
+    for item in request.items:
+        product = products.pop(item.product_id, None)
+        if product is None:
+            continue
+        error = _held_product_error(product, current_user)
+        if error:
+            results.append(rejected_item(product.id, error))
+            continue
+
+        chain_data_str = json.dumps({
+            "trace_code": product.trace_code, "action": "stock_in",
+            "warehouse": item.warehouse, "quantity": item.quantity or product.quantity,
+            "seller": operator_name,
+            "timestamp": datetime.now().isoformat()
+        }, ensure_ascii=False)
+        accepted.append(product)
+        tasks.append((product.id, background_stock_in, (
+            product.id, current_user.id, operator_name, chain_data_str, item.warehouse
+        )))
+        results.append(accepted_item(product.id))
+
+    job = submit_bulk_transition(db, "bulk_stock_in", current_user.id, accepted, tasks, background_tasks)
+    return bulk_response(job, results)
+
+
+@router.post("/bulk/sell")
+def bulk_sell_products(
+    request: BulkSellRequest,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """批量上架"""
+    check_seller_role(current_user)
+    products, results = load_bulk_products(db, request.items)
+
+    operator_name = current_user.real_name or current_user.username
+    accepted, tasks = [], []
+    for item in request.items:
+        product = products.pop(item.product_id, None)
+        if product is None:
+            continue
+        error = _held_product_error(product, current_user)
+        if error:
+            results.append(rejected_item(product.id, error))
+            continue
+
+        chain_data_str = json.dumps({
+            "trace_code": product.trace_code, "action": "shelf_listing",
+            "quantity": item.quantity, "price": item.buyer_phone,
+            "shelf_location": item.buyer_name, "seller": operator_name,
+            "timestamp": datetime.now().isoformat()
+        }, ensure_ascii=False)
+        accepted.append(product)
+        tasks.append((product.id, background_sell_product, (
+            product.id, current_user.id, operator_name, chain_data_str,
+            f"上架: {item.buyer_name}, 价格: {item.buyer_phone}"
+        )))
+        results.append(accepted_item(product.id))
+
+    job = submit_bulk_transition(db, "bulk_sell", current_user.id, accepted, tasks, background_tasks)
+    return bulk_response(job, results)
+
+
 @router.get("/products/{product_id}/records")
-async def get_product_records(
+def get_product_records(
     product_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -312,9 +380,7 @@ async def get_product_records(
         raise HTTPException(status_code=404, detail="产品不存在")
 
     # 获取所有记录
-    records = db.query(ProductRecord).filter(
-        ProductRecord.product_id == product_id
-    ).order_by(ProductRecord.created_at.asc()).all()
+    records = product_history(db, product_id)
 
     # 手动序列化
     result = []
@@ -335,8 +401,8 @@ async def get_product_records(
 
 
 @router.get("/statistics")
-async def get_statistics(
-    db: Session = Depends(get_db),
+def get_statistics(
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -344,39 +410,11 @@ async def get_statistics(
     """
     check_seller_role(current_user)
 
-    # 库存产品数量 (排除已上架/销售的产品)
-    subquery = db.query(ProductRecord.product_id).filter(
-        ProductRecord.action == RecordAction.SELL
-    ).subquery()
-
-    inventory_count = db.query(Product).filter(
-        Product.current_stage == ProductStage.SELLER,
-        Product.current_holder_id == current_user.id,
-        ~Product.id.in_(subquery)
-    ).count()
-
-    # 已售出产品数量（销售记录数）
-    sold_count = db.query(ProductRecord).filter(
-        ProductRecord.operator_id == current_user.id,
-        ProductRecord.action == RecordAction.SELL
-    ).count()
-
-    # 计算销售额
-    total_sales_quantity = 0
-    sell_records = db.query(ProductRecord).filter(
-        ProductRecord.operator_id == current_user.id,
-        ProductRecord.action == RecordAction.SELL
-    ).all()
-
-    for record in sell_records:
-        try:
-            data = json.loads(record.data) if isinstance(record.data, str) else record.data
-            total_sales_quantity += data.get("quantity", 0)
-        except:
-            pass
+    # 库存数量(排除已上架/销售的产品)、销售记录数、销售总量
+    stats = get_user_statistics(db, current_user.id)
 
     return {
-        "inventory_count": inventory_count,
-        "sold_count": sold_count,
-        "total_sales_quantity": round(total_sales_quantity, 2)
+        "inventory_count": stats.inventory_count,
+        "sold_count": stats.sold_count,
+        "total_sales_quantity": round(stats.sold_quantity or 0, 2)
     }
@@ -2,18 +2,34 @@
 FISCO BCOS 区块链客户端
 混合模式：使用 RPC 进行快速查询，使用 Console 进行合约写入操作
 """
+import asyncio
 import json
 import subprocess
 import os
 import time
+from contextvars import ContextVar
 from typing import Optional, Dict, Any, Tuple, List
+import httpx
 import requests
 from eth_abi import encode, decode
 from eth_utils import function_signature_to_4byte_selector
 
 from app.blockchain.config import (
-    RPC_URL, GROUP_ID, CONTRACT_ADDRESS, CONSOLE_PATH
+    RPC_URL, RPC_BACKUP_URLS, GROUP_ID, CONTRACT_ADDRESS, CONSOLE_PATH,
+    RPC_ASYNC_CONCURRENCY, RPC_ASYNC_TIMEOUT_SECONDS
 )
+from app.blockchain.rpc_pool import RpcNodePool
+from app.services.metrics import metrics
+
+PRODUCT_OUTPUT_TYPES = ["string", "string", "string", "uint256", "string", "uint8", "uint8", "address", "address", "uint256", "uint256"]
+RECORD_OUTPUT_TYPES = ["uint256", "uint8", "uint8", "string", "string", "address", "string", "uint256", "uint256", "string"]
+
+# 链上写入观察者（由上链对账服务设置）：
+# adopt_next() 返回非空结果时直接采用（写入已落链，无需重复提交），submitted(tx_hash) 记录已提交的交易
+write_observer: ContextVar = ContextVar("chain_write_observer", default=None)
+
+# 批量提交（chain_batch）中设置为列表：写入一律不等待回执，提交的交易哈希追加到列表，由批量统一确认
+deferred_receipts: ContextVar = ContextVar("chain_deferred_receipts", default=None)
 
 
 class FiscoBcosClient:
@@ -21,10 +37,15 @@ class FiscoBcosClient:
 
     def __init__(self):
         self.rpc_url = RPC_URL
+        # 主节点 + 备用节点（熔断 / 对冲）
+        self.rpc_pool = RpcNodePool([RPC_URL] + RPC_BACKUP_URLS)
         self.group_id = GROUP_ID
         self.contract_address = CONTRACT_ADDRESS
         self.console_path = CONSOLE_PATH
         self.session = requests.Session()
+        # 异步 RPC 客户端（绑定创建时的事件循环）
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._async_http_loop = None
         # 记录是否已经清理过 PEM
         self._pem_cleaned = False
 
@@ -52,23 +73,61 @@ class FiscoBcosClient:
             pass
 
     def _rpc_call(self, method: str, params: list) -> Dict[str, Any]:
-        """执行 RPC 调用"""
+        """执行 RPC 调用（跳过已熔断的节点，失败时依次改用备用节点）"""
         payload = {
             "jsonrpc": "2.0",
             "method": method,
             "params": params,
             "id": 1
         }
-        try:
-            response = self.session.post(
-                self.rpc_url,
-                json=payload,
-                headers={"Content-Type": "application/json"},
-                timeout=30
+
+        def send(url: str) -> Dict[str, Any]:
+            try:
+                response = self.session.post(
+                    url,
+                    json=payload,
+                    headers={"Content-Type": "application/json"},
+                    timeout=30
+                )
+                return response.json()
+            except Exception as e:
+                return {"error": str(e)}
+
+        return self.rpc_pool.call(send)
+
+    def _get_async_http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_http is None or self._async_http_loop is not loop:
+            self._async_http = httpx.AsyncClient(
+                timeout=RPC_ASYNC_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=RPC_ASYNC_CONCURRENCY * 4, max_keepalive_connections=RPC_ASYNC_CONCURRENCY)
             )
-            return response.json()
-        except Exception as e:
-            return {"error": str(e)}
+            self._async_http_loop = loop
+        return self._async_http
+
+    async def aclose(self):
+        """关闭异步 RPC 客户端（应用退出时调用）"""
+        if self._async_http is not None:
+            await self._async_http.aclose()
+            self._async_http = None
+
+    async def _rpc_call_async(self, method: str, params: list) -> Dict[str, Any]:
+        """执行 RPC 调用（异步；跳过已熔断的节点，主节点慢于其 p95 时对冲到备用节点）"""
+        payload = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params,
+            "id": 1
+        }
+
+        async def send(url: str) -> Dict[str, Any]:
+            try:
+                response = await self._get_async_http().post(url, json=payload)
+                return response.json()
+            except Exception as e:
+                return {"error": str(e)}
+
+        return await self.rpc_pool.call_async(send)
 
     def get_block_number(self) -> int:
         """获取当前区块高度 (使用 Console)"""
@@ -241,10 +300,39 @@ class FiscoBcosClient:
             time.sleep(1)
         return self.get_block_number()
 
+    def wait_for_transactions_rpc(self, tx_hashes: List[str], timeout: int = 10) -> Dict[str, Optional[int]]:
+        """批量轮询多笔交易回执，返回 tx_hash -> 区块高度（超时未确认的为当前块高）"""
+        pending = set(h for h in tx_hashes if h)
+        confirmed: Dict[str, Optional[int]] = {}
+        start = time.time()
+        while pending and time.time() - start < timeout:
+            for tx_hash in list(pending):
+                receipt = self.get_transaction_receipt(tx_hash)
+                if receipt and receipt.get("status") in (0, "0x0", "0"):
+                    bn = receipt.get("blockNumber")
+                    confirmed[tx_hash] = int(bn, 16) if isinstance(bn, str) and bn.startswith("0x") else int(bn)
+                    pending.discard(tx_hash)
+            if pending:
+                time.sleep(1)
+        if pending:
+            current = self.get_block_number()
+            confirmed.update({tx_hash: current for tx_hash in pending})
+        return confirmed
+
     # ==================== 合约写入方法 (使用 Console) ====================
 
-    def _execute_write(self, command: str) -> Tuple[bool, Optional[str], Optional[int]]:
-        """通用写入执行逻辑"""
+    def _execute_write(self, command: str, wait: bool = True) -> Tuple[bool, Optional[str], Optional[int]]:
+        """
+        通用写入执行逻辑
+
+        wait=False 时不等待回执（区块高度返回 None），由调用方批量确认
+        """
+        observer = write_observer.get()
+        if observer is not None:
+            adopted = observer.adopt_next()
+            if adopted is not None:
+                return adopted
+
         success, stdout, stderr = self._run_console_command(command)
         if not success:
             print(f"Console error: {stderr}")
@@ -253,6 +341,13 @@ class FiscoBcosClient:
         parsed = self._parse_console_output(stdout)
         if parsed["success"] and parsed["tx_hash"]:
             tx_hash = parsed["tx_hash"]
+            if observer is not None:
+                observer.submitted(tx_hash)
+            deferred = deferred_receipts.get()
+            if deferred is not None:
+                deferred.append(tx_hash)
+            if not wait or deferred is not None:
+                return True, tx_hash, None
             # 这里的优化：缩短等待时间，甚至不等待
             # 我们等待最多 3 秒，如果没出来也返回，让前端轮询
             block_number = self._wait_for_transaction_rpc(tx_hash, timeout=3)
@@ -260,10 +355,10 @@ class FiscoBcosClient:
         
         return False, None, None
 
-    def create_product(self, trace_code: str, name: str, category: str, origin: str, quantity: int, unit: str, data: str, operator_name: str) -> Tuple[bool, Optional[str], Optional[int]]:
+    def create_product(self, trace_code: str, name: str, category: str, origin: str, quantity: int, unit: str, data: str, operator_name: str, wait: bool = True) -> Tuple[bool, Optional[str], Optional[int]]:
         escaped_data = data.replace('"', '\\"')
         command = f'call AgriTrace {self.contract_address} createProduct "{trace_code}" "{name}" "{category}" "{origin}" {quantity} "{unit}" "{escaped_data}" "{operator_name}"'
-        return self._execute_write(command)
+        return self._execute_write(command, wait=wait)
 
     def add_amend_record(self, trace_code: str, stage: int, data: str, remark: str, operator_name: str, previous_record_id: int, amend_reason: str) -> Tuple[bool, Optional[str], Optional[int]]:
         escaped_data = data.replace('"', '\\"')
@@ -288,27 +383,38 @@ class FiscoBcosClient:
 
     # ==================== 合约查询方法 (使用 RPC, 极快) ====================
 
+    def _contract_call_params(self, function_signature: str, input_types: List[str], input_values: List[Any]) -> list:
+        selector = function_signature_to_4byte_selector(function_signature)
+        encoded_params = encode(input_types, input_values) if input_values else b''
+        data = "0x" + (selector + encoded_params).hex()
+        return [self.group_id, {"from": "0x0000000000000000000000000000000000000000", "to": self.contract_address, "data": data}]
+
+    @staticmethod
+    def _decode_call_result(result: Dict[str, Any], output_types: List[str]) -> Optional[List[Any]]:
+        if "result" in result and "output" in result["result"]:
+            output_hex = result["result"]["output"]
+            if output_hex and output_hex != "0x":
+                return list(decode(output_types, bytes.fromhex(output_hex[2:])))
+        return None
+
     def _call_contract_rpc(self, function_signature: str, input_types: List[str], input_values: List[Any], output_types: List[str]) -> Optional[List[Any]]:
         try:
-            selector = function_signature_to_4byte_selector(function_signature)
-            encoded_params = encode(input_types, input_values) if input_values else b''
-            data = "0x" + (selector + encoded_params).hex()
-            params = [self.group_id, {"from": "0x0000000000000000000000000000000000000000", "to": self.contract_address, "data": data}]
-            result = self._rpc_call("call", params)
-            if "result" in result and "output" in result["result"]:
-                output_hex = result["result"]["output"]
-                if output_hex and output_hex != "0x":
-                    return list(decode(output_types, bytes.fromhex(output_hex[2:])))
+            params = self._contract_call_params(function_signature, input_types, input_values)
+            return self._decode_call_result(self._rpc_call("call", params), output_types)
+        except Exception as e:
+            print(f"RPC call error: {e}")
             return None
+
+    async def _call_contract_rpc_async(self, function_signature: str, input_types: List[str], input_values: List[Any], output_types: List[str]) -> Optional[List[Any]]:
+        try:
+            params = self._contract_call_params(function_signature, input_types, input_values)
+            return self._decode_call_result(await self._rpc_call_async("call", params), output_types)
         except Exception as e:
             print(f"RPC call error: {e}")
             return None
 
-    def get_product_rpc(self, trace_code: str) -> Optional[Dict]:
-        result = self._call_contract_rpc(
-            "getProduct(string)", ["string"], [trace_code],
-            ["string", "string", "string", "uint256", "string", "uint8", "uint8", "address", "address", "uint256", "uint256"]
-        )
+    @staticmethod
+    def _product_from_result(result: Optional[List[Any]]) -> Optional[Dict]:
         if result and len(result) == 11:
             return {
                 "name": result[0], "category": result[1], "origin": result[2], "quantity": result[3],
@@ -317,6 +423,22 @@ class FiscoBcosClient:
             }
         return None
 
+    @staticmethod
+    def _record_from_result(index: int, res: List[Any]) -> Dict:
+        return {
+            "index": index, "recordId": res[0], "stage": res[1], "action": res[2], "data": res[3],
+            "remark": res[4], "operator": res[5], "operatorName": res[6], "timestamp": res[7],
+            "previousRecordId": res[8], "amendReason": res[9]
+        }
+
+    def get_product_rpc(self, trace_code: str) -> Optional[Dict]:
+        result = self._call_contract_rpc("getProduct(string)", ["string"], [trace_code], PRODUCT_OUTPUT_TYPES)
+        return self._product_from_result(result)
+
+    async def get_product_rpc_async(self, trace_code: str) -> Optional[Dict]:
+        result = await self._call_contract_rpc_async("getProduct(string)", ["string"], [trace_code], PRODUCT_OUTPUT_TYPES)
+        return self._product_from_result(result)
+
     def get_product(self, trace_code: str) -> Optional[Dict]:
         return self.get_product_rpc(trace_code)
 
@@ -324,6 +446,21 @@ class FiscoBcosClient:
         result = self._call_contract_rpc("verifyTraceCode(string)", ["string"], [trace_code], ["bool"])
         return result[0] if result else False
 
+    async def verify_trace_code_async(self, trace_code: str) -> Optional[bool]:
+        """溯源码是否已上链；查询失败返回 None"""
+        result = await self._call_contract_rpc_async("verifyTraceCode(string)", ["string"], [trace_code], ["bool"])
+        return result[0] if result else None
+
+    def get_record_count_rpc(self, trace_code: str) -> Optional[int]:
+        """链上记录数：产品未上链返回 0，查询失败返回 None"""
+        exists = self._call_contract_rpc("verifyTraceCode(string)", ["string"], [trace_code], ["bool"])
+        if exists is None:
+            return None
+        if not exists[0]:
+            return 0
+        result = self._call_contract_rpc("getRecordCount(string)", ["string"], [trace_code], ["uint256"])
+        return int(result[0]) if result else None
+
     def get_product_count(self) -> int:
         """获取链上产品总数 (使用 Console)"""
         import re
@@ -351,16 +488,27 @@ class FiscoBcosClient:
         records = []
         for i in range(count_res[0]):
             res = self._call_contract_rpc(
-                "getRecord(string,uint256)", ["string", "uint256"], [trace_code, i],
-                ["uint256", "uint8", "uint8", "string", "string", "address", "string", "uint256", "uint256", "string"]
+                "getRecord(string,uint256)", ["string", "uint256"], [trace_code, i], RECORD_OUTPUT_TYPES
             )
             if res:
-                records.append({
-                    "index": i, "recordId": res[0], "stage": res[1], "action": res[2], "data": res[3],
-                    "remark": res[4], "operator": res[5], "operatorName": res[6], "timestamp": res[7],
-                    "previousRecordId": res[8], "amendReason": res[9]
-                })
+                records.append(self._record_from_result(i, res))
         return records
 
+    async def get_product_records_rpc_async(self, trace_code: str) -> Optional[List[Dict]]:
+        """异步读取全部记录：先取记录数，再并发（有上限）读取各条记录"""
+        count_res = await self._call_contract_rpc_async("getRecordCount(string)", ["string"], [trace_code], ["uint256"])
+        if not count_res or count_res[0] == 0: return []
+        semaphore = asyncio.Semaphore(RPC_ASYNC_CONCURRENCY)
+
+        async def fetch(i: int):
+            async with semaphore:
+                return await self._call_contract_rpc_async(
+                    "getRecord(string,uint256)", ["string", "uint256"], [trace_code, i], RECORD_OUTPUT_TYPES
+                )
+
+        results = await asyncio.gather(*(fetch(i) for i in range(count_res[0])))
+        return [self._record_from_result(i, res) for i, res in enumerate(results) if res]
+
 # 单例实例
 blockchain_client = FiscoBcosClient()
+metrics.register_collector("chain_rpc_nodes", blockchain_client.rpc_pool.stats)
@@ -1,9 +1,24 @@
 """
 FISCO BCOS 区块链配置
 """
+import os
 
-# RPC 节点地址
-RPC_URL = "http://127.0.0.1:20200"
+# RPC 节点地址（主节点）
+RPC_URL = os.getenv("FISCO_RPC_URL", "http://127.0.0.1:20200")
+
+# 备用 RPC 节点（同群组其他节点，逗号分隔）：主节点熔断时改用，慢查询时对冲
+RPC_BACKUP_URLS = [url.strip() for url in os.getenv("FISCO_RPC_BACKUP_URLS", "").split(",") if url.strip()]
+
+# 异步 RPC 单次查询的最大并发请求数（如并发读取一个产品的各条记录）
+RPC_ASYNC_CONCURRENCY = 8
+RPC_ASYNC_TIMEOUT_SECONDS = 5  # 异步查询单次请求超时(秒)，调用方另有时延预算
+
+# 节点熔断与对冲
+RPC_BREAKER_FAILURES = 5  # 连续失败次数达到后熔断
+RPC_BREAKER_COOLDOWN_SECONDS = 30  # 熔断冷却时间(秒)，之后放行一次探测
+RPC_SLOW_CALL_SECONDS = 3  # 被取消时已耗时超过此值的调用计为失败(秒)
+RPC_HEDGE_DEFAULT_DELAY_MS = 300  # 时延样本不足时的对冲延迟(毫秒)，样本充足后取节点 p95
+RPC_HEDGE_MIN_DELAY_MS = 50  # 对冲延迟下限(毫秒)
 
 # 群组 ID
 GROUP_ID = "group0"
@@ -0,0 +1,189 @@
+"""
+RPC 节点池
+- 熔断: 节点连续失败（或调用过慢）达到阈值后熔断，冷却期内不再调用；
+  冷却结束后放行一次探测调用，成功则恢复
+- 对冲: 异步查询在主节点超过其近期 p95 时延仍未返回时，向下一个可用节点发起同样的请求，
+  先返回者胜出
+"""
+import asyncio
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.blockchain.config import (
+    RPC_BREAKER_FAILURES, RPC_BREAKER_COOLDOWN_SECONDS, RPC_SLOW_CALL_SECONDS,
+    RPC_HEDGE_DEFAULT_DELAY_MS, RPC_HEDGE_MIN_DELAY_MS
+)
+from app.services.metrics import metrics
+
+LATENCY_WINDOW = 200  # 计算 p95 的最近样本数
+LATENCY_MIN_SAMPLES = 20  # 样本不足时使用默认对冲延迟
+
+
+class CircuitBreaker:
+    """熔断器: closed（正常）-> open（熔断）-> half_open（冷却结束，放行一次探测）"""
+
+    def __init__(self, name: str, failure_threshold: int, cooldown: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    def allow(self) -> bool:
+        """是否允许发起调用（half_open 状态同一时刻只放行一个探测）"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._probing = "closed", 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    metrics.inc("chain_rpc_circuit_open_total", node=self.name)
+                self.state, self.opened_at = "open", time.monotonic()
+
+    def release(self):
+        """调用被取消且未判定成败时归还探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class RpcNode:
+    """单个 RPC 节点：熔断器 + 近期时延"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.breaker = CircuitBreaker(url, RPC_BREAKER_FAILURES, RPC_BREAKER_COOLDOWN_SECONDS)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    def observe(self, seconds: float):
+        self._latencies.append(seconds)
+
+    def hedge_delay(self) -> float:
+        """对冲延迟: 近期成功调用的 p95 时延（秒）"""
+        samples = sorted(self._latencies)
+        if len(samples) < LATENCY_MIN_SAMPLES:
+            return RPC_HEDGE_DEFAULT_DELAY_MS / 1000
+        p95 = samples[int(len(samples) * 0.95) - 1]
+        return max(p95, RPC_HEDGE_MIN_DELAY_MS / 1000)
+
+    def stats(self) -> dict:
+        samples = sorted(self._latencies)
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 1) if samples else None,
+            "hedge_delay_ms": round(self.hedge_delay() * 1000, 1),
+        }
+
+
+class RpcNodePool:
+    """RPC 节点池（第一个为主节点，其余为同群组的备用节点）"""
+
+    def __init__(self, urls: List[str]):
+        self.nodes = [RpcNode(url) for url in urls]
+
+    def stats(self) -> Dict[str, dict]:
+        return {node.url: node.stats() for node in self.nodes}
+
+    def call(self, send: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """同步调用：按顺序尝试未熔断的节点，首个成功的结果返回"""
+        result = {"error": "所有 RPC 节点均已熔断"}
+        for node in self.nodes:
+            if not node.breaker.allow():
+                continue
+            started = time.monotonic()
+            result = send(node.url)
+            self._settle(node, result, time.monotonic() - started)
+            if "error" not in result:
+                return result
+        return result
+
+    async def call_async(self, send: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        异步对冲调用：主节点超过其 p95 时延未返回时向下一个节点发起同样的请求，
+        某节点失败时立即改用下一个节点；返回最先成功的结果
+        """
+        candidates = iter(self.nodes)
+        running: Dict[asyncio.Task, RpcNode] = {}
+        result = {"error": "所有 RPC 节点均已熔断"}
+
+        def launch() -> Optional[RpcNode]:
+            for node in candidates:
+                if node.breaker.allow():
+                    running[asyncio.ensure_future(self._send_async(node, send))] = node
+                    return node
+            return None
+
+        if launch() is None:
+            return result
+        try:
+            while running:
+                # 只有一个请求在途时，等到其节点的 p95 再对冲
+                timeout = next(iter(running.values())).hedge_delay() if len(running) == 1 else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if launch() is not None:
+                        metrics.inc("chain_rpc_hedged_total")
+                    else:
+                        # 没有可对冲的节点：继续等待在途请求
+                        done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    node = running.pop(task)
+                    result = task.result()
+                    if "error" not in result:
+                        if node is not self.nodes[0]:
+                            metrics.inc("chain_rpc_hedge_wins_total", node=node.url)
+                        return result
+                    if not running:
+                        launch()
+            return result
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def _send_async(self, node: RpcNode, send: Callable[[str], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            result = await send(node.url)
+        except asyncio.CancelledError:
+            # 对冲落败或超出调用方预算被取消：足够慢时计为失败
+            elapsed = time.monotonic() - started
+            if elapsed >= RPC_SLOW_CALL_SECONDS:
+                node.breaker.record_failure()
+                metrics.inc("chain_rpc_requests_total", node=node.url, outcome="slow")
+            else:
+                node.breaker.release()
+            raise
+        self._settle(node, result, time.monotonic() - started)
+        return result
+
+    @staticmethod
+    def _settle(node: RpcNode, result: Dict[str, Any], elapsed: float):
+        if "error" in result and not isinstance(result["error"], dict):
+            # 传输层失败（连接/超时）；节点返回的 JSON-RPC 错误对象视为节点可用
+            node.breaker.record_failure()
+            metrics.inc("chain_rpc_requests_total", node=node.url, outcome="error")
+        else:
+            node.breaker.record_success()
+            node.observe(elapsed)
+            metrics.inc("chain_rpc_requests_total", node=node.url, outcome="ok")
@@ -21,12 +21,88 @@ class Settings:
     DB_NAME: str = "agri_trace"
     USE_SQLITE: bool = False  # 使用 MySQL
 
+    # 用户目录缓存容量（id -> 名称/角色/地址）
+    USER_DIRECTORY_CACHE_SIZE: int = 1024
+    USER_DIRECTORY_TTL_SECONDS: int = 60  # 用户缓存过期时间(秒)，其他实例的用户修改最多延迟这么久生效
+
+    # 连接池
+    DB_POOL_SIZE: int = 10  # 常驻连接数
+    DB_MAX_OVERFLOW: int = 20  # 峰值时允许额外创建的连接数
+    DB_POOL_RECYCLE: int = 1800  # 连接回收时间(秒)，需小于 MySQL wait_timeout
+    DB_POOL_TIMEOUT: int = 30  # 获取连接的等待超时(秒)
+
+    # SQL 日志与性能分析
+    SQL_ECHO: bool = False  # 打印全部 SQL（仅排查问题时开启）
+    SLOW_QUERY_MS: int = 200  # 慢查询阈值(毫秒)
+    N_PLUS_ONE_THRESHOLD: int = 10  # 单个请求内同一语句指纹重复执行达到此次数视为 N+1
+    SQL_PROFILE_HEADERS: bool = False  # 所有响应都返回 X-DB-Query-Count / X-DB-Time-Ms（默认仅内部请求）
+
+    # 运行指标接口（/api/metrics）访问控制：携带令牌，或未经代理转发的本机请求
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")  # Authorization: Bearer <令牌> 或 X-Metrics-Token
+    METRICS_ALLOWED_HOSTS: str = os.getenv("METRICS_ALLOWED_HOSTS", "127.0.0.1,::1")  # 无需令牌的来源地址
+
+    # 只读副本（逗号分隔的 SQLAlchemy URL，为空则全部走主库）
+    DB_REPLICA_URLS: str = os.getenv("DB_REPLICA_URLS", "")
+    REPLICA_PIN_SECONDS: int = 30  # 写请求后该用户读请求固定走主库的最长时间(秒)
+
+    # 公开溯源接口响应缓存（进程内 LRU，可选 Redis 共享）
+    TRACE_CACHE_SIZE: int = 2048  # 进程内缓存的溯源码数
+    TRACE_CACHE_TTL_SECONDS: int = 300  # 兜底过期时间(秒)，正常由写入精确失效
+    TRACE_CACHE_REDIS_URL: str = os.getenv("TRACE_CACHE_REDIS_URL", "")  # 如 redis://127.0.0.1:6379/0
+    TRACE_CHAIN_BUDGET_MS: int = 1500  # 未命中时链上读取的时延预算(毫秒)，超出则以数据库数据应答
+    TRACE_VERIFY_BUDGET_MS: int = 800  # 扫码验证接口的链上时延预算(毫秒)
+
+    # 溯源码存在性过滤器（Bloom，公开查询接口不访问链与数据库直接拒绝未签发的溯源码）
+    TRACE_CODE_FILTER_ENABLED: bool = True
+    TRACE_CODE_FILTER_CAPACITY: int = 1_000_000  # 预期溯源码数，实际超出后按两倍容量重建
+    TRACE_CODE_FILTER_FP_RATE: float = 0.001  # 目标误判率（未签发的溯源码被判为可能存在的概率）
+    TRACE_CODE_FILTER_REFRESH_SECONDS: int = 30  # 从数据库同步其他实例签发溯源码的间隔(秒)
+    TRACE_CODE_FILTER_SYNC_OVERLAP_SECONDS: int = 120  # 增量同步回看窗口(秒)，覆盖签发时间早于提交时间的事务
+
+    # 静态溯源包导出（销售阶段/已售出产品，交由静态服务器或 CDN 分发）
+    TRACE_BUNDLE_DIR: str = os.getenv("TRACE_BUNDLE_DIR", "./trace_bundles")  # 导出目录（即站点根目录）
+    TRACE_BUNDLE_KEY_PATH: str = os.getenv(
+        "TRACE_BUNDLE_KEY_PATH", os.path.expanduser("~/.agri_trace/trace_bundle_key.pem")
+    )  # 签名私钥（放在代码仓库与导出目录之外）
+    TRACE_BUNDLE_STATE_PATH: str = os.getenv("TRACE_BUNDLE_STATE_PATH", "./trace_bundle_state.json")  # 增量导出状态
+    TRACE_BUNDLE_PRUNE_GRACE_SECONDS: int = 86400  # 不再被引用的内容包保留时长(秒)，需大于清单的 CDN 缓存时间
+    TRACE_BUNDLE_EXPORT_ENABLED: bool = True  # 后台定期增量导出（签名私钥存在时）
+    TRACE_BUNDLE_EXPORT_INTERVAL_SECONDS: int = 60  # 增量导出间隔(秒)
+
+    # 流转记录归档（已售出/已作废超过保留期的产品记录迁入归档表）
+    ARCHIVE_ENABLED: bool = True
+    ARCHIVE_AFTER_DAYS: int = 90  # 保留期(天)
+    ARCHIVE_INTERVAL_SECONDS: int = 6 * 3600  # 后台归档间隔(秒)
+    ARCHIVE_BATCH_SIZE: int = 200  # 每批归档的产品数
+
     @property
     def DATABASE_URL(self) -> str:
         if self.USE_SQLITE:
             return "sqlite:///./agri_trace.db"
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def ASYNC_DATABASE_URL(self) -> str:
+        if self.USE_SQLITE:
+            return "sqlite+aiosqlite:///./agri_trace.db"
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
+    @property
+    def REPLICA_URLS(self) -> list:
+        return [url.strip() for url in self.DB_REPLICA_URLS.split(",") if url.strip()]
+
+    @property
+    def ASYNC_REPLICA_URLS(self) -> list:
+        drivers = {"mysql+pymysql://": "mysql+aiomysql://", "sqlite://": "sqlite+aiosqlite://"}
+        urls = []
+        for url in self.REPLICA_URLS:
+            for sync_prefix, async_prefix in drivers.items():
+                if url.startswith(sync_prefix):
+                    url = async_prefix + url[len(sync_prefix):]
+                    break
+            urls.append(url)
+        return urls
+
     # JWT
     SECRET_KEY: str = "your-secret-key-change-in-production-agri-trace-2024"
     ALGORITHM: str = "HS256"
@@ -36,11 +112,39 @@ class Settings:
     FISCO_NODE_HOST: str = "127.0.0.1"
     FISCO_NODE_PORT: int = 20200
     FISCO_GROUP_ID: int = 1
+    CHAIN_BATCH_SIZE: int = 20  # 批量上链时每批交易数
+    CHAIN_BATCH_CONCURRENCY: int = 4  # 批量上链时并发的 Console 调用数
+
+    # 上链对账（补偿 CHAIN_FAILED / 长时间 PENDING_CHAIN 的产品）
+    CHAIN_RECONCILE_ENABLED: bool = True
+    CHAIN_RECONCILE_INTERVAL_SECONDS: int = 60  # 对账间隔(秒)
+    CHAIN_RECONCILE_BATCH_SIZE: int = 50  # 每轮处理的操作数
+    CHAIN_STALE_SECONDS: int = 600  # 执行中超过此时长视为中断(秒)
+    CHAIN_RETRY_BASE_SECONDS: int = 30  # 重试退避基数(秒)，按次数指数增长
+    CHAIN_RETRY_MAX_BACKOFF_SECONDS: int = 3600  # 单次退避上限(秒)
+    CHAIN_RETRY_MAX_ATTEMPTS: int = 8  # 最大执行次数，超过后放弃并告警
+
+    # 批量导入 / 批量流转
+    BULK_MAX_ITEMS: int = 200  # 批量流转单次请求的产品数上限
+    IMPORT_MAX_ROWS: int = 10000  # 单次导入行数上限
+    IMPORT_CHUNK_SIZE: int = 500  # 每次 INSERT 的行数
 
     # AI API
     AI_API_KEY: str = os.getenv("GLM_API_KEY", "")
     AI_MODEL: str = "zai-org/GLM-4.5-Air"
     AI_BASE_URL: str = "https://api.siliconflow.cn/v1"
+    AI_SUMMARY_CACHE_SIZE: int = 1024  # 进程内缓存的简报数（持久化在 ai_summaries 表）
+    AI_PROMPT_RECORD_TOKEN_BUDGET: int = 800  # 简报提示词中流转记录部分的近似 token 上限
+    AI_MAX_CONCURRENCY: int = 8  # 同时进行的上游请求数（连接池大小）
+    AI_QUEUE_TIMEOUT_SECONDS: float = 10  # 并发已满时的最长排队时间(秒)，超出返回 503
+    AI_TIMEOUT_SECONDS: float = 60  # 单次上游请求超时(秒)
+    AI_MAX_RETRIES: int = 2  # 429 / 5xx / 连接错误的最大重试次数
+    AI_RETRY_BASE_SECONDS: float = 0.5  # 重试退避基数(秒)，按次数指数增长并随机抖动
+
+    # AI 简报预生成（产品进入销售阶段 / 入库 / 上架后后台生成并缓存）
+    AI_PREGENERATE_ENABLED: bool = bool(os.getenv("GLM_API_KEY"))  # 未配置 AI 密钥时不启用
+    AI_PREGENERATE_PER_MINUTE: int = 20  # 每分钟最多生成的简报数
+    AI_PREGENERATE_DELAY_SECONDS: int = 10  # 变更后延迟生成(秒)，合并入库、上架等连续变更
 
 
 @lru_cache()
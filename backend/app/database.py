@@ -2,6 +2,7 @@
 Database Configuration
 """
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -9,15 +10,52 @@ from app.config import settings
 # 如果用SQLite 需要特殊配置
 connect_args = {"check_same_thread": False} if settings.USE_SQLITE else {}
 
+# MySQL 连接池参数（SQLite 使用默认连接池）
+pool_kwargs = {} if settings.USE_SQLITE else {
+    "pool_pre_ping": True,
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+}
+
 engine = create_engine(
     settings.DATABASE_URL,
     connect_args=connect_args,
-    pool_pre_ping=True if not settings.USE_SQLITE else False,
-    echo=settings.DEBUG
+    echo=settings.SQL_ECHO,
+    **pool_kwargs
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎: 供 async 路由使用，查询不阻塞事件循环
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    echo=settings.SQL_ECHO,
+    **pool_kwargs
+)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# 只读副本（未配置时为空列表，读请求回落到主库）
+replica_engines = [
+    create_engine(url, connect_args=connect_args, echo=settings.SQL_ECHO, **pool_kwargs)
+    for url in settings.REPLICA_URLS
+]
+ReplicaSessionLocals = [
+    sessionmaker(autocommit=False, autoflush=False, bind=replica)
+    for replica in replica_engines
+]
+
+async_replica_engines = [
+    create_async_engine(url, echo=settings.SQL_ECHO, **pool_kwargs)
+    for url in settings.ASYNC_REPLICA_URLS
+]
+AsyncReplicaSessionLocals = [
+    async_sessionmaker(replica, autoflush=False, expire_on_commit=False)
+    for replica in async_replica_engines
+]
+
 Base = declarative_base()
 
 
@@ -28,3 +66,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,4 +1,10 @@
 from app.models.user import User
 from app.models.product import Product, ProductRecord
+from app.models.statistics import UserStatistics
+from app.models.inventory import InventoryMovement
+from app.models.archive import ProductRecordArchive
+from app.models.chain_operation import ChainOperation
+from app.models.trace_snapshot import TraceSnapshot
+from app.models.ai_summary import AISummary
 
-__all__ = ["User", "Product", "ProductRecord"]
+__all__ = ["User", "Product", "ProductRecord", "UserStatistics", "InventoryMovement", "ProductRecordArchive", "ChainOperation", "TraceSnapshot", "AISummary"]
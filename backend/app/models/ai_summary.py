@@ -0,0 +1,20 @@
+"""
+AI Summary Model
+"""
+from sqlalchemy import Column, String, Text, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class AISummary(Base):
+    """
+    AI 溯源简报缓存表：每个溯源码保存最近一次生成的简报及其对应溯源数据的内容哈希
+    新增流转记录后内容哈希变化，旧简报不再命中，下次生成时覆盖。
+    """
+    __tablename__ = "ai_summaries"
+
+    trace_code = Column(String(50), primary_key=True)
+    content_hash = Column(String(64), nullable=False)  # 产品信息 + 流转记录的 SHA-256
+    summary = Column(Text, nullable=False)
+    model = Column(String(100))  # 生成所用模型
+    created_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,28 @@
+"""
+Product Record Archive Model
+"""
+from sqlalchemy import Column, Integer, DateTime, Index
+from sqlalchemy.sql import func
+from app.database import Base
+from app.models.product import ProductRecordFields
+
+
+class ProductRecordArchive(ProductRecordFields, Base):
+    """
+    流转记录归档表（冷数据）
+    已售出/已作废超过保留期的产品，其流转记录整体从 product_records 迁移至此，
+    保留原记录 ID；MySQL 下使用压缩行格式。
+    """
+    __tablename__ = "product_records_archive"
+    __table_args__ = (
+        Index("ix_product_records_archive_product", "product_id"),
+        Index("ix_product_records_archive_operator_action", "operator_id", "action"),
+        {"mysql_row_format": "COMPRESSED", "mysql_key_block_size": "8"},
+    )
+
+    # 归档表不保留外键约束
+    product_id = Column(Integer, nullable=False)
+    operator_id = Column(Integer)
+    previous_record_id = Column(Integer)
+
+    archived_at = Column(DateTime, server_default=func.now())  # 归档时间
@@ -0,0 +1,38 @@
+"""
+Chain Operation Model
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, ForeignKey, Index
+from sqlalchemy.sql import func
+from app.database import Base
+import enum
+
+
+class ChainOperationStatus(str, enum.Enum):
+    RUNNING = "running"        # 执行中
+    FAILED = "failed"          # 失败，等待重试
+    SUCCEEDED = "succeeded"    # 成功（含采纳链上已有结果）
+    SUPERSEDED = "superseded"  # 已被后续操作取代
+    ABANDONED = "abandoned"    # 超过最大重试次数，需人工处理
+
+
+class ChainOperation(Base):
+    """后台上链操作（意图记录），失败或中断后由对账任务补偿"""
+    __tablename__ = "chain_operations"
+    __table_args__ = (
+        Index("ix_chain_operations_status_retry", "status", "next_retry_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False, index=True)
+    kind = Column(String(64), nullable=False)  # 后台任务函数名
+    arguments = Column(Text)  # 任务参数 JSON（不含 product_id）
+    status = Column(Enum(ChainOperationStatus), nullable=False, default=ChainOperationStatus.RUNNING)
+
+    attempts = Column(Integer, nullable=False, default=0)  # 已执行次数
+    baseline_record_count = Column(Integer)  # 首次执行前链上记录数（用于判断写入是否已落链）
+    tx_hashes = Column(Text)  # 已提交交易哈希 JSON 列表（按写入顺序）
+    last_error = Column(String(500))
+    next_retry_at = Column(DateTime)
+
+    created_at = Column(DateTime, server_default=func.now())
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,36 @@
+"""
+Inventory Ledger Model
+"""
+from sqlalchemy import Column, Integer, String, DateTime, Enum, ForeignKey, Float, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import relationship
+from app.database import Base
+import enum
+
+
+class MovementType(str, enum.Enum):
+    STOCK_IN = "stock_in"      # 入库
+    SELL = "sell"              # 销售/上架
+
+
+class InventoryMovement(Base):
+    """库存流水（入库 / 销售），数量为数值列，用于 SQL 聚合库存"""
+    __tablename__ = "inventory_movements"
+    __table_args__ = (
+        Index("ix_inventory_movements_product_type", "product_id", "movement_type"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    seller_id = Column(Integer, ForeignKey("users.id"), index=True)  # 操作的销售商
+    movement_type = Column(Enum(MovementType), nullable=False)
+    quantity = Column(Float, nullable=False, default=0)  # 数量
+    warehouse = Column(String(100))  # 仓库（入库）
+
+    # 来源流转记录
+    record_id = Column(Integer, ForeignKey("product_records.id", ondelete="SET NULL"))
+
+    created_at = Column(DateTime, server_default=func.now())
+
+    # 关系
+    record = relationship("ProductRecord")
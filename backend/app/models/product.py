@@ -1,11 +1,13 @@
 """
 Product and Traceability Models
 """
-from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, DateTime, Text, Enum, ForeignKey, Float, Boolean, Index
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from app.database import Base
 import enum
+import json
+from typing import Tuple
 
 
 class ProductStatus(str, enum.Enum):
@@ -46,6 +48,7 @@ class Product(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     trace_code = Column(String(50), unique=True, index=True)  # 溯源码 (上链后生成)
+    trace_code_issued_at = Column(DateTime, index=True)  # 溯源码签发时间（溯源码过滤器按此增量同步）
     name = Column(String(200), nullable=False)  # 产品名称
     category = Column(String(100))  # 品类
     status = Column(Enum(ProductStatus), default=ProductStatus.DRAFT)
@@ -82,12 +85,78 @@ class Product(Base):
     records = relationship("ProductRecord", back_populates="product")
 
 
-class ProductRecord(Base):
-    """产品流转记录"""
-    __tablename__ = "product_records"
-
+def _text(length: int):
+    """字符串转换并截断到列长度"""
+    return lambda value: str(value)[:length]
+
+
+_TRUE_VALUES = {"true", "1", "yes", "合格"}
+_FALSE_VALUES = {"false", "0", "no", "不合格"}
+
+
+def _flag(value):
+    """布尔字段转换：只接受布尔、0/1 与 true/false/合格/不合格 等明确写法，其余为 None"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value) if value in (0, 1) else None
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    return None
+
+
+# data JSON 中需要提取为独立列的热点字段: 列名 -> 类型转换
+RECORD_DATA_FIELDS = {
+    "quantity": float,
+    "warehouse": _text(100),
+    "process_type": _text(50),
+    "result_product": _text(200),
+    "result_quantity": float,
+    "inspection_type": _text(50),
+    "qualified": _flag,
+    "quality_grade": _text(10),
+}
+
+
+def extract_record_fields(data) -> dict:
+    """从记录 data(JSON) 中提取热点字段，缺失或无法转换的字段为 None"""
+    try:
+        parsed = json.loads(data) if isinstance(data, str) else data
+    except (TypeError, ValueError):
+        parsed = None
+    if not isinstance(parsed, dict):
+        parsed = {}
+
+    fields = {}
+    for name, cast in RECORD_DATA_FIELDS.items():
+        value = parsed.get(name)
+        try:
+            fields[name] = cast(value) if value not in (None, "") else None
+        except (TypeError, ValueError):
+            fields[name] = None
+    return fields
+
+
+def build_chain_payload(product: Product) -> Tuple[str, int]:
+    """产品创建上链数据 (chain_data_str, quantity_int)"""
+    chain_data_str = json.dumps({
+        "name": product.name,
+        "category": product.category,
+        "origin": product.origin,
+        "batch_no": product.batch_no,
+        "quantity": product.quantity,
+        "unit": product.unit,
+        "harvest_date": str(product.harvest_date) if product.harvest_date else None
+    }, ensure_ascii=False)
+    return chain_data_str, int((product.quantity or 0) * 1000)
+
+
+class ProductRecordFields:
+    """流转记录公共字段（热表 product_records 与归档表共用；外键列由各表自行声明）"""
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     stage = Column(Enum(ProductStage), nullable=False)
     action = Column(Enum(RecordAction), nullable=False)
 
@@ -95,19 +164,46 @@ class ProductRecord(Base):
     data = Column(Text)  # JSON: 具体操作数据
     remark = Column(Text)  # 备注
 
+    # 从 data 中提取的热点字段（写入 data 时自动填充）
+    quantity = Column(Float)  # 数量（入库/销售）
+    warehouse = Column(String(100))  # 仓库
+    process_type = Column(String(50))  # 加工类型
+    result_product = Column(String(200))  # 加工产出
+    result_quantity = Column(Float)  # 加工产出数量
+    inspection_type = Column(String(50))  # 质检类型
+    qualified = Column(Boolean)  # 是否合格
+    quality_grade = Column(String(10))  # 质量等级
+
     # 操作人
-    operator_id = Column(Integer, ForeignKey("users.id"))
     operator_name = Column(String(100))
 
     # 区块链信息
     tx_hash = Column(String(100))
     block_number = Column(Integer)
 
-    # 修正记录关联
-    previous_record_id = Column(Integer, ForeignKey("product_records.id"))
     amend_reason = Column(Text)  # 修正原因
 
     created_at = Column(DateTime, server_default=func.now())
 
+
+class ProductRecord(ProductRecordFields, Base):
+    """产品流转记录"""
+    __tablename__ = "product_records"
+    __table_args__ = (
+        Index("ix_product_records_product_action", "product_id", "action"),
+        Index("ix_product_records_operator_action", "operator_id", "action"),
+    )
+
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    operator_id = Column(Integer, ForeignKey("users.id"))  # 操作人
+    previous_record_id = Column(Integer, ForeignKey("product_records.id"))  # 修正记录关联
+
     # 关系
     product = relationship("Product", back_populates="records")
+
+    @validates("data")
+    def _populate_data_fields(self, key, value):
+        """写入 data 时同步填充提取列"""
+        for name, field_value in extract_record_fields(value).items():
+            setattr(self, name, field_value)
+        return value
@@ -0,0 +1,31 @@
+"""
+User Statistics Model
+"""
+from sqlalchemy import Column, Integer, DateTime, Float, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class UserStatistics(Base):
+    """用户统计计数表（由写路径在同一事务内增量维护）"""
+    __tablename__ = "user_statistics"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+
+    # 原料商: 按创建者统计
+    product_total = Column(Integer, nullable=False, default=0)  # 创建的产品总数
+    product_draft = Column(Integer, nullable=False, default=0)  # 草稿数
+    product_on_chain = Column(Integer, nullable=False, default=0)  # 已上链数
+
+    # 按持有者 + 阶段统计
+    processing_count = Column(Integer, nullable=False, default=0)  # 加工阶段持有数
+    inspecting_count = Column(Integer, nullable=False, default=0)  # 质检阶段持有数
+    inventory_count = Column(Integer, nullable=False, default=0)  # 销售阶段未上架持有数
+
+    # 按操作人 + 记录统计
+    inspected_count = Column(Integer, nullable=False, default=0)  # 完成检测数
+    qualified_count = Column(Integer, nullable=False, default=0)  # 检测合格数
+    sold_count = Column(Integer, nullable=False, default=0)  # 上架/销售记录数
+    sold_quantity = Column(Float, nullable=False, default=0)  # 上架/销售总量
+
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
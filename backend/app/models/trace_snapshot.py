@@ -0,0 +1,28 @@
+"""
+Trace Snapshot Model
+"""
+from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy.dialects.mysql import MEDIUMTEXT
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class TraceSnapshot(Base):
+    """
+    溯源快照表：按溯源码保存渲染好的公开溯源响应 JSON
+    产品或流转记录变更时 version 自增，后台重建后 built_version 追上 version；
+    两者相等时快照有效，公开溯源接口直接按主键读取返回。
+    """
+    __tablename__ = "trace_snapshots"
+
+    trace_code = Column(String(50), primary_key=True)
+    product_id = Column(Integer, nullable=False, index=True)
+    body = Column(Text().with_variant(MEDIUMTEXT(), "mysql"))  # 响应 JSON
+    record_count = Column(Integer, nullable=False, default=0)
+    source = Column(String(20))  # chain=链上 RPC 组装, database=数据库回退
+
+    version = Column(Integer, nullable=False, default=1)  # 数据变更版本
+    built_version = Column(Integer, nullable=False, default=0)  # 快照对应的版本
+
+    built_at = Column(DateTime)
+    verified_at = Column(DateTime)  # 最近一次与链上核对的时间
@@ -0,0 +1,128 @@
+"""
+AI 溯源简报预生成
+产品进入销售阶段（质检合格转移）、入库或上架后，后台按速率限制预先生成并缓存简报，
+消费者首次扫码即可命中缓存。
+
+- 后台写入函数提交后调用 enqueue；同一溯源码在 AI_PREGENERATE_DELAY_SECONDS 内的多次变更只生成一次
+- 简报输入取自公开溯源快照（与消费者拿到的数据一致，内容哈希相同）；
+  快照尚未重建时先行重建，链上数据不可用时稍后重试
+- 工作协程由应用 lifespan 启动，与接口共享 AI 客户端（受其并发上限约束）
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.product import Product, ProductStage
+from app.services.ai_summaries import pregenerate_summary
+from app.services.metrics import metrics
+from app.services.trace_snapshots import build_snapshot, load_fresh_snapshot
+
+PREGENERATE_STAGES = (ProductStage.SELLER, ProductStage.SOLD)
+MAX_ATTEMPTS = 3  # 快照不可用（链上不可用）时的最大尝试次数
+
+
+def load_summary_input(db: Session, trace_code: str) -> Optional[dict]:
+    """简报输入: 有效的溯源快照（缺失或失效时先重建）；链上数据不可用时返回 None"""
+    body = load_fresh_snapshot(db, trace_code)
+    if body is None:
+        build_snapshot(db, trace_code)
+        body = load_fresh_snapshot(db, trace_code)
+    return json.loads(body) if body is not None else None
+
+
+def _load_input_job(trace_code: str) -> Optional[dict]:
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return load_summary_input(db, trace_code)
+    finally:
+        db.close()
+
+
+class SummaryPregenerator:
+    """简报预生成队列（线程安全入队，事件循环内按速率消费）"""
+
+    def __init__(self, per_minute: int, delay: float):
+        self.interval = 60 / max(per_minute, 1)
+        self.delay = delay
+        self._pending: "OrderedDict[str, float]" = OrderedDict()  # 溯源码 -> 最早生成时间
+        self._attempts: Dict[str, int] = {}
+        self._lock = Lock()
+
+    def enqueue(self, trace_codes: Iterable[str], delay: Optional[float] = None):
+        ready_at = time.monotonic() + (self.delay if delay is None else delay)
+        with self._lock:
+            for code in trace_codes:
+                if code:
+                    # 再次变更时推迟，等待变更平息后再生成
+                    self._pending[code] = ready_at
+                    self._pending.move_to_end(code)
+
+    def _next_ready(self) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            for code, ready_at in self._pending.items():
+                if ready_at <= now:
+                    del self._pending[code]
+                    return code
+        return None
+
+    async def process(self, trace_code: str) -> str:
+        """为单个溯源码生成简报，返回结果 generated / cached / unavailable / error"""
+        chain_data = await run_in_threadpool(_load_input_job, trace_code)
+        if chain_data is None or not chain_data.get("exists", True):
+            return "unavailable"
+        return "generated" if await pregenerate_summary(trace_code, chain_data) else "cached"
+
+    async def run(self):
+        """消费队列（由应用 lifespan 启动）"""
+        while True:
+            trace_code = self._next_ready()
+            if trace_code is None:
+                await asyncio.sleep(1)
+                continue
+            started = time.monotonic()
+            try:
+                result = await self.process(trace_code)
+            except Exception as e:
+                print(f"❌ AI summary pregenerate error ({trace_code}): {e}")
+                result = "error"
+            metrics.inc("ai_summary_pregenerate_total", result=result)
+
+            if result in ("unavailable", "error"):
+                attempts = self._attempts.get(trace_code, 0) + 1
+                if attempts < MAX_ATTEMPTS:
+                    self._attempts[trace_code] = attempts
+                    self.enqueue([trace_code], delay=self.delay * (2 ** attempts))
+                else:
+                    self._attempts.pop(trace_code, None)
+                    print(f"⚠️ AI 简报预生成放弃（{trace_code}）：{MAX_ATTEMPTS} 次均未成功")
+            else:
+                self._attempts.pop(trace_code, None)
+
+            # 速率限制：只有调用了 AI 才占用配额
+            if result in ("generated", "error"):
+                await asyncio.sleep(max(self.interval - (time.monotonic() - started), 0))
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "retrying": len(self._attempts)}
+
+
+summary_pregenerator = SummaryPregenerator(
+    per_minute=settings.AI_PREGENERATE_PER_MINUTE,
+    delay=settings.AI_PREGENERATE_DELAY_SECONDS,
+)
+metrics.register_collector("ai_summary_pregenerate", summary_pregenerator.stats)
+
+
+def enqueue_if_selling(product: Product):
+    """后台写入提交后调用：产品处于销售阶段时排队预生成简报"""
+    if settings.AI_PREGENERATE_ENABLED and product.current_stage in PREGENERATE_STAGES:
+        summary_pregenerator.enqueue([product.trace_code])
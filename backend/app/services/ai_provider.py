@@ -0,0 +1,200 @@
+"""
+AI 服务商（OpenAI 兼容 chat/completions）客户端
+- 应用生命周期内共享的 httpx.AsyncClient（在 lifespan 启动时创建）：HTTP/2 连接池长连接
+- 并发上限: 超出 AI_MAX_CONCURRENCY 的请求排队，排队超过 AI_QUEUE_TIMEOUT_SECONDS 返回繁忙
+- 429 / 5xx / 连接错误按指数退避 + 随机抖动重试（优先遵循 Retry-After）；
+  流式请求只在收到响应前重试
+- 指标: 请求耗时、排队耗时、结果、重试次数、token 用量
+"""
+import asyncio
+import json
+import random
+import time
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from app.config import settings
+from app.services.metrics import metrics
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class AIProviderBusy(Exception):
+    """排队等待超时（上游并发已满）"""
+
+
+class AIProvider:
+    """AI 服务商客户端（start() 创建连接池与并发信号量，aclose() 关闭）"""
+
+    def __init__(self, base_url: str, api_key: str, model: str, max_concurrency: int = 8,
+                 queue_timeout: float = 10, timeout: float = 60, max_retries: int = 2, retry_base: float = 0.5):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    async def start(self):
+        """创建连接池与并发信号量（应用启动时调用，二者只能在当前事件循环中使用）"""
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=True,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def aclose(self):
+        """关闭连接池（应用退出时调用）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._semaphore = None
+
+    async def _acquire(self):
+        if self._client is None:
+            raise RuntimeError("AI 客户端未启动（需先调用 ai_provider.start()）")
+        self.waiting += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("ai_requests_total", outcome="busy")
+            raise AIProviderBusy(f"AI 服务繁忙（排队超过 {self.queue_timeout} 秒）")
+        finally:
+            self.waiting -= 1
+        metrics.observe("ai_queue_wait_ms", (time.monotonic() - started) * 1000)
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def _payload(self, messages: List[dict], temperature: float, max_tokens: int, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": stream
+        }
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Retry-After 优先，否则指数退避加全抖动"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), self.timeout)
+        return random.uniform(0, self.retry_base * (2 ** attempt))
+
+    async def _send(self, payload: dict, stream: bool) -> httpx.Response:
+        """发送请求（可重试错误按退避重试），返回状态正常的响应"""
+        client = self._client
+        attempt = 0
+        while True:
+            request = client.build_request("POST", "/chat/completions", headers=self._headers(), json=payload)
+            response = None
+            try:
+                response = await client.send(request, stream=stream)
+            except httpx.TransportError:
+                if attempt >= self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS or attempt >= self.max_retries:
+                    if response.is_error:
+                        await response.aclose()
+                        response.raise_for_status()
+                    return response
+                await response.aclose()
+
+            delay = self._retry_delay(attempt, response)
+            attempt += 1
+            metrics.inc("ai_retries_total")
+            await asyncio.sleep(delay)
+
+    def _record_usage(self, usage: Optional[dict]):
+        if usage:
+            metrics.inc("ai_tokens_total", usage.get("prompt_tokens", 0), kind="prompt")
+            metrics.inc("ai_tokens_total", usage.get("completion_tokens", 0), kind="completion")
+
+    async def chat(self, messages: List[dict], temperature: float = 0.8, max_tokens: int = 300) -> dict:
+        """非流式调用，返回完整响应 JSON"""
+        await self._acquire()
+        started = time.monotonic()
+        outcome = "error"
+        try:
+            response = await self._send(self._payload(messages, temperature, max_tokens, False), stream=False)
+            data = response.json()
+            self._record_usage(data.get("usage"))
+            outcome = "ok"
+            return data
+        finally:
+            self._release()
+            metrics.inc("ai_requests_total", outcome=outcome)
+            metrics.observe("ai_request_ms", (time.monotonic() - started) * 1000, mode="chat")
+
+    async def stream_chat(self, messages: List[dict], temperature: float = 0.8, max_tokens: int = 300) -> AsyncIterator[str]:
+        """流式调用，逐段产出生成的文本（占用并发名额直至流结束或被关闭）"""
+        await self._acquire()
+        started = time.monotonic()
+        outcome, first_token = "error", True
+        try:
+            response = await self._send(self._payload(messages, temperature, max_tokens, True), stream=True)
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    self._record_usage(chunk.get("usage"))
+                    choices = chunk.get("choices") or []
+                    delta = (choices[0].get("delta") or {}).get("content") if choices else None
+                    if delta:
+                        if first_token:
+                            metrics.observe("ai_first_token_ms", (time.monotonic() - started) * 1000)
+                            first_token = False
+                        yield delta
+                outcome = "ok"
+            finally:
+                await response.aclose()
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            raise
+        finally:
+            self._release()
+            metrics.inc("ai_requests_total", outcome=outcome)
+            metrics.observe("ai_request_ms", (time.monotonic() - started) * 1000, mode="stream")
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "max_concurrency": self.max_concurrency}
+
+
+ai_provider = AIProvider(
+    base_url=settings.AI_BASE_URL,
+    api_key=settings.AI_API_KEY,
+    model=settings.AI_MODEL,
+    max_concurrency=settings.AI_MAX_CONCURRENCY,
+    queue_timeout=settings.AI_QUEUE_TIMEOUT_SECONDS,
+    timeout=settings.AI_TIMEOUT_SECONDS,
+    max_retries=settings.AI_MAX_RETRIES,
+    retry_base=settings.AI_RETRY_BASE_SECONDS,
+)
+metrics.register_collector("ai_provider", ai_provider.stats)
@@ -0,0 +1,204 @@
+"""
+AI 溯源简报缓存
+按溯源码 + 内容哈希（由溯源数据渲染出的提示词）缓存已生成的简报：进程内 LRU 在前，
+ai_summaries 表持久化（重启与多实例共享）。
+新增流转记录后提示词与内容哈希变化，旧简报自动不再命中；trace_events 通知时同时清除本地条目。
+
+generate_summary / pregenerate_summary 为接口与后台预生成共用的"生成并缓存"入口，
+stream_summary 为流式接口的入口；相同溯源码与内容哈希的并发生成（含流式与非流式之间）合并为一次 AI 调用。
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import AsyncIterator, List, Optional, Set
+
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.ai_summary import AISummary
+from app.services import trace_events
+from app.services.ai_provider import ai_provider
+from app.services.metrics import metrics
+from app.services.single_flight import AsyncSingleFlight, AsyncStreamFlight
+from app.services.summary_prompt import build_summary_prompt
+
+
+def build_summary_messages(trace_code: str, chain_data: Optional[dict]) -> List[dict]:
+    """简报生成的对话消息"""
+    return [
+        {
+            "role": "system",
+            "content": "你是一个农产品溯源专家，擅长用简洁易懂的语言生成产品溯源简报。"
+        },
+        {
+            "role": "user",
+            "content": build_summary_prompt(trace_code, chain_data)
+        }
+    ]
+
+
+def summary_content_hash(trace_code: str, chain_data: Optional[dict]) -> str:
+    """
+    简报内容哈希：对实际发送给 AI 的对话消息取哈希
+
+    交易哈希、区块高度、持有者地址等不进入提示词的字段，以及链上 / 数据库回退的数据形态差异
+    不影响哈希，回执回填等变更不会使已生成的简报失效
+    """
+    canonical = json.dumps(build_summary_messages(trace_code, chain_data), ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    """AI 简报缓存（进程内 LRU + 数据库）"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 溯源码 -> (内容哈希, 简报)
+        self._lock = Lock()
+
+    def get_local(self, trace_code: str, content_hash: str) -> Optional[str]:
+        """只查进程内缓存（不访问数据库，可在事件循环中直接调用）"""
+        with self._lock:
+            item = self._entries.get(trace_code)
+            if item is None or item[0] != content_hash:
+                return None
+            self._entries.move_to_end(trace_code)
+        metrics.inc("ai_summary_cache_requests_total", result="memory")
+        return item[1]
+
+    def get(self, db: Session, trace_code: str, content_hash: str) -> Optional[str]:
+        """进程内缓存未命中时查数据库"""
+        summary = self.get_local(trace_code, content_hash)
+        if summary is not None:
+            return summary
+        row = db.query(AISummary.content_hash, AISummary.summary).filter(
+            AISummary.trace_code == trace_code
+        ).first()
+        if row is None or row.content_hash != content_hash:
+            metrics.inc("ai_summary_cache_requests_total", result="miss")
+            return None
+        metrics.inc("ai_summary_cache_requests_total", result="database")
+        self._store_local(trace_code, content_hash, row.summary)
+        return row.summary
+
+    def put(self, db: Session, trace_code: str, content_hash: str, summary: str, model: str = None):
+        """保存简报（覆盖该溯源码之前内容对应的简报）"""
+        db.merge(AISummary(trace_code=trace_code, content_hash=content_hash, summary=summary, model=model))
+        db.commit()
+        self._store_local(trace_code, content_hash, summary)
+
+    def _store_local(self, trace_code: str, content_hash: str, summary: str):
+        with self._lock:
+            self._entries[trace_code] = (content_hash, summary)
+            self._entries.move_to_end(trace_code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, trace_codes: Set[str]):
+        """溯源数据变更：清除本地条目（数据库中的旧简报因内容哈希不同不再命中）"""
+        with self._lock:
+            for code in trace_codes:
+                self._entries.pop(code, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize}
+
+
+summary_cache = SummaryCache(maxsize=settings.AI_SUMMARY_CACHE_SIZE)
+trace_events.subscribe(summary_cache.invalidate)
+metrics.register_collector("ai_summary_cache", summary_cache.stats)
+
+
+summary_flight = AsyncSingleFlight("ai_summary")
+summary_stream_flight = AsyncStreamFlight("ai_summary_stream")
+FAILED_SUMMARY = "AI生成失败，请稍后重试"
+
+
+def read_cached_summary(trace_code: str, content_hash: str) -> Optional[str]:
+    """查简报缓存（独立会话，供线程池调用）"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return summary_cache.get(db, trace_code, content_hash)
+    finally:
+        db.close()
+
+
+def save_summary(trace_code: str, content_hash: str, summary: str):
+    """写入简报缓存（独立会话，供线程池调用），失败只记录日志"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        summary_cache.put(db, trace_code, content_hash, summary, model=settings.AI_MODEL)
+    except Exception as e:
+        print(f"⚠️ AI 简报缓存写入失败: {e}")
+    finally:
+        db.close()
+
+
+async def _generate(trace_code: str, chain_data: Optional[dict], content_hash: str) -> str:
+    response_data = await ai_provider.chat(build_summary_messages(trace_code, chain_data), temperature=0.8, max_tokens=300)
+
+    # 提取生成的简报
+    content = response_data["choices"][0]["message"]["content"]
+    if not content:
+        return FAILED_SUMMARY
+
+    summary = content.strip()
+    await run_in_threadpool(save_summary, trace_code, content_hash, summary)
+    return summary
+
+
+async def _stream_generate(trace_code: str, chain_data: Optional[dict], content_hash: str) -> AsyncIterator[str]:
+    parts = []
+    upstream = ai_provider.stream_chat(build_summary_messages(trace_code, chain_data))
+    try:
+        async for delta in upstream:
+            parts.append(delta)
+            yield delta
+    finally:
+        # 断开或被取消时立即关闭上游流式响应
+        await upstream.aclose()
+
+    summary = "".join(parts).strip()
+    if summary:
+        await run_in_threadpool(save_summary, trace_code, content_hash, summary)
+
+
+async def generate_summary(trace_code: str, chain_data: Optional[dict], content_hash: str) -> str:
+    """调用 AI 生成简报并写入缓存（相同内容的并发调用合并为一次）"""
+    key = (trace_code, content_hash)
+    if summary_stream_flight.in_flight(key):
+        # 已有相同内容的流式生成：等待其完整文本
+        parts = [delta async for delta in summary_stream_flight.stream(key, _stream_generate, trace_code, chain_data, content_hash)]
+        return "".join(parts).strip() or FAILED_SUMMARY
+    return await summary_flight.do(key, _generate, trace_code, chain_data, content_hash)
+
+
+async def stream_summary(trace_code: str, chain_data: Optional[dict], content_hash: str) -> AsyncIterator[str]:
+    """
+    流式生成简报并写入缓存，逐段产出文本
+    相同内容的并发请求共享一次上游调用：后来者先收到已生成的部分，再跟随后续增量；
+    已有非流式生成进行中时等待其结果并一次产出
+    """
+    key = (trace_code, content_hash)
+    if summary_flight.in_flight(key):
+        yield await summary_flight.do(key, _generate, trace_code, chain_data, content_hash)
+        return
+    deltas = summary_stream_flight.stream(key, _stream_generate, trace_code, chain_data, content_hash)
+    try:
+        async for delta in deltas:
+            yield delta
+    finally:
+        await deltas.aclose()
+
+
+async def pregenerate_summary(trace_code: str, chain_data: dict) -> bool:
+    """后台预生成简报（已缓存时跳过），返回是否调用了 AI"""
+    content_hash = summary_content_hash(trace_code, chain_data)
+    if await run_in_threadpool(read_cached_summary, trace_code, content_hash) is not None:
+        return False
+    await generate_summary(trace_code, chain_data, content_hash)
+    return True
@@ -0,0 +1,124 @@
+"""
+批量任务登记
+批量导入 / 批量流转等耗时任务登记任务 ID，记录进度与逐项结果，供进度接口查询。
+任务信息保存在进程内存中，仅保留最近的 MAX_JOBS 个。
+"""
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+MAX_JOBS = 200
+MAX_JOB_ERRORS = 200  # 每个任务保留的错误明细上限
+
+
+class JobStatus:
+    PENDING = "pending"          # 已创建
+    RUNNING = "running"          # 处理中
+    COMPLETED = "completed"      # 全部成功
+    PARTIAL = "partial"          # 部分失败
+    FAILED = "failed"            # 全部失败 / 异常终止
+
+
+class BulkJob:
+    """单个批量任务的进度"""
+
+    def __init__(self, kind: str, owner_id: int, total: int = 0):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.owner_id = owner_id
+        self.status = JobStatus.PENDING
+        self.total = total
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.errors: List[dict] = []
+        self.items: Dict[Any, dict] = {}  # 逐项状态（如 product_id -> {status, tx_hash, ...}）
+        self.created_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self._lock = Lock()
+
+    def start(self, total: Optional[int] = None):
+        with self._lock:
+            if total is not None:
+                self.total = total
+            self.status = JobStatus.RUNNING
+
+    def item_done(self, key, success: bool, **detail):
+        """记录单项结果"""
+        with self._lock:
+            self.processed += 1
+            if success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+            self.items[key] = {"status": "success" if success else "failed", **detail}
+
+    def add_progress(self, succeeded: int = 0, failed: int = 0):
+        """累加不需要逐项明细的进度"""
+        with self._lock:
+            self.processed += succeeded + failed
+            self.succeeded += succeeded
+            self.failed += failed
+
+    def add_error(self, **detail):
+        with self._lock:
+            if len(self.errors) < MAX_JOB_ERRORS:
+                self.errors.append(detail)
+
+    def finish(self, error: Optional[str] = None):
+        with self._lock:
+            if error:
+                self.status = JobStatus.FAILED
+                self.errors.append({"error": error})
+            elif self.failed and self.succeeded:
+                self.status = JobStatus.PARTIAL
+            elif self.failed:
+                self.status = JobStatus.FAILED
+            else:
+                self.status = JobStatus.COMPLETED
+            self.finished_at = datetime.now()
+
+    def to_dict(self, include_items: bool = True) -> dict:
+        with self._lock:
+            result = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "total": self.total,
+                "processed": self.processed,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "progress": round(self.processed / self.total, 4) if self.total else 0,
+                "errors": list(self.errors),
+                "created_at": self.created_at.isoformat(),
+                "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            }
+            if include_items:
+                result["items"] = {str(key): value for key, value in self.items.items()}
+            return result
+
+
+class JobRegistry:
+    """进程内任务登记表"""
+
+    def __init__(self, max_jobs: int = MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, BulkJob]" = OrderedDict()
+        self._lock = Lock()
+
+    def create(self, kind: str, owner_id: int, total: int = 0) -> BulkJob:
+        job = BulkJob(kind, owner_id, total)
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Optional[BulkJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+
+bulk_jobs = JobRegistry()
@@ -0,0 +1,147 @@
+"""
+批量流转
+批量接收 / 加工 / 送检 / 质检 / 入库 / 上架共用的流程：
+一次查询加载并校验全部产品，在同一事务中置为待上链，
+再把各产品的链上写入（复用单条接口的后台任务）按 CHAIN_BATCH_SIZE 分批交给 submit_chain_batch：
+批内并发提交、不逐笔等待回执，统一确认后回填区块高度，逐项结果记录在批量任务中。
+"""
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.product import Product, ProductRecord, ProductStatus
+from app.services import trace_events
+from app.services.bulk_jobs import bulk_jobs, BulkJob
+from app.services.chain_batch import submit_chain_batch
+from app.services.chain_reconciler import register_chain_write
+
+# (product_id, 后台任务函数, 参数)
+ChainTask = Tuple[int, Callable, tuple]
+
+# 链上写入完成后视为成功的产品状态
+SUCCESS_STATUSES = (ProductStatus.ON_CHAIN, ProductStatus.INVALIDATED)
+
+
+def load_bulk_products(db: Session, items: Sequence) -> Tuple[Dict[int, Product], List[dict]]:
+    """
+    一次查询加载批量请求中的产品（items 需有 product_id 属性）
+
+    Returns:
+        (product_id -> Product, 重复或不存在的条目结果)
+    """
+    ids = [item.product_id for item in items]
+    products = {p.id: p for p in db.query(Product).filter(Product.id.in_(set(ids))).all()}
+
+    rejected, seen = [], set()
+    for product_id in ids:
+        if product_id in seen:
+            rejected.append(rejected_item(product_id, "重复的产品ID"))
+        elif product_id not in products:
+            rejected.append(rejected_item(product_id, "产品不存在"))
+        seen.add(product_id)
+    return products, rejected
+
+
+def rejected_item(product_id: int, error: str) -> dict:
+    return {"product_id": product_id, "status": "rejected", "error": error}
+
+
+def accepted_item(product_id: int) -> dict:
+    return {"product_id": product_id, "status": "accepted"}
+
+
+def submit_bulk_transition(db: Session, kind: str, owner_id: int, products: List[Product],
+                           tasks: List[ChainTask], background_tasks) -> BulkJob:
+    """将通过校验的产品在同一事务中置为待上链并登记各产品的上链操作，再由批量任务执行链上写入"""
+    for product in products:
+        product.status = ProductStatus.PENDING_CHAIN
+    for _, func, args in tasks:
+        register_chain_write(db, func, *args)
+    db.commit()
+
+    job = bulk_jobs.create(kind, owner_id)
+    job.start(total=len(tasks))
+    if tasks:
+        background_tasks.add_task(run_bulk_transition, job.id, tasks)
+    else:
+        job.finish()
+    return job
+
+
+def bulk_response(job: BulkJob, results: List[dict]) -> dict:
+    """批量接口统一返回: 任务 ID 与逐项受理结果"""
+    return {
+        "job_id": job.id,
+        "accepted": sum(1 for r in results if r["status"] == "accepted"),
+        "rejected": sum(1 for r in results if r["status"] == "rejected"),
+        "items": results
+    }
+
+
+def _product_outcome(product_id: int) -> Tuple[bool, dict]:
+    """读取链上写入后的产品状态"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        product = db.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            return False, {"error": "产品不存在"}
+        detail = {
+            "product_status": product.status.value if product.status else None,
+            "stage": product.current_stage.value if product.current_stage else None,
+            "tx_hash": product.tx_hash,
+        }
+        return product.status in SUCCESS_STATUSES, detail
+    finally:
+        db.close()
+
+
+def _backfill_block_numbers(blocks: Dict[str, int]):
+    """后台任务写入时区块高度为空，统一确认后按交易哈希回填产品与流转记录"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        for tx_hash, block_number in blocks.items():
+            if block_number is None:
+                continue
+            for model in (Product, ProductRecord):
+                db.execute(update(model).where(
+                    model.tx_hash == tx_hash, model.block_number.is_(None)
+                ).values(block_number=block_number))
+        trace_codes = {code for code, in db.query(Product.trace_code).filter(or_(
+            Product.tx_hash.in_(blocks),
+            Product.id.in_(select(ProductRecord.product_id).where(ProductRecord.tx_hash.in_(blocks)))
+        ))}
+        # 绕过 ORM 的批量更新，手动登记变更（提交后通知溯源快照与缓存等订阅者）
+        trace_events.record_changes(db, trace_codes)
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_bulk_transition(job_id: str, tasks: List[ChainTask]):
+    """后台分批执行链上写入（批内并发上限 CHAIN_BATCH_CONCURRENCY，统一确认回执），逐项记录结果"""
+    job = bulk_jobs.get(job_id)
+
+    def write(task: ChainTask):
+        product_id, func, args = task
+
+        def run():
+            func(*args)
+            # 结果以写入后的产品状态为准（见 _product_outcome）
+            return True, None, None
+        return run
+
+    try:
+        for start in range(0, len(tasks), settings.CHAIN_BATCH_SIZE):
+            batch = tasks[start:start + settings.CHAIN_BATCH_SIZE]
+            submit_chain_batch({task[0]: write(task) for task in batch}, on_confirmed=_backfill_block_numbers)
+            for product_id, _, _ in batch:
+                success, detail = _product_outcome(product_id)
+                job.item_done(product_id, success, **detail)
+        job.finish()
+    except Exception as e:
+        print(f"❌ Bulk transition job error: {e}")
+        job.finish(error=str(e))
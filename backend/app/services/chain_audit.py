@@ -0,0 +1,197 @@
+"""
+数据库与链上数据一致性审计
+按主键分块流式读取已上链产品，并发（有上限）通过 RPC 读取链上产品，
+对比产品字段与记录数，输出差异列表。支持检查点：中断后从断点继续，
+再次运行时只审计上次审计以来有变化的产品（以及上次存在差异的产品）。
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.blockchain.client import blockchain_client
+from app.models.product import Product, ProductStatus, RecordAction
+from app.services.record_archive import query_history
+
+# 参与审计的产品状态（待上链/上链失败由对账任务处理）
+AUDITED_STATUSES = (ProductStatus.ON_CHAIN, ProductStatus.INVALIDATED, ProductStatus.TERMINATED)
+
+# 数据库单条记录对应的链上写入数范围（送检 = 记录 + 转移；质检的转移可能未发生）
+RECORD_WRITES = {
+    RecordAction.SEND_INSPECT: (2, 2),
+    RecordAction.INSPECT: (1, 2),
+}
+
+# 加工会修改产品名称与数量（链上产品信息保持创建时的值）
+PROCESS_FIELDS = {"name", "quantity"}
+COMPARED_FIELDS = ("name", "category", "origin", "quantity", "unit")
+AMEND_FIELD_ALIASES = {"harvestDate": "harvest_date", "batchNo": "batch_no"}
+
+
+class AuditCheckpoint:
+    """
+    审计检查点（JSON 文件）
+
+    since: 只审计 updated_at 不早于该时间的产品（上次完成审计的开始时间）
+    last_id: 本轮已审计到的产品 ID
+    open_ids: 上一轮存在差异的产品，本轮无论是否变化都重新审计
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.since: Optional[str] = None
+        self.run_started_at: Optional[str] = None
+        self.last_id = 0
+        self.completed = True
+        self.open_ids: List[int] = []
+        self.run_discrepancy_ids: List[int] = []
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.__dict__.update({k: v for k, v in json.load(f).items() if k != "path"})
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in self.__dict__.items() if k != "path"}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def _iter_chunks(db: Session, checkpoint: AuditCheckpoint, chunk_size: int) -> Iterator[List[Product]]:
+    """按主键分块读取待审计产品"""
+    query = db.query(Product).filter(Product.trace_code.isnot(None), Product.status.in_(AUDITED_STATUSES))
+    if checkpoint.since:
+        since = datetime.fromisoformat(checkpoint.since)
+        query = query.filter(or_(Product.updated_at >= since, Product.id.in_(checkpoint.open_ids or [0])))
+
+    last_id = checkpoint.last_id
+    while True:
+        chunk = query.filter(Product.id > last_id).order_by(Product.id.asc()).limit(chunk_size).all()
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def _db_expectations(db: Session, product_ids: List[int]) -> Tuple[Dict[int, Tuple[int, int]], Dict[int, Set[str]]]:
+    """
+    一次查询本块产品的上链记录，返回
+    (product_id -> 期望链上记录数范围, product_id -> 链上产品信息已不再对应的字段)
+    """
+    rows = query_history(lambda Record: db.query(Record.product_id, Record.action, Record.data).filter(
+        Record.product_id.in_(product_ids),
+        or_(Record.tx_hash.isnot(None), Record.block_number.isnot(None))
+    ))
+
+    ranges: Dict[int, Tuple[int, int]] = {pid: (0, 0) for pid in product_ids}
+    changed: Dict[int, Set[str]] = {pid: set() for pid in product_ids}
+    for product_id, action, data in rows:
+        low, high = RECORD_WRITES.get(action, (1, 1))
+        ranges[product_id] = (ranges[product_id][0] + low, ranges[product_id][1] + high)
+        if action == RecordAction.PROCESS:
+            changed[product_id] |= PROCESS_FIELDS
+        elif action == RecordAction.AMEND:
+            try:
+                field = json.loads(data or "{}").get("field")
+            except ValueError:
+                field = None
+            if field:
+                changed[product_id].add(AMEND_FIELD_ALIASES.get(field, field))
+    return ranges, changed
+
+
+def _fetch_chain(trace_code: str) -> Tuple[Optional[dict], Optional[str]]:
+    """读取链上产品，返回 (产品信息, 错误)；产品不存在时信息为 None 且无错误"""
+    try:
+        chain_product = blockchain_client.get_product_rpc(trace_code)
+        if chain_product is not None:
+            return chain_product, None
+        # getProduct 在产品不存在时回滚，区分不存在与 RPC 失败
+        if blockchain_client.get_record_count_rpc(trace_code) == 0:
+            return None, None
+        return None, "rpc_error"
+    except Exception as e:
+        return None, str(e)
+
+
+def _compare(product: Product, chain_product: dict, record_range: Tuple[int, int], changed: Set[str]) -> List[dict]:
+    issues = []
+    db_values = {
+        "name": product.name or "", "category": product.category or "", "origin": product.origin or "",
+        "quantity": int((product.quantity or 0) * 1000), "unit": product.unit or "",
+    }
+    for field in COMPARED_FIELDS:
+        if field in changed:
+            continue
+        chain_value = chain_product[field]
+        if db_values[field] != chain_value:
+            issues.append({"type": "field_mismatch", "field": field, "db": db_values[field], "chain": chain_value})
+
+    chain_count = int(chain_product["recordCountNum"])
+    low, high = record_range
+    if not low <= chain_count <= high:
+        issues.append({"type": "record_count", "db_min": low, "db_max": high, "chain": chain_count})
+    return issues
+
+
+def audit_products(db: Session, checkpoint: AuditCheckpoint, report, chunk_size: int = 500,
+                   workers: int = 8, progress=None) -> Dict[str, int]:
+    """
+    审计产品并将差异逐行写入 report（NDJSON），每块完成后保存检查点
+
+    Returns:
+        汇总计数
+    """
+    if checkpoint.completed:
+        # 新一轮：上次完成的开始时间作为增量起点
+        checkpoint.since = checkpoint.run_started_at
+        checkpoint.open_ids = checkpoint.run_discrepancy_ids
+        checkpoint.run_started_at = db.query(func.now()).scalar().isoformat()
+        checkpoint.last_id = 0
+        checkpoint.run_discrepancy_ids = []
+        checkpoint.completed = False
+        checkpoint.save()
+
+    summary = {"audited": 0, "consistent": 0, "discrepant": 0, "errors": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in _iter_chunks(db, checkpoint, chunk_size):
+            ranges, changed = _db_expectations(db, [p.id for p in chunk])
+            chain_results = executor.map(_fetch_chain, [p.trace_code for p in chunk])
+
+            for product, (chain_product, error) in zip(chunk, chain_results):
+                summary["audited"] += 1
+                if error:
+                    issues = [{"type": "chain_error", "error": error}]
+                    summary["errors"] += 1
+                elif chain_product is None:
+                    issues = [{"type": "missing_on_chain"}]
+                else:
+                    issues = _compare(product, chain_product, ranges[product.id], changed[product.id])
+
+                if not issues:
+                    summary["consistent"] += 1
+                    continue
+                if not error:
+                    summary["discrepant"] += 1
+                checkpoint.run_discrepancy_ids.append(product.id)
+                report.write(json.dumps({
+                    "product_id": product.id, "trace_code": product.trace_code,
+                    "status": product.status.value if product.status else None,
+                    "issues": issues
+                }, ensure_ascii=False) + "\n")
+
+            report.flush()
+            checkpoint.last_id = chunk[-1].id
+            checkpoint.save()
+            db.expunge_all()
+            if progress:
+                progress(summary, checkpoint.last_id)
+
+    checkpoint.completed = True
+    checkpoint.save()
+    return summary
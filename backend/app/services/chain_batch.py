@@ -0,0 +1,60 @@
+"""
+链上批量提交
+合约没有批量写入接口，每笔写入都是一次 Console 调用。这里把一批写入并发提交
+（不逐笔等待回执），再统一轮询回执，避免逐笔串行的 Console 启动与 3 秒回执等待。
+批量中的写入函数也可以是包含多笔写入的后台任务：执行期间客户端写入一律不等待回执，
+提交的交易一并确认，确认结果通过 on_confirmed 交给调用方回填区块高度。
+FISCO BCOS 交易使用随机 nonce，同一账户并发提交不会冲突。
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.blockchain import blockchain_client
+from app.blockchain.client import deferred_receipts
+from app.config import settings
+
+ChainResult = Tuple[bool, Optional[str], Optional[int]]
+
+
+def submit_chain_batch(writes: Dict[Hashable, Callable[[], ChainResult]],
+                       concurrency: Optional[int] = None,
+                       on_confirmed: Optional[Callable[[Dict[str, Optional[int]]], None]] = None
+                       ) -> Dict[Hashable, ChainResult]:
+    """
+    并发执行一批链上写入并统一确认
+
+    Args:
+        writes: key -> 写入函数（执行期间的客户端写入均不等待回执）
+        concurrency: 同时进行的 Console 调用数
+        on_confirmed: 统一确认后以 tx_hash -> 区块高度（批量中提交的全部交易）回调
+
+    Returns:
+        key -> (success, tx_hash, block_number)
+    """
+    if not writes:
+        return {}
+
+    def run(write) -> Tuple[ChainResult, List[str]]:
+        submitted: List[str] = []
+        token = deferred_receipts.set(submitted)
+        try:
+            return write(), submitted
+        except Exception as e:
+            print(f"❌ Chain batch write error: {e}")
+            return (False, None, None), submitted
+        finally:
+            deferred_receipts.reset(token)
+
+    workers = min(concurrency or settings.CHAIN_BATCH_CONCURRENCY, len(writes))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = dict(zip(writes.keys(), executor.map(run, writes.values())))
+
+    # 统一轮询回执
+    tx_hashes = [tx for _, submitted in outcomes.values() for tx in submitted]
+    blocks = blockchain_client.wait_for_transactions_rpc(tx_hashes) if tx_hashes else {}
+    if on_confirmed and blocks:
+        on_confirmed(blocks)
+    return {
+        key: (success, tx, block if block is not None else blocks.get(tx))
+        for key, ((success, tx, block), _) in outcomes.items()
+    }
@@ -0,0 +1,415 @@
+"""
+上链对账服务
+后台上链任务以 @tracked_chain_write 装饰：执行前记录操作意图与链上记录数基线，
+结束后按产品状态标记成功或失败。接口通过 enqueue_chain_write 添加后台任务，操作意图随接口事务一同提交，
+后台任务未能执行（如进程重启）时，该操作超过 CHAIN_STALE_SECONDS 后按中断处理。对账任务定期扫描失败、中断（长时间执行中）的操作，
+通过 verifyTraceCode / getRecordCount 判断写入是否实际已落链：
+已落链则采用链上结果（回填交易哈希与区块高度，不重复写入），否则按指数退避重试。
+合约每次写入恰好追加一条记录，因此 链上记录数 - 基线 即为已落链的写入数。
+
+对账循环在每个 worker 中运行：处理操作前以条件更新（FAILED -> RUNNING）认领，
+补登记前以条件更新（CHAIN_FAILED -> PENDING_CHAIN，或刷新长时间待上链产品的更新时间）认领产品，
+同一操作只会由一个 worker 重放，避免重复提交链上交易。
+"""
+import asyncio
+import json
+from collections import deque
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.blockchain.client import blockchain_client, write_observer
+from app.config import settings
+from app.models.chain_operation import ChainOperation, ChainOperationStatus
+from app.models.product import Product, ProductRecord, ProductStatus, ProductStage, RecordAction, build_chain_payload
+from app.models.user import User
+from app.services.metrics import metrics
+from app.services.read_routing import replica_router
+
+# 上链完成后的产品状态
+SETTLED_STATUSES = (ProductStatus.ON_CHAIN, ProductStatus.INVALIDATED)
+OPEN_STATUSES = (ChainOperationStatus.RUNNING, ChainOperationStatus.FAILED)
+
+# 任务函数名 -> 后台任务函数（由装饰器注册）
+_writers: Dict[str, Callable] = {}
+
+
+class _WriteObserver:
+    """记录一次执行中提交的交易，并按顺序返回需采用的已落链结果"""
+
+    def __init__(self, adopted: List[Tuple[bool, Optional[str], Optional[int]]] = ()):
+        self._adopted = deque(adopted)
+        self.tx_hashes: List[Optional[str]] = []
+
+    def adopt_next(self):
+        if not self._adopted:
+            return None
+        result = self._adopted.popleft()
+        self.tx_hashes.append(result[1])
+        return result
+
+    def submitted(self, tx_hash: str):
+        self.tx_hashes.append(tx_hash)
+
+
+def _session() -> Session:
+    from app.database import SessionLocal
+    return SessionLocal()
+
+
+def _backoff(attempts: int) -> timedelta:
+    seconds = settings.CHAIN_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, settings.CHAIN_RETRY_MAX_BACKOFF_SECONDS))
+
+
+def _begin_operation(kind: str, product_id: int, args: tuple, kwargs: dict) -> Optional[int]:
+    """登记操作意图（接口已登记的直接认领；取代该产品未完成的旧操作），返回操作 ID"""
+    db = _session()
+    try:
+        product = db.query(Product).filter(Product.id == product_id).first()
+        if not product:
+            return None
+        registered = db.query(ChainOperation).filter(
+            ChainOperation.product_id == product_id, ChainOperation.kind == kind,
+            ChainOperation.status == ChainOperationStatus.RUNNING, ChainOperation.attempts == 0
+        ).order_by(ChainOperation.id.desc()).first()
+        db.query(ChainOperation).filter(
+            ChainOperation.product_id == product_id,
+            ChainOperation.status.in_(OPEN_STATUSES),
+            ChainOperation.id != (registered.id if registered else None)
+        ).update({ChainOperation.status: ChainOperationStatus.SUPERSEDED}, synchronize_session=False)
+
+        baseline = blockchain_client.get_record_count_rpc(product.trace_code) if product.trace_code else 0
+        op = registered or ChainOperation(
+            product_id=product_id, kind=kind,
+            arguments=json.dumps({"args": list(args), "kwargs": kwargs}, ensure_ascii=False),
+            status=ChainOperationStatus.RUNNING, attempts=0
+        )
+        op.baseline_record_count = baseline
+        db.add(op)
+        db.commit()
+        return op.id
+    except Exception as e:
+        print(f"⚠️ 上链操作登记失败（不影响本次执行）: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def _execute(op_id: int, func: Callable, product_id: int, args: tuple, kwargs: dict,
+             adopted: List[Tuple[bool, Optional[str], Optional[int]]] = ()) -> bool:
+    """执行一次后台任务并记录结果，返回是否成功"""
+    db = _session()
+    try:
+        op = db.get(ChainOperation, op_id)
+        op.status = ChainOperationStatus.RUNNING
+        op.attempts += 1
+        db.commit()
+        prior_hashes = json.loads(op.tx_hashes or "[]")
+    finally:
+        db.close()
+
+    observer = _WriteObserver(adopted)
+    token = write_observer.set(observer)
+    error = None
+    try:
+        func(product_id, *args, **kwargs)
+    except Exception as e:
+        error = str(e)
+    finally:
+        write_observer.reset(token)
+
+    db = _session()
+    try:
+        op = db.get(ChainOperation, op_id)
+        product = db.query(Product).filter(Product.id == product_id).first()
+        success = product is not None and product.status in SETTLED_STATUSES
+        # 采用的结果对应已落链的前几笔写入，其后为本次新提交的交易
+        op.tx_hashes = json.dumps(prior_hashes[:len(adopted)] + observer.tx_hashes)
+        if op.status == ChainOperationStatus.SUPERSEDED:
+            pass
+        elif success:
+            op.status = ChainOperationStatus.SUCCEEDED
+            op.last_error = None
+            op.next_retry_at = None
+        else:
+            op.status = ChainOperationStatus.FAILED
+            op.last_error = (error or f"product status: {product.status.value if product else 'missing'}")[:500]
+            op.next_retry_at = datetime.now() + _backoff(op.attempts)
+            metrics.inc("chain_write_failures_total", kind=op.kind)
+        db.commit()
+        return success
+    finally:
+        db.close()
+
+
+def tracked_chain_write(func: Callable) -> Callable:
+    """
+    装饰后台上链任务（首个参数为 product_id，第二个参数为发起请求的用户 ID，其余参数需可 JSON 序列化）
+
+    在另一个受跟踪任务内部调用时（如加工后自动送检）直接执行，写入计入外层操作
+    """
+    kind = func.__name__
+    _writers[kind] = func
+
+    @wraps(func)
+    def wrapper(product_id: int, *args, **kwargs):
+        if write_observer.get() is not None:
+            return func(product_id, *args, **kwargs)
+        try:
+            op_id = _begin_operation(kind, product_id, args, kwargs)
+            if op_id is None:
+                return func(product_id, *args, **kwargs)
+            _execute(op_id, func, product_id, args, kwargs)
+        finally:
+            # 后台写入晚于接口请求提交：重新固定发起用户的读请求，直到副本追上本次写入
+            replica_router.record_user_write(args[0] if args else None)
+
+    return wrapper
+
+
+def register_chain_write(db: Session, writer: Callable, product_id: int, *args):
+    """在调用方事务中登记上链操作意图（不提交，随业务状态一同提交），由后台任务执行时认领"""
+    db.add(ChainOperation(
+        product_id=product_id, kind=writer.__name__,
+        arguments=json.dumps({"args": list(args), "kwargs": {}}, ensure_ascii=False),
+        status=ChainOperationStatus.RUNNING, attempts=0
+    ))
+
+
+def enqueue_chain_write(db: Session, background_tasks, writer: Callable, product_id: int, *args):
+    """登记操作意图并添加后台上链任务（调用方随后提交事务）"""
+    register_chain_write(db, writer, product_id, *args)
+    background_tasks.add_task(writer, product_id, *args)
+
+
+# ==================== 对账 ====================
+
+def _adopted_results(op: ChainOperation, landed: int) -> List[Tuple[bool, Optional[str], Optional[int]]]:
+    """已落链写入的结果: 有交易哈希的按回执取区块高度，否则使用当前块高"""
+    hashes = json.loads(op.tx_hashes or "[]")
+    current_block = None
+    results = []
+    for i in range(landed):
+        tx_hash = hashes[i] if i < len(hashes) else None
+        block_number = None
+        if tx_hash:
+            receipt = blockchain_client.get_transaction_receipt(tx_hash)
+            if receipt and receipt.get("blockNumber") is not None:
+                bn = receipt["blockNumber"]
+                block_number = int(bn, 16) if isinstance(bn, str) and bn.startswith("0x") else int(bn)
+        if block_number is None:
+            if current_block is None:
+                current_block = blockchain_client.get_block_number()
+            block_number = current_block
+        results.append((True, tx_hash, block_number))
+    return results
+
+
+def _track_untracked_submissions(db: Session, limit: int, now: datetime) -> int:
+    """
+    为未登记操作的产品补登记创建操作：上链失败（如批量导入上链失败），
+    或待上链超过 CHAIN_STALE_SECONDS 仍无操作（如接口已提交、后台任务未执行即重启）
+
+    仅处理仍在原料商阶段且没有上链记录的产品，其余无法推断原操作的仅计入指标
+    """
+    stale_before = now - timedelta(seconds=settings.CHAIN_STALE_SECONDS)
+    has_open_op = db.query(ChainOperation.id).filter(
+        ChainOperation.product_id == Product.id,
+        ChainOperation.status.in_(OPEN_STATUSES + (ChainOperationStatus.ABANDONED,))
+    ).exists()
+    has_harvest = db.query(ProductRecord.id).filter(
+        ProductRecord.product_id == Product.id,
+        ProductRecord.action == RecordAction.HARVEST
+    ).exists()
+    untracked = or_(
+        Product.status == ProductStatus.CHAIN_FAILED,
+        and_(Product.status == ProductStatus.PENDING_CHAIN, Product.updated_at < stale_before)
+    )
+    products = db.query(Product).filter(
+        untracked,
+        Product.current_stage == ProductStage.PRODUCER,
+        Product.trace_code.isnot(None),
+        ~has_open_op, ~has_harvest
+    ).limit(limit).all()
+    if not products:
+        return 0
+
+    creators = {u.id: u for u in db.query(User).filter(User.id.in_({p.creator_id for p in products})).all()}
+    tracked = 0
+    for product in products:
+        # 认领产品（状态置为待上链并刷新更新时间）：其他 worker 已补登记的跳过
+        claimed = db.query(Product).filter(Product.id == product.id, untracked).update(
+            {Product.status: ProductStatus.PENDING_CHAIN, Product.updated_at: now}, synchronize_session=False
+        )
+        if not claimed:
+            db.rollback()
+            continue
+        creator = creators.get(product.creator_id)
+        operator_name = (creator.real_name or creator.username) if creator else ""
+        chain_data_str, quantity_int = build_chain_payload(product)
+        db.add(ChainOperation(
+            product_id=product.id, kind="background_submit_to_chain",
+            arguments=json.dumps({"args": [product.creator_id, operator_name, chain_data_str, quantity_int],
+                                  "kwargs": {}}, ensure_ascii=False),
+            status=ChainOperationStatus.FAILED, attempts=1, baseline_record_count=0,
+            next_retry_at=now
+        ))
+        db.commit()
+        tracked += 1
+    return tracked
+
+
+def _claim_operation(db: Session, op_id: int) -> bool:
+    """认领到期的失败操作（FAILED -> RUNNING），已被其他 worker 认领或状态已变化时返回 False"""
+    claimed = db.query(ChainOperation).filter(
+        ChainOperation.id == op_id, ChainOperation.status == ChainOperationStatus.FAILED
+    ).update({ChainOperation.status: ChainOperationStatus.RUNNING}, synchronize_session=False)
+    db.commit()
+    return claimed == 1
+
+
+def _release_operation(db: Session, op: ChainOperation, error: str):
+    """未执行即放弃本轮：退回失败状态，按退避时间推迟下次重试"""
+    op.status = ChainOperationStatus.FAILED
+    op.last_error = error
+    op.next_retry_at = datetime.now() + _backoff(max(op.attempts, 1))
+    db.commit()
+
+
+def _reconcile_operation(db: Session, op: ChainOperation) -> str:
+    """处理一个已认领的失败操作，返回结果类别"""
+    product = db.query(Product).filter(Product.id == op.product_id).first()
+    if not product or product.status not in (ProductStatus.CHAIN_FAILED, ProductStatus.PENDING_CHAIN):
+        op.status = ChainOperationStatus.SUPERSEDED
+        db.commit()
+        return "superseded"
+
+    if op.attempts >= settings.CHAIN_RETRY_MAX_ATTEMPTS:
+        op.status = ChainOperationStatus.ABANDONED
+        db.commit()
+        print(f"⚠️ 产品 {product.id} 的上链操作 {op.kind} 已重试 {op.attempts} 次仍失败，需人工处理")
+        return "abandoned"
+
+    func = _writers.get(op.kind)
+    if func is None:
+        # 未注册的任务（如已下线的后台任务）无法重试，直接放弃并告警
+        op.status = ChainOperationStatus.ABANDONED
+        op.last_error = f"unknown kind: {op.kind}"[:500]
+        db.commit()
+        print(f"⚠️ 产品 {product.id} 的上链操作 {op.kind} 无对应后台任务，需人工处理")
+        return "unknown_kind"
+
+    count = blockchain_client.get_record_count_rpc(product.trace_code) if product.trace_code else 0
+    if count is None:
+        # 链不可达，退避后再试
+        _release_operation(db, op, "chain unavailable")
+        return "chain_unavailable"
+    landed = max(count - op.baseline_record_count, 0) if op.baseline_record_count is not None else 0
+    adopted = _adopted_results(op, landed) if landed else []
+
+    product.status = ProductStatus.PENDING_CHAIN
+    db.commit()
+
+    arguments = json.loads(op.arguments or "{}")
+    success = _execute(op.id, func, op.product_id, tuple(arguments.get("args", [])),
+                       arguments.get("kwargs", {}), adopted)
+    if not success:
+        return "retry_failed"
+    return "adopted" if adopted else "retried"
+
+
+def _report_stuck(db: Session):
+    """上报卡住的产品与操作数"""
+    now = datetime.now()
+    stale_before = now - timedelta(seconds=settings.CHAIN_STALE_SECONDS)
+
+    for status in ChainOperationStatus:
+        if status in (ChainOperationStatus.SUCCEEDED, ChainOperationStatus.SUPERSEDED):
+            continue
+        count = db.query(func.count(ChainOperation.id)).filter(ChainOperation.status == status).scalar()
+        metrics.set_gauge("chain_operations_open", count, status=status.value)
+
+    failed = db.query(func.count(Product.id), func.min(Product.updated_at)).filter(
+        Product.status == ProductStatus.CHAIN_FAILED
+    ).one()
+    pending = db.query(func.count(Product.id), func.min(Product.updated_at)).filter(
+        Product.status == ProductStatus.PENDING_CHAIN, Product.updated_at < stale_before
+    ).one()
+    metrics.set_gauge("chain_stuck_products", failed[0], state="chain_failed")
+    metrics.set_gauge("chain_stuck_products", pending[0], state="pending_stale")
+
+    oldest = min([t for t in (failed[1], pending[1]) if t], default=None)
+    metrics.set_gauge("chain_stuck_oldest_seconds", (now - oldest).total_seconds() if oldest else 0)
+
+
+def reconcile_once(db: Session, limit: int = None) -> Dict[str, int]:
+    """
+    执行一轮对账
+
+    Returns:
+        结果类别 -> 操作数
+    """
+    limit = limit or settings.CHAIN_RECONCILE_BATCH_SIZE
+    now = datetime.now()
+    outcomes: Dict[str, int] = {}
+
+    # 执行中但长时间未更新: 进程中断，转为失败立即重试
+    stale = db.query(ChainOperation).filter(
+        ChainOperation.status == ChainOperationStatus.RUNNING,
+        ChainOperation.updated_at < now - timedelta(seconds=settings.CHAIN_STALE_SECONDS)
+    ).all()
+    for op in stale:
+        op.status = ChainOperationStatus.FAILED
+        op.last_error = "interrupted"
+        op.next_retry_at = now
+    db.commit()
+    if stale:
+        outcomes["interrupted"] = len(stale)
+
+    tracked = _track_untracked_submissions(db, limit, now)
+    if tracked:
+        outcomes["tracked"] = tracked
+
+    due = db.query(ChainOperation).filter(
+        ChainOperation.status == ChainOperationStatus.FAILED,
+        ChainOperation.next_retry_at <= now
+    ).order_by(ChainOperation.next_retry_at.asc()).limit(limit).all()
+    for op in due:
+        # 认领后执行中断的操作停留在执行中，超过 CHAIN_STALE_SECONDS 后按中断处理
+        if not _claim_operation(db, op.id):
+            outcomes["claimed_elsewhere"] = outcomes.get("claimed_elsewhere", 0) + 1
+            continue
+        db.refresh(op)
+        outcome = _reconcile_operation(db, op)
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        metrics.inc("chain_reconcile_total", outcome=outcome)
+
+    _report_stuck(db)
+    return outcomes
+
+
+def _reconcile_job():
+    """单次对账任务（在线程池中执行）"""
+    db = _session()
+    try:
+        outcomes = reconcile_once(db)
+        if outcomes:
+            print(f"🔁 上链对账: {outcomes}")
+    except Exception as e:
+        print(f"❌ Chain reconcile error: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+async def reconcile_loop():
+    """后台定期对账（由应用 lifespan 启动）"""
+    while True:
+        await run_in_threadpool(_reconcile_job)
+        await asyncio.sleep(settings.CHAIN_RECONCILE_INTERVAL_SECONDS)
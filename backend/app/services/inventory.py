@@ -0,0 +1,94 @@
+"""
+库存流水服务
+入库/销售记录写入时同步追加库存流水，库存可用量与仓库通过一次查询得到
+"""
+from typing import List, Tuple
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session, aliased
+
+from app.models.product import Product, ProductRecord, ProductStage, RecordAction
+from app.models.inventory import InventoryMovement, MovementType
+
+# 流转动作 -> 库存流水类型
+RECORD_MOVEMENT_TYPES = {
+    RecordAction.STOCK_IN: MovementType.STOCK_IN,
+    RecordAction.SELL: MovementType.SELL,
+}
+
+
+def movement_from_record(record: ProductRecord) -> InventoryMovement:
+    """根据入库/销售记录构造库存流水"""
+    return InventoryMovement(
+        product_id=record.product_id,
+        seller_id=record.operator_id,
+        movement_type=RECORD_MOVEMENT_TYPES[record.action],
+        quantity=record.quantity or 0,
+        warehouse=record.warehouse,
+        record=record
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _append_movements_before_flush(session, flush_context, instances):
+    """入库/销售记录与库存流水在同一次 flush 中写入"""
+    for obj in list(session.new):
+        if isinstance(obj, ProductRecord) and obj.action in RECORD_MOVEMENT_TYPES:
+            session.add(movement_from_record(obj))
+
+
+def query_inventory(db: Session, seller_id: int) -> List[Tuple]:
+    """
+    一次查询获取销售商库存（流水按 (product_id, movement_type) 索引只查销售商当前持有的产品）
+
+    Returns:
+        [(Product, warehouse, stock_in_time), ...]
+        已有销售（上架）流水的产品整批离开库存，不计入
+    """
+    sold = select(InventoryMovement.id).where(
+        InventoryMovement.product_id == Product.id,
+        InventoryMovement.movement_type == MovementType.SELL
+    ).exists()
+    first_stock_in_id = select(func.min(InventoryMovement.id)).where(
+        InventoryMovement.product_id == Product.id,
+        InventoryMovement.movement_type == MovementType.STOCK_IN
+    ).correlate(Product).scalar_subquery()
+    stock_in = aliased(InventoryMovement)
+
+    return db.query(
+        Product,
+        stock_in.warehouse,
+        stock_in.created_at,
+    ).outerjoin(
+        stock_in, stock_in.id == first_stock_in_id
+    ).filter(
+        Product.current_stage == ProductStage.SELLER,
+        Product.current_holder_id == seller_id,
+        ~sold
+    ).all()
+
+
+def backfill_inventory_ledger(db: Session) -> int:
+    """
+    为历史入库/销售记录补写库存流水
+
+    Returns:
+        新增流水数量
+    """
+    existing = select(InventoryMovement.record_id).where(InventoryMovement.record_id.isnot(None))
+    records = db.query(ProductRecord).filter(
+        ProductRecord.action.in_(list(RECORD_MOVEMENT_TYPES)),
+        ~ProductRecord.id.in_(existing)
+    ).order_by(ProductRecord.id.asc()).all()
+
+    # 批量插入流水
+    db.bulk_save_objects([
+        InventoryMovement(
+            product_id=r.product_id, seller_id=r.operator_id,
+            movement_type=RECORD_MOVEMENT_TYPES[r.action], quantity=r.quantity or 0,
+            warehouse=r.warehouse, record_id=r.id, created_at=r.created_at
+        )
+        for r in records
+    ])
+    db.commit()
+    return len(records)
@@ -0,0 +1,122 @@
+"""
+进程内指标注册表
+计数器 / 仪表 / 耗时分布按名称与标签聚合，/api/metrics 输出快照；
+各服务也可注册采集函数，在输出快照时实时计算。
+"""
+import hmac
+from collections import defaultdict
+from threading import Lock
+from typing import Callable, Dict, Tuple
+
+from fastapi import Request
+
+from app.config import settings
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+FORWARDED_HEADERS = ("x-forwarded-for", "x-real-ip", "forwarded")
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _label_str(key: LabelKey) -> str:
+    return ",".join(f"{k}={v}" for k, v in key)
+
+
+class _Summary:
+    """耗时分布: 次数 / 总和 / 最大值"""
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+        }
+
+
+class MetricsRegistry:
+    """线程安全的指标注册表"""
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[LabelKey, float]] = defaultdict(lambda: defaultdict(float))
+        self._gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self._summaries: Dict[str, Dict[LabelKey, _Summary]] = defaultdict(lambda: defaultdict(_Summary))
+        self._collectors: Dict[str, Callable[[], dict]] = {}
+        self._lock = Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """计数器自增"""
+        with self._lock:
+            self._counters[name][_label_key(labels)] += value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        """设置仪表值"""
+        with self._lock:
+            self._gauges[name][_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        """记录一次观测值（如耗时毫秒）"""
+        with self._lock:
+            self._summaries[name][_label_key(labels)].observe(value)
+
+    def register_collector(self, name: str, collector: Callable[[], dict]):
+        """注册快照时调用的采集函数"""
+        self._collectors[name] = collector
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {
+                "counters": {
+                    name: {_label_str(k) or "_": v for k, v in series.items()}
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: {_label_str(k) or "_": v for k, v in series.items()}
+                    for name, series in self._gauges.items()
+                },
+                "summaries": {
+                    name: {_label_str(k) or "_": s.to_dict() for k, s in series.items()}
+                    for name, series in self._summaries.items()
+                },
+            }
+        for name, collector in self._collectors.items():
+            try:
+                result[name] = collector()
+            except Exception as e:
+                result[name] = {"error": str(e)}
+        return result
+
+
+metrics = MetricsRegistry()
+
+
+def is_internal_request(request: Request) -> bool:
+    """
+    是否为内部请求（可查看运行指标）：
+    携带 METRICS_TOKEN，或来自 METRICS_ALLOWED_HOSTS 且未经反向代理转发
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        provided = request.headers.get("x-metrics-token", "")
+        authorization = request.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            provided = provided or authorization[len("bearer "):]
+        if provided and hmac.compare_digest(provided, token):
+            return True
+
+    # 经反向代理转发的请求来源地址为代理本机，不按来源地址放行
+    allowed_hosts = {host.strip() for host in settings.METRICS_ALLOWED_HOSTS.split(",") if host.strip()}
+    proxied = any(header in request.headers for header in FORWARDED_HEADERS)
+    return bool(request.client and request.client.host in allowed_hosts and not proxied)
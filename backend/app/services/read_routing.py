@@ -0,0 +1,170 @@
+"""
+读写分离路由
+只读接口（列表、统计、链上数据回退查询）按轮询分配到只读副本；
+用户发生写请求后记录主库复制位点（GTID），在副本追上该位点之前
+该用户的读请求固定走主库，保证写后读一致；请求触发的后台写入（上链任务）提交后重新记录位点。
+未配置副本时所有会话均来自主库。
+"""
+import itertools
+import time
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, Request
+from jose import jwt, JWTError
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.database import (
+    SessionLocal, AsyncSessionLocal, ReplicaSessionLocals, AsyncReplicaSessionLocals, engine, get_db
+)
+from app.services.user_directory import user_directory
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+def request_subject(request: Optional[Request]) -> Optional[str]:
+    """从 Authorization 头解析用户名（仅用于路由，不做鉴权）"""
+    if request is None:
+        return None
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        return None
+    return payload.get("sub")
+
+
+class ReplicaRouter:
+    """按复制位点在主库与只读副本之间选择会话"""
+
+    def __init__(self, replica_factories, pin_seconds: int = 30):
+        self.replica_factories = list(replica_factories)
+        self.pin_seconds = pin_seconds
+        self._next_replica = itertools.cycle(range(len(self.replica_factories)))
+        # 用户名 -> (写入时间, 写入后的主库 GTID 集合)
+        self._pins: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._lock = Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replica_factories)
+
+    def _pick_replica(self) -> int:
+        with self._lock:
+            return next(self._next_replica)
+
+    def primary_position(self) -> Optional[str]:
+        """读取主库当前已执行的 GTID 集合（非 MySQL 或未开启 GTID 时返回 None）"""
+        if engine.dialect.name != "mysql":
+            return None
+        try:
+            with engine.connect() as conn:
+                return conn.execute(text("SELECT @@GLOBAL.gtid_executed")).scalar() or None
+        except Exception as e:
+            print(f"⚠️ 读取主库复制位点失败: {e}")
+            return None
+
+    def record_write(self, subject: Optional[str]):
+        """记录用户写入时的主库位点"""
+        if not self.enabled or not subject:
+            return
+        position = self.primary_position()
+        with self._lock:
+            self._pins[subject] = (time.monotonic(), position)
+
+    def record_user_write(self, user_id: Optional[int]):
+        """后台写入（如上链任务）提交后按用户 ID 重新固定该用户的读请求"""
+        if not self.enabled or not user_id:
+            return
+        db = SessionLocal()
+        try:
+            info = user_directory.get_many(db, [user_id]).get(user_id)
+        finally:
+            db.close()
+        if info:
+            self.record_write(info.username)
+
+    def _pinned_position(self, subject: Optional[str]) -> Tuple[bool, Optional[str]]:
+        """返回 (是否仍在固定窗口内, 需要等待的位点)"""
+        if not subject:
+            return False, None
+        with self._lock:
+            pin = self._pins.get(subject)
+            if pin is None:
+                return False, None
+            written_at, position = pin
+            if time.monotonic() - written_at > self.pin_seconds:
+                self._pins.pop(subject, None)
+                return False, None
+        return True, position
+
+    @staticmethod
+    def _replica_caught_up(db: Session, position: str) -> bool:
+        """副本是否已应用指定 GTID 集合"""
+        return bool(db.execute(
+            text("SELECT GTID_SUBSET(:position, @@GLOBAL.gtid_executed)"), {"position": position}
+        ).scalar())
+
+    def open_session(self, subject: Optional[str] = None, primary: Optional[Session] = None) -> Session:
+        """
+        为读请求打开会话：副本可用且已追上该用户的写入位点时走副本，否则走主库
+
+        Args:
+            primary: 请求已持有的主库会话，需要走主库时直接复用（同一请求不占用两个主库连接）
+        """
+        if not self.enabled:
+            return primary or SessionLocal()
+
+        pinned, position = self._pinned_position(subject)
+        if pinned and position is None:
+            # 无法比较位点时，固定窗口内一律走主库
+            return primary or SessionLocal()
+
+        db = self.replica_factories[self._pick_replica()]()
+        if not pinned:
+            return db
+        try:
+            if self._replica_caught_up(db, position):
+                with self._lock:
+                    self._pins.pop(subject, None)
+                return db
+        except Exception as e:
+            print(f"⚠️ 副本位点检查失败，回退主库: {e}")
+        db.close()
+        return primary or SessionLocal()
+
+
+replica_router = ReplicaRouter(ReplicaSessionLocals, pin_seconds=settings.REPLICA_PIN_SECONDS)
+_next_async_replica = itertools.cycle(AsyncReplicaSessionLocals or [AsyncSessionLocal])
+
+
+def get_read_db(request: Request, primary: Session = Depends(get_db)):
+    """Dependency for read-only database session (replica when possible, otherwise the request's primary session)"""
+    db = replica_router.open_session(request_subject(request), primary)
+    try:
+        yield db
+    finally:
+        if db is not primary:
+            db.close()
+
+
+async def get_async_read_db():
+    """Dependency for public read-only async session (no read-your-writes pinning)"""
+    async with next(_next_async_replica)() as db:
+        yield db
+
+
+async def pin_writes_middleware(request: Request, call_next):
+    """写请求成功后将该用户的读请求暂时固定到主库"""
+    response = await call_next(request)
+    if replica_router.enabled and request.method not in SAFE_METHODS and response.status_code < 400:
+        subject = request_subject(request)
+        if subject:
+            # 位点查询是阻塞 IO，放到线程池
+            await run_in_threadpool(replica_router.record_write, subject)
+    return response
@@ -0,0 +1,152 @@
+"""
+流转记录归档服务
+已售出（有销售记录）或已作废、且超过保留期的产品，其流转记录整体迁移到
+压缩归档表，热表 product_records 只保留流转中的产品。
+历史查询通过 query_history / product_history 对热表与归档表分别执行带过滤条件的查询后合并
+（不使用 UNION 派生表：MySQL 8.0.29 之前不会把过滤条件下推进派生表，每次都会物化两张全表）。
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+
+from sqlalchemy import select, insert, update, delete, or_, and_
+from sqlalchemy.orm import Query, Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.product import Product, ProductRecord, ProductStatus, RecordAction
+from app.models.archive import ProductRecordArchive
+from app.models.inventory import InventoryMovement
+
+RECORD_COLUMNS = [column.name for column in ProductRecord.__table__.columns]
+
+# 历史查询的两张表（列与 ProductRecord 一致，查询结果可按 ProductRecord 的字段读取）
+RECORD_MODELS = (ProductRecord, ProductRecordArchive)
+
+
+def query_history(build: Callable[[type], Query]) -> list:
+    """
+    分别对热表与归档表执行 build(模型) 构造的查询并合并结果（各自使用本表索引）
+
+    用法: query_history(lambda R: db.query(R).filter(R.operator_id == uid, R.action == RecordAction.SELL))
+    """
+    return [row for model in RECORD_MODELS for row in build(model).all()]
+
+
+def record_order(record) -> tuple:
+    """流转记录排序键（时间、ID）"""
+    return record.created_at or datetime.min, record.id
+
+
+def product_history(db: Session, product_id: int) -> list:
+    """
+    单个产品的全部流转记录（按时间顺序）
+
+    先查热表：归档按产品整体迁移（含创建记录），热表中有创建记录说明该产品未归档，
+    不再查归档表；否则（已归档，或归档后又追加了记录）合并归档表中的记录
+    """
+    def ordered(model):
+        return db.query(model).filter(
+            model.product_id == product_id
+        ).order_by(model.created_at.asc(), model.id.asc()).all()
+
+    records = ordered(ProductRecord)
+    if any(record.action == RecordAction.CREATE for record in records):
+        return records
+    archived = ordered(ProductRecordArchive)
+    return sorted(archived + records, key=record_order) if archived and records else archived or records
+
+
+def find_archivable_products(db: Session, cutoff: datetime, limit: int) -> List[int]:
+    """查找可归档的产品 ID：销售记录或作废时间早于 cutoff，且热表中仍有记录"""
+    sold_before_cutoff = select(ProductRecord.product_id).where(
+        ProductRecord.action == RecordAction.SELL,
+        ProductRecord.created_at < cutoff
+    )
+    has_hot_records = select(ProductRecord.product_id).where(ProductRecord.product_id == Product.id).exists()
+
+    rows = db.query(Product.id).filter(
+        or_(
+            Product.id.in_(sold_before_cutoff),
+            and_(Product.status == ProductStatus.INVALIDATED, Product.invalidated_at < cutoff)
+        ),
+        has_hot_records
+    ).order_by(Product.id.asc()).limit(limit).all()
+    return [row[0] for row in rows]
+
+
+def archive_products(db: Session, product_ids: List[int]) -> int:
+    """
+    将指定产品的全部流转记录迁移到归档表（单事务）
+
+    Returns:
+        迁移的记录数
+    """
+    if not product_ids:
+        return 0
+
+    hot = ProductRecord.__table__
+    archive = ProductRecordArchive.__table__
+    in_batch = hot.c.product_id.in_(product_ids)
+    record_ids = select(hot.c.id).where(in_batch)
+
+    try:
+        db.execute(insert(archive).from_select(
+            RECORD_COLUMNS, select(*[hot.c[name] for name in RECORD_COLUMNS]).where(in_batch)
+        ))
+        # 解除库存流水与修正链对热表记录的引用后再删除
+        db.execute(
+            update(InventoryMovement.__table__)
+            .where(InventoryMovement.__table__.c.record_id.in_(record_ids))
+            .values(record_id=None)
+        )
+        db.execute(update(hot).where(in_batch).values(previous_record_id=None))
+        moved = db.execute(delete(hot).where(in_batch)).rowcount
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return moved
+
+
+def run_archive(db: Session, older_than_days: int = None, batch_size: int = None) -> Tuple[int, int]:
+    """
+    分批归档全部满足条件的产品
+
+    Returns:
+        (归档产品数, 迁移记录数)
+    """
+    older_than_days = settings.ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    cutoff = datetime.now() - timedelta(days=older_than_days)
+
+    total_products, total_records = 0, 0
+    while True:
+        product_ids = find_archivable_products(db, cutoff, batch_size)
+        if not product_ids:
+            break
+        total_records += archive_products(db, product_ids)
+        total_products += len(product_ids)
+    return total_products, total_records
+
+
+def _archive_job():
+    """单次归档任务（在线程池中执行）"""
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        products, records = run_archive(db)
+        if products:
+            print(f"📦 已归档 {products} 个产品的 {records} 条流转记录")
+    except Exception as e:
+        print(f"❌ Record archive error: {e}")
+    finally:
+        db.close()
+
+
+async def archive_loop():
+    """后台定期归档（由应用 lifespan 启动）"""
+    while True:
+        await run_in_threadpool(_archive_job)
+        await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
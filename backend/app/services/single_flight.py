@@ -0,0 +1,139 @@
+"""
+请求合并（single-flight）
+同一 key 的并发调用只执行一次，其余调用等待并共享结果（或异常）；
+执行结束即移除，不做缓存。等待者拿到结果的深拷贝，避免调用方修改共享对象。
+
+- AsyncSingleFlight: 协程版（接口层、AI 调用），等待者不占用线程；
+  请求方断开只取消自己的等待，不影响共享的执行
+- AsyncStreamFlight: 流式版（AI 流式生成），后加入者先收到已产出的片段再跟随后续片段；
+  全部订阅者断开时才取消上游
+"""
+import asyncio
+import copy
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable
+
+from app.services.metrics import metrics
+
+
+def _record_waiters(group: str, waiters: int):
+    if waiters:
+        metrics.observe("single_flight_waiters", waiters, group=group)
+
+
+class AsyncSingleFlight:
+    """协程版请求合并（同一事件循环内）"""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[Hashable, list] = {}  # key -> [task, 等待者数]
+
+    def in_flight(self, key: Hashable) -> bool:
+        return (id(asyncio.get_running_loop()), key) in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        # 任务只能在创建它的事件循环中等待
+        key = (id(asyncio.get_running_loop()), key)
+        entry = self._calls.get(key)
+        if entry is not None:
+            entry[1] += 1
+            metrics.inc("single_flight_coalesced_total", group=self.group)
+            return copy.deepcopy(await asyncio.shield(entry[0]))
+
+        task = asyncio.ensure_future(fn(*args, **kwargs))
+        entry = self._calls[key] = [task, 0]
+        task.add_done_callback(lambda t: self._finish(key, entry))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, entry: list):
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+        task = entry[0]
+        if not task.cancelled():
+            task.exception()  # 所有请求方都已断开时避免“异常未被获取”告警
+        _record_waiters(self.group, entry[1])
+
+
+class _Stream:
+    """一次共享的流式执行：上游片段依次追加到 parts，订阅者各自按位置读取"""
+    __slots__ = ("parts", "done", "error", "subscribers", "waiters", "task", "_changed")
+
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.waiters = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def read(self) -> AsyncIterator[Any]:
+        position = 0
+        while True:
+            # 先取当前事件再读片段，读完之后追加的片段会唤醒等待
+            changed = self._changed
+            while position < len(self.parts):
+                yield self.parts[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await changed.wait()
+
+
+class AsyncStreamFlight:
+    """协程版流式请求合并（同一事件循环内）"""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._streams: Dict[Hashable, _Stream] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return (id(asyncio.get_running_loop()), key) in self._streams
+
+    async def stream(self, key: Hashable, fn: Callable[..., AsyncIterator[Any]], *args, **kwargs) -> AsyncIterator[Any]:
+        """
+        fn 为异步生成器函数，同一 key 只执行一次；片段不做拷贝（应为不可变对象，如文本）
+        上游在 fn 最后一个片段之后的收尾（如写缓存）完成后才结束各订阅者的迭代
+        """
+        key = (id(asyncio.get_running_loop()), key)
+        stream = self._streams.get(key)
+        if stream is None:
+            stream = self._streams[key] = _Stream()
+            stream.task = asyncio.ensure_future(self._run(key, stream, fn(*args, **kwargs)))
+        else:
+            stream.waiters += 1
+            metrics.inc("single_flight_coalesced_total", group=self.group)
+
+        stream.subscribers += 1
+        try:
+            async for part in stream.read():
+                yield part
+        finally:
+            stream.subscribers -= 1
+            if not stream.subscribers and not stream.done:
+                # 所有订阅者都已断开：取消上游，之后的请求重新发起
+                if self._streams.get(key) is stream:
+                    del self._streams[key]
+                stream.task.cancel()
+
+    async def _run(self, key: Hashable, stream: _Stream, upstream: AsyncIterator[Any]):
+        try:
+            async for part in upstream:
+                stream.parts.append(part)
+                stream.notify()
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            stream.error = e
+        finally:
+            await upstream.aclose()
+            if self._streams.get(key) is stream:
+                del self._streams[key]
+            stream.done = True
+            stream.notify()
+            _record_waiters(self.group, stream.waiters)
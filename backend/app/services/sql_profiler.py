@@ -0,0 +1,193 @@
+"""
+SQL 性能分析
+通过引擎游标事件统计每个请求的查询次数与数据库耗时，按去参数的语句指纹聚合，
+记录慢查询（附来源路由），并在单个请求内同一指纹重复执行过多时标记 N+1。
+"""
+import re
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextvars import ContextVar
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, Optional
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.routing import Match
+
+from app.config import settings
+from app.services.metrics import is_internal_request, metrics
+
+BACKGROUND_ROUTE = "background"
+MAX_FINGERPRINTS = 500  # 指纹聚合表上限（按最近使用淘汰）
+SLOW_QUERY_HISTORY = 100  # 保留的最近慢查询条数
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|:\w+|__\[POSTCOMPILE_\w+\])(?:\s*,\s*(?:\?|%s|:\w+))*\s*\)")
+_PLACEHOLDER = re.compile(r"%s|:\w+|%\(\w+\)s")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """去除参数与字面量的语句指纹，IN 列表折叠为 (?+)"""
+    text = _STRING_LITERAL.sub("?", statement)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _PLACEHOLDER_LIST.sub("(?+)", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class RequestProfile:
+    """单个请求内的 SQL 统计"""
+    __slots__ = ("route", "query_count", "db_time_ms", "fingerprints", "closed")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.query_count = 0
+        self.db_time_ms = 0.0
+        self.fingerprints: Dict[str, int] = defaultdict(int)
+        self.closed = False
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("sql_request_profile", default=None)
+
+
+class _FingerprintStats:
+    __slots__ = ("count", "total_ms", "max_ms", "routes")
+
+    def __init__(self):
+        self.count, self.total_ms, self.max_ms = 0, 0.0, 0.0
+        self.routes = set()
+
+
+class SQLProfiler:
+    """全局 SQL 聚合统计"""
+
+    def __init__(self):
+        self._fingerprints: "OrderedDict[str, _FingerprintStats]" = OrderedDict()
+        self._slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+        self._n_plus_one: Dict[tuple, dict] = {}
+        self._lock = Lock()
+
+    def record_query(self, statement: str, elapsed_ms: float):
+        profile = _current_profile.get()
+        if profile is not None and not profile.closed:
+            route = profile.route
+        else:
+            profile, route = None, BACKGROUND_ROUTE
+        key = fingerprint(statement)
+
+        if profile is not None:
+            profile.query_count += 1
+            profile.db_time_ms += elapsed_ms
+            profile.fingerprints[key] += 1
+
+        with self._lock:
+            stats = self._fingerprints.get(key)
+            if stats is None:
+                stats = self._fingerprints[key] = _FingerprintStats()
+                if len(self._fingerprints) > MAX_FINGERPRINTS:
+                    self._fingerprints.popitem(last=False)
+            else:
+                self._fingerprints.move_to_end(key)
+            stats.count += 1
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms)
+            stats.routes.add(route)
+
+        if elapsed_ms >= settings.SLOW_QUERY_MS:
+            metrics.inc("sql_slow_queries_total", route=route)
+            with self._lock:
+                self._slow_queries.append({
+                    "route": route,
+                    "elapsed_ms": round(elapsed_ms, 2),
+                    "fingerprint": key,
+                    "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            print(f"🐢 慢查询 {elapsed_ms:.1f}ms [{route}] {key[:300]}")
+
+    def finish_request(self, profile: RequestProfile):
+        """请求结束: 记录路由聚合并检测 N+1"""
+        profile.closed = True
+        metrics.observe("sql_queries_per_request", profile.query_count, route=profile.route)
+        metrics.observe("sql_time_ms_per_request", profile.db_time_ms, route=profile.route)
+
+        for key, count in profile.fingerprints.items():
+            if count < settings.N_PLUS_ONE_THRESHOLD:
+                continue
+            metrics.inc("sql_n_plus_one_total", route=profile.route)
+            with self._lock:
+                flagged = self._n_plus_one.setdefault((profile.route, key), {
+                    "route": profile.route, "fingerprint": key, "occurrences": 0, "max_repeats": 0
+                })
+                flagged["occurrences"] += 1
+                flagged["max_repeats"] = max(flagged["max_repeats"], count)
+            print(f"⚠️ 疑似 N+1 查询 [{profile.route}] 同一语句执行 {count} 次: {key[:200]}")
+
+    def snapshot(self, top: int = 20) -> dict:
+        with self._lock:
+            fingerprints = sorted(self._fingerprints.items(), key=lambda item: item[1].total_ms, reverse=True)
+            return {
+                "slow_query_ms": settings.SLOW_QUERY_MS,
+                "top_statements": [
+                    {
+                        "fingerprint": key,
+                        "count": stats.count,
+                        "total_ms": round(stats.total_ms, 2),
+                        "avg_ms": round(stats.total_ms / stats.count, 3),
+                        "max_ms": round(stats.max_ms, 2),
+                        "routes": sorted(stats.routes),
+                    }
+                    for key, stats in fingerprints[:top]
+                ],
+                "slow_queries": list(self._slow_queries),
+                "n_plus_one": sorted(self._n_plus_one.values(), key=lambda item: item["max_repeats"], reverse=True),
+            }
+
+
+sql_profiler = SQLProfiler()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start_time")
+    if not starts:
+        return
+    elapsed_ms = (time.perf_counter() - starts.pop()) * 1000
+    sql_profiler.record_query(statement, elapsed_ms)
+
+
+def _route_template(request: Request) -> str:
+    """请求对应的路由路径模板（如 /api/producer/products/{product_id}），避免按 ID 分散统计"""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return request.url.path
+
+
+async def profile_requests_middleware(request: Request, call_next):
+    """
+    为每个请求建立 SQL 统计上下文；开启 SQL_PROFILE_HEADERS 或内部请求（同 /api/metrics 访问控制）时
+    在响应头中返回查询次数与数据库耗时
+    """
+    profile = RequestProfile(f"{request.method} {_route_template(request)}")
+    token = _current_profile.set(profile)
+    try:
+        response = await call_next(request)
+    finally:
+        _current_profile.reset(token)
+    sql_profiler.finish_request(profile)
+
+    if settings.SQL_PROFILE_HEADERS or is_internal_request(request):
+        response.headers["X-DB-Query-Count"] = str(profile.query_count)
+        response.headers["X-DB-Time-Ms"] = f"{profile.db_time_ms:.1f}"
+    return response
@@ -0,0 +1,289 @@
+"""
+用户统计计数服务
+在 Session flush 前根据产品/记录的变化增量更新 user_statistics，
+与业务写入处于同一事务；各角色 /statistics 接口直接读取计数行。
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, select, func, case, update, or_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import instance_dict
+
+from app.models.user import User
+from app.models.product import Product, ProductRecord, ProductStatus, ProductStage, RecordAction
+from app.models.statistics import UserStatistics
+from app.services.record_archive import RECORD_MODELS, query_history
+
+COUNTER_FIELDS = (
+    "product_total", "product_draft", "product_on_chain",
+    "processing_count", "inspecting_count", "inventory_count",
+    "inspected_count", "qualified_count", "sold_count", "sold_quantity",
+)
+
+# 持有阶段 -> 计数字段
+HOLDER_STAGE_FIELDS = {
+    ProductStage.PROCESSOR: "processing_count",
+    ProductStage.INSPECTOR: "inspecting_count",
+    ProductStage.SELLER: "inventory_count",
+}
+
+_STATE_ATTRS = ("creator_id", "status", "current_stage", "current_holder_id")
+
+
+def _product_keys(state: Optional[dict], sold: bool) -> List[Tuple[int, str]]:
+    """产品当前状态对应的 (user_id, 计数字段) 列表"""
+    if not state:
+        return []
+    keys = []
+    creator_id = state.get("creator_id")
+    if creator_id:
+        keys.append((creator_id, "product_total"))
+        if state.get("status") == ProductStatus.DRAFT:
+            keys.append((creator_id, "product_draft"))
+        elif state.get("status") == ProductStatus.ON_CHAIN:
+            keys.append((creator_id, "product_on_chain"))
+
+    holder_id = state.get("current_holder_id")
+    field = HOLDER_STAGE_FIELDS.get(state.get("current_stage"))
+    if holder_id and field:
+        # 已有销售记录的产品不再计入库存
+        if not (field == "inventory_count" and sold):
+            keys.append((holder_id, field))
+    return keys
+
+
+def _state_changed(product: Product) -> bool:
+    """产品的创建者/状态/阶段/持有者是否有未 flush 的修改"""
+    attrs = sa_inspect(product).attrs
+    return any(attrs[attr].history.has_changes() for attr in _STATE_ATTRS)
+
+
+def _load_persisted_state(session: Session, product_ids: Iterable[int]) -> Tuple[Dict[int, dict], set]:
+    """读取 flush 前数据库中的产品状态及已售产品集合"""
+    product_ids = [pid for pid in product_ids if pid]
+    if not product_ids:
+        return {}, set()
+
+    conn = session.connection()
+    rows = conn.execute(
+        select(Product.id, *[getattr(Product, attr) for attr in _STATE_ATTRS])
+        .where(Product.id.in_(product_ids))
+    ).all()
+    states = {row[0]: dict(zip(_STATE_ATTRS, row[1:])) for row in rows}
+
+    sold_rows = conn.execute(
+        select(ProductRecord.product_id).where(
+            ProductRecord.product_id.in_(product_ids),
+            ProductRecord.action == RecordAction.SELL
+        ).distinct()
+    ).all()
+    return states, {row[0] for row in sold_rows}
+
+
+def _collect_deltas(session: Session) -> Dict[int, Dict[str, float]]:
+    """根据本次 flush 的新增/修改/删除对象计算计数增量"""
+    new_products = [o for o in session.new if isinstance(o, Product)]
+    dirty_products = [o for o in session.dirty if isinstance(o, Product) and _state_changed(o)]
+    deleted_products = [o for o in session.deleted if isinstance(o, Product)]
+    new_records = [o for o in session.new if isinstance(o, ProductRecord)]
+
+    if not (new_products or dirty_products or deleted_products or new_records):
+        return {}
+
+    sell_product_ids = {r.product_id for r in new_records if r.action == RecordAction.SELL}
+    persisted_ids = {p.id for p in dirty_products + deleted_products} | sell_product_ids
+    old_states, old_sold = _load_persisted_state(session, persisted_ids)
+
+    new_states: Dict[int, Optional[dict]] = {}
+    for product in dirty_products:
+        state = dict(old_states.get(product.id, {}))
+        values = instance_dict(product)
+        state.update({attr: values[attr] for attr in _STATE_ATTRS if attr in values})
+        new_states[product.id] = state
+    for product in deleted_products:
+        new_states[product.id] = None
+
+    deltas: Dict[int, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    for product_id in persisted_ids:
+        if product_id not in old_states:
+            continue
+        was_sold = product_id in old_sold
+        new_state = new_states.get(product_id, old_states[product_id])
+        for user_id, field in _product_keys(old_states[product_id], was_sold):
+            deltas[user_id][field] -= 1
+        for user_id, field in _product_keys(new_state, was_sold or product_id in sell_product_ids):
+            deltas[user_id][field] += 1
+
+    for product in new_products:
+        values = instance_dict(product)
+        state = {
+            "creator_id": values.get("creator_id"),
+            "status": values.get("status") or ProductStatus.DRAFT,
+            "current_stage": values.get("current_stage") or ProductStage.PRODUCER,
+            "current_holder_id": values.get("current_holder_id"),
+        }
+        for user_id, field in _product_keys(state, False):
+            deltas[user_id][field] += 1
+
+    for record in new_records:
+        if not record.operator_id:
+            continue
+        if record.action == RecordAction.INSPECT:
+            deltas[record.operator_id]["inspected_count"] += 1
+            if record.qualified:
+                deltas[record.operator_id]["qualified_count"] += 1
+        elif record.action == RecordAction.SELL:
+            deltas[record.operator_id]["sold_count"] += 1
+            deltas[record.operator_id]["sold_quantity"] += record.quantity or 0
+
+    return deltas
+
+
+def _insert_zero_row(session: Session, user_id: int) -> bool:
+    """
+    以忽略主键冲突的方式插入全零统计行（并发事务可能同时为同一用户首次创建）
+
+    Returns:
+        当前数据库是否支持该写法；不支持时由调用方按 ORM 方式创建
+    """
+    values = dict(user_id=user_id, **{field: 0 for field in COUNTER_FIELDS})
+    dialect = session.get_bind().dialect.name
+    if dialect == "mysql":
+        stmt = mysql_insert(UserStatistics.__table__).values(**values).prefix_with("IGNORE")
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(UserStatistics.__table__).values(**values).on_conflict_do_nothing()
+    else:
+        return False
+    session.execute(stmt)
+    return True
+
+
+def _apply_deltas(session: Session, deltas: Dict[int, Dict[str, float]]):
+    """将增量写入统计行（不存在则创建）"""
+    for user_id, changes in deltas.items():
+        changes = {field: value for field, value in changes.items() if value}
+        if not user_id or not changes:
+            continue
+
+        stats = session.get(UserStatistics, user_id)
+        if stats is None and _insert_zero_row(session, user_id):
+            stats = session.get(UserStatistics, user_id)
+            if stats is None:
+                # 可重复读快照中看不到并发事务刚创建的行，直接按主键自增
+                table = UserStatistics.__table__
+                session.execute(update(table).where(table.c.user_id == user_id).values(
+                    **{field: table.c[field] + value for field, value in changes.items()}
+                ))
+                continue
+
+        if stats is None:
+            stats = UserStatistics(user_id=user_id, **{field: 0 for field in COUNTER_FIELDS})
+            for field, value in changes.items():
+                setattr(stats, field, value)
+            session.add(stats)
+        else:
+            # 使用 SQL 表达式自增，避免并发写入覆盖
+            for field, value in changes.items():
+                setattr(stats, field, getattr(UserStatistics, field) + value)
+
+
+def increment_statistics(db: Session, deltas: Dict[int, Dict[str, float]]):
+    """
+    手动累加统计计数
+
+    用于绕过 ORM 的批量写入（insert().values() 不会触发 flush 钩子），需与写入在同一事务中调用
+    """
+    _apply_deltas(db, deltas)
+
+
+@event.listens_for(Session, "before_flush")
+def _update_statistics_before_flush(session, flush_context, instances):
+    """flush 前同步更新统计计数"""
+    deltas = _collect_deltas(session)
+    if deltas:
+        _apply_deltas(session, deltas)
+
+
+def get_user_statistics(db: Session, user_id: int) -> UserStatistics:
+    """读取用户统计行，不存在时返回全零计数"""
+    stats = db.get(UserStatistics, user_id)
+    if stats is None:
+        stats = UserStatistics(user_id=user_id, **{field: 0 for field in COUNTER_FIELDS})
+    return stats
+
+
+def rebuild_statistics(db: Session) -> int:
+    """
+    全量重建统计计数（用于回填或校正）
+
+    Returns:
+        重建的用户数量
+    """
+    totals: Dict[int, Dict[str, float]] = defaultdict(lambda: {field: 0 for field in COUNTER_FIELDS})
+
+    # 原料商: 按创建者、状态统计
+    creator_rows = db.query(
+        Product.creator_id,
+        func.count(Product.id),
+        func.sum(case((Product.status == ProductStatus.DRAFT, 1), else_=0)),
+        func.sum(case((Product.status == ProductStatus.ON_CHAIN, 1), else_=0)),
+    ).filter(Product.creator_id.isnot(None)).group_by(Product.creator_id).all()
+    for creator_id, total, draft, on_chain in creator_rows:
+        totals[creator_id].update(
+            product_total=total, product_draft=int(draft or 0), product_on_chain=int(on_chain or 0)
+        )
+
+    # 按持有者、阶段统计（销售阶段排除已有销售记录的产品）
+    has_sell_record = or_(*[
+        Product.id.in_(select(Record.product_id).where(Record.action == RecordAction.SELL))
+        for Record in RECORD_MODELS
+    ])
+    holder_rows = db.query(
+        Product.current_holder_id, Product.current_stage, func.count(Product.id)
+    ).filter(
+        Product.current_holder_id.isnot(None),
+        Product.current_stage.in_(list(HOLDER_STAGE_FIELDS)),
+        ~(has_sell_record & (Product.current_stage == ProductStage.SELLER))
+    ).group_by(Product.current_holder_id, Product.current_stage).all()
+    for holder_id, stage, count in holder_rows:
+        totals[holder_id][HOLDER_STAGE_FIELDS[stage]] = count
+
+    # 按操作人统计质检与销售记录（含归档记录）
+    def record_counts(Record):
+        is_inspect = Record.action == RecordAction.INSPECT
+        is_sell = Record.action == RecordAction.SELL
+        return db.query(
+            Record.operator_id,
+            func.sum(case((is_inspect, 1), else_=0)),
+            func.sum(case((is_inspect & (Record.qualified == True), 1), else_=0)),
+            func.sum(case((is_sell, 1), else_=0)),
+            func.sum(case((is_sell, func.coalesce(Record.quantity, 0)), else_=0)),
+        ).filter(
+            Record.operator_id.isnot(None),
+            Record.action.in_([RecordAction.INSPECT, RecordAction.SELL])
+        ).group_by(Record.operator_id)
+
+    # 热表与归档表分别聚合后相加
+    for operator_id, inspected, qualified, sold, sold_quantity in query_history(record_counts):
+        user_totals = totals[operator_id]
+        user_totals["inspected_count"] += int(inspected or 0)
+        user_totals["qualified_count"] += int(qualified or 0)
+        user_totals["sold_count"] += int(sold or 0)
+        user_totals["sold_quantity"] += float(sold_quantity or 0)
+
+    user_ids = [row[0] for row in db.query(User.id).all()]
+    existing = {s.user_id: s for s in db.query(UserStatistics).all()}
+    for user_id in user_ids:
+        stats = existing.get(user_id)
+        if stats is None:
+            stats = UserStatistics(user_id=user_id)
+            db.add(stats)
+        for field, value in totals[user_id].items():
+            setattr(stats, field, value)
+    db.commit()
+    return len(user_ids)
@@ -0,0 +1,277 @@
+"""
+AI 溯源简报提示词
+流转记录先压缩再写入提示词，长历史（反复修正、加工 / 质检返工循环）不会撑大提示词：
+
+- 同一环节（阶段 + 动作）多次出现时只保留最后一次，之前的次数与结果并入该行
+- 只保留影响结论的字段（去向、买家、质检结果、等级、工艺、产出、原因），过长文本截断
+- 按近似 token 数控制提示词预算：超出时先去掉中间记录的备注与细节，
+  仍超出再省略中间记录（保留首尾记录与创建 / 质检 / 销售 / 终止）
+"""
+import json
+import math
+import re
+from datetime import datetime
+from typing import List, Optional
+
+from app.config import settings
+
+# 链上记录的阶段 / 动作为合约枚举序号（AgriTrace.sol Stage / Action）
+CHAIN_STAGES = ("producer", "processor", "inspector", "seller", "sold")
+CHAIN_ACTIONS = ("create", "harvest", "receive", "process", "send_inspect", "inspect",
+                 "reject", "terminate", "stock_in", "sell", "amend")
+
+# 阶段和动作映射
+STAGE_NAMES = {
+    "producer": "原料种植",
+    "processor": "加工生产",
+    "inspector": "质量检测",
+    "seller": "销售",
+    "sold": "已售出"
+}
+
+ACTION_NAMES = {
+    "create": "创建产品",
+    "harvest": "收获",
+    "receive": "接收原料",
+    "process": "加工处理",
+    "send_inspect": "送检",
+    "start_inspect": "开始检测",
+    "inspect": "质量检测",
+    "stock_in": "入库",
+    "sell": "销售",
+    "reject": "退回",
+    "terminate": "终止",
+    "amend": "修正"
+}
+
+# 影响结论的 data 字段及其写法
+DETAIL_FIELDS = (
+    ("warehouse", "{}"),
+    ("buyer_name", "买家: {}"),
+    ("inspect_result", "{}"),
+    ("quality_grade", "等级: {}"),
+    ("process_type", "工艺: {}"),
+    ("result_product", "产出: {}"),
+    ("reason", "原因: {}"),
+)
+
+KEY_ACTIONS = {"create", "inspect", "sell", "terminate"}  # 预算不足时也保留的记录
+MAX_TEXT_CHARS = 40  # 备注与字段值的最大长度
+MAX_EARLIER_RESULTS = 3  # 合并行中列出的此前结果数
+
+_CJK = re.compile(r"[　-〿一-鿿＀-￯]")
+_SPACE = re.compile(r"\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """近似 token 数：中文字符与全角标点每个按 1 个计，其余非空白字符每 4 个按 1 个计"""
+    cjk = len(_CJK.findall(text))
+    other = len(_SPACE.sub("", text)) - cjk
+    return cjk + math.ceil(other / 4)
+
+
+def _enum_name(value, names: tuple) -> str:
+    if isinstance(value, int):
+        return names[value] if 0 <= value < len(names) else str(value)
+    return value or ""
+
+
+def _format_time(value, fmt: str) -> str:
+    """格式化时间戳：链上为毫秒（block.timestamp），数据库快照为秒，大于 1e12 时按毫秒处理"""
+    if not value:
+        return ""
+    try:
+        ts = int(value)
+    except (TypeError, ValueError):
+        return ""
+    if ts > 1e12:
+        ts = ts / 1000
+    return datetime.fromtimestamp(ts).strftime(fmt)
+
+
+def _truncate(value, limit: Optional[int]) -> str:
+    text = str(value)
+    if limit and len(text) > limit:
+        return text[:limit] + "…"
+    return text
+
+
+def _parse_record(record: dict, limit: Optional[int]) -> dict:
+    """提取记录中用于简报的字段"""
+    data_str = record.get("data", "")
+    details = []
+    if data_str:
+        try:
+            data = json.loads(data_str) if isinstance(data_str, str) else data_str
+            for key, template in DETAIL_FIELDS:
+                if data.get(key):
+                    details.append(template.format(_truncate(data[key], limit)))
+        except (ValueError, TypeError, AttributeError):
+            pass
+
+    remark = record.get("remark", "")
+    return {
+        "stage": _enum_name(record.get("stage", ""), CHAIN_STAGES),
+        "action": _enum_name(record.get("action", ""), CHAIN_ACTIONS),
+        "time": _format_time(record.get("timestamp"), "%m月%d日 %H:%M"),
+        "operator": record.get("operatorName", ""),
+        "remark": _truncate(remark, limit) if remark else "",
+        "details": details,
+        "earlier": [],
+    }
+
+
+def compact_records(entries: List[dict]) -> List[dict]:
+    """同一环节（阶段 + 动作）只保留最后一次，之前的出现记入 earlier"""
+    last_index = {(entry["stage"], entry["action"]): i for i, entry in enumerate(entries)}
+    earlier = {}
+    compacted = []
+    for i, entry in enumerate(entries):
+        key = (entry["stage"], entry["action"])
+        if last_index[key] != i:
+            earlier.setdefault(key, []).append(entry)
+            continue
+        entry["earlier"] = earlier.pop(key, [])
+        compacted.append(entry)
+    return compacted
+
+
+def _render(entry: dict, brief: bool = False) -> str:
+    parts = [f"- {entry['time']}"] if entry["time"] else []
+    parts.append(STAGE_NAMES.get(entry["stage"], entry["stage"]))
+    action_name = ACTION_NAMES.get(entry["action"], entry["action"])
+    if action_name:
+        parts.append(action_name)
+    if entry["operator"]:
+        parts.append(f"({entry['operator']})")
+    if not brief:
+        if entry["remark"]:
+            parts.append(f": {entry['remark']}")
+        if entry["details"]:
+            parts.append("→ " + " → ".join(entry["details"]))
+
+    if entry["earlier"]:
+        note = f"（共 {len(entry['earlier']) + 1} 次"
+        results = []
+        for prior in entry["earlier"]:
+            # 只列出此前的结论字段（如质检结果），备注不计入
+            if prior["details"] and prior["details"][0] not in results:
+                results.append(prior["details"][0])
+        if results and not brief:
+            note += "，此前: " + "、".join(results[-MAX_EARLIER_RESULTS:])
+        parts.append(note + "）")
+    return " ".join(parts)
+
+
+def fit_budget(entries: List[dict], budget: int) -> List[str]:
+    """
+    将记录渲染为不超过 budget（近似 token）的行：
+    先把中间记录改为简略行，再从中间向两端省略记录
+    """
+    lines = [_render(entry) for entry in entries]
+    costs = [estimate_tokens(line) for line in lines]
+    total = sum(costs)
+    if total <= budget:
+        return lines
+
+    # 首尾与关键动作之外的记录，越靠中间越先处理
+    center = (len(entries) - 1) / 2
+    candidates = sorted(
+        (i for i, entry in enumerate(entries)
+         if 0 < i < len(entries) - 1 and entry["action"] not in KEY_ACTIONS),
+        key=lambda i: abs(i - center)
+    )
+    for i in candidates:
+        brief = _render(entries[i], brief=True)
+        total += estimate_tokens(brief) - costs[i]
+        lines[i], costs[i] = brief, estimate_tokens(brief)
+        if total <= budget:
+            return lines
+
+    omitted = set()
+    for i in candidates:
+        omitted.add(i)
+        total -= costs[i]
+        if total <= budget:
+            break
+
+    result, skipped = [], 0
+    for i, line in enumerate(lines):
+        if i in omitted:
+            skipped += 1
+            continue
+        if skipped:
+            result.append(f"- …（省略 {skipped} 条中间记录）")
+            skipped = 0
+        result.append(line)
+    return result
+
+
+def build_summary_prompt(trace_code: str, chain_data: dict, compact: bool = True,
+                         token_budget: Optional[int] = None) -> str:
+    """
+    构建 AI 简报生成的提示词
+
+    Args:
+        compact: 压缩流转记录（合并重复环节、截断长文本、控制 token 预算）；
+                 False 时逐条输出全部记录（用于对比）
+        token_budget: 流转记录部分的近似 token 上限，默认 AI_PROMPT_RECORD_TOKEN_BUDGET
+    """
+    if not chain_data:
+        return f"请为溯源码为 {trace_code} 的农产品生成一份溯源简报。"
+
+    product_info = chain_data.get("product_info", {})
+    records = chain_data.get("chain_records", [])
+
+    # 基本信息
+    name = product_info.get("name", "未知产品")
+    origin = product_info.get("origin", "未知产地")
+    category = product_info.get("category", "")
+    quantity = product_info.get("quantity", 0)
+    unit = product_info.get("unit", "")
+    created_at = product_info.get("createdAt")
+    record_count = product_info.get("recordCountNum", len(records))
+
+    # 格式化创建时间
+    create_time = _format_time(created_at, "%Y年%m月%d日") or "未知"
+
+    # 构建流程描述
+    entries = [_parse_record(record, MAX_TEXT_CHARS if compact else None) for record in records]
+    section = "【完整流转记录】"
+    if compact:
+        compacted = compact_records(entries)
+        if len(compacted) < len(entries):
+            section = "【流转记录（重复环节已合并）】"
+        budget = settings.AI_PROMPT_RECORD_TOKEN_BUDGET if token_budget is None else token_budget
+        process_details = fit_budget(compacted, budget)
+    else:
+        process_details = [_render(entry) for entry in entries]
+
+    process_text = "\n".join(process_details) if process_details else "暂无流转记录"
+
+    # 构建完整提示词
+    prompt = f"""你是一个农产品溯源专家。请根据以下产品的区块链溯源数据，生成一份简洁易懂的溯源简报。
+
+【产品基本信息】
+- 产品名称：{name}
+- 产品类别：{category}
+- 产地：{origin}
+- 数量：{quantity} {unit}
+- 溯源码：{trace_code}
+- 创建时间：{create_time}
+- 流转记录数：{record_count} 条
+
+{section}
+{process_text}
+
+【要求】
+1. 生成3-5句话的简报
+2. 突出产品的安全性和可追溯性
+3. 语言简洁明了，让消费者容易理解
+4. 重点关注质检结果和流转环节的完整性
+5. 包含关键时间点和操作者信息
+6. 以自然流畅的段落形式输出，不要使用列表或项目符号
+
+请直接输出简报内容："""
+
+    return prompt
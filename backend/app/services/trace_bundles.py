@@ -0,0 +1,300 @@
+"""
+静态溯源包导出
+将销售阶段 / 已售出产品的公开溯源响应导出为静态文件，交由任意静态服务器或 CDN 分发：
+
+  bundles/{溯源码}.{内容哈希前16位}.json   内容包，与 /blockchain/product/{溯源码}/chain-data 响应一致；
+                                         文件名含内容哈希，写入后不再修改，可永久缓存
+  traces/{溯源码}.json                    清单，指向当前内容包并附 SHA-256 与 ECDSA(P-256) 签名；
+                                         内容变化时覆盖，CDN 应只做短时缓存
+  trace-bundle-key.pem                    签名公钥
+
+内容只取自完整来自链上 RPC 的溯源快照（数据库回退结果不导出）。
+增量导出：只处理上次导出以来产品或快照有变化的产品，内容哈希未变的不重写。
+应用 lifespan 每 TRACE_BUNDLE_EXPORT_INTERVAL_SECONDS 执行一次增量导出（多个 worker 以文件锁互斥），
+也可由 scripts/export_trace_bundles.py 手动全量导出。
+产品作废时由作废接口立即撤下清单与内容包（withdraw_bundle），不等待下次导出。
+"""
+import asyncio
+import base64
+import fcntl
+import glob
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric.utils import decode_dss_signature
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.product import Product, ProductStage, ProductStatus
+from app.models.trace_snapshot import TraceSnapshot
+from app.services.trace_snapshots import build_snapshot, load_fresh_snapshot
+
+# 导出范围：已上链且处于销售阶段或已售出
+EXPORTED_STAGES = (ProductStage.SELLER, ProductStage.SOLD)
+BUNDLE_DIR = "bundles"
+MANIFEST_DIR = "traces"
+PUBLIC_KEY_FILE = "trace-bundle-key.pem"
+
+
+def generate_signing_key(key_path: str) -> ec.EllipticCurvePrivateKey:
+    """生成签名私钥（PEM，不加密，文件权限 600）"""
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(key_path)), mode=0o700, exist_ok=True)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    return private_key
+
+
+def load_signing_key(key_path: str) -> ec.EllipticCurvePrivateKey:
+    with open(key_path, "rb") as f:
+        return serialization.load_pem_private_key(f.read(), password=None)
+
+
+def public_key_der(private_key: ec.EllipticCurvePrivateKey) -> bytes:
+    """SPKI DER 公钥（前端 WebCrypto importKey('spki') 使用其 base64）"""
+    return private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _remove_manifest(out_dir: str, trace_code: str) -> bool:
+    manifest_path = os.path.join(out_dir, MANIFEST_DIR, f"{trace_code}.json")
+    if not os.path.exists(manifest_path):
+        return False
+    os.remove(manifest_path)
+    return True
+
+
+def withdraw_bundle(trace_code: str, out_dir: str = None) -> bool:
+    """
+    立即撤下已导出的清单与内容包（产品作废时由写入方调用）
+    前端取不到清单即回退到接口；CDN 上已缓存的清单最多在其缓存时间内仍可用。
+    导出状态中的记录由下次导出清理（产品状态变化会被增量导出检查到）
+
+    Returns:
+        是否撤下了清单
+    """
+    out_dir = out_dir or settings.TRACE_BUNDLE_DIR
+    withdrawn = _remove_manifest(out_dir, trace_code)
+    pattern = os.path.join(glob.escape(os.path.join(out_dir, BUNDLE_DIR)), f"{glob.escape(trace_code)}.*.json")
+    for bundle_path in glob.glob(pattern):
+        os.remove(bundle_path)
+    return withdrawn
+
+
+class BundleExporter:
+    """静态溯源包导出器"""
+
+    def __init__(self, out_dir: str, private_key: ec.EllipticCurvePrivateKey, state_path: str):
+        self.out_dir = out_dir
+        self.private_key = private_key
+        self.key_id = hashlib.sha256(public_key_der(private_key)).hexdigest()[:16]
+        self.state_path = state_path
+        # since / built_since: 上次导出的开始时间（数据库 / 应用时钟）
+        # exported: 溯源码 -> 当前内容哈希；unavailable: 链上数据暂不可用、下次重试的溯源码
+        self.state = {"since": None, "built_since": None, "exported": {}, "unavailable": []}
+        self._retry_later = set()
+        if state_path and os.path.exists(state_path):
+            with open(state_path, encoding="utf-8") as f:
+                self.state.update(json.load(f))
+
+    def save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def write_public_key(self):
+        pem = self.private_key.public_key().public_bytes(
+            encoding=serialization.Encoding.PEM,
+            format=serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        _write_atomic(os.path.join(self.out_dir, PUBLIC_KEY_FILE), pem)
+
+    def sign(self, body: bytes) -> str:
+        """ECDSA P-256 / SHA-256 签名，输出 r||s 定长格式的 base64（WebCrypto 验签格式）"""
+        r, s = decode_dss_signature(self.private_key.sign(body, ec.ECDSA(hashes.SHA256())))
+        return base64.b64encode(r.to_bytes(32, "big") + s.to_bytes(32, "big")).decode("ascii")
+
+    def _bundle_body(self, db: Session, trace_code: str) -> Optional[bytes]:
+        """有效快照的响应 JSON；快照失效时同步重建，仍非链上数据则返回 None"""
+        body = load_fresh_snapshot(db, trace_code)
+        if body is None and build_snapshot(db, trace_code) == "chain":
+            body = load_fresh_snapshot(db, trace_code)
+        return body
+
+    def export_one(self, db: Session, trace_code: str) -> str:
+        """
+        导出单个溯源码
+
+        Returns:
+            exported / unchanged / unavailable
+        """
+        body = self._bundle_body(db, trace_code)
+        if body is None:
+            self._retry_later.add(trace_code)
+            return "unavailable"
+        digest = hashlib.sha256(body).hexdigest()
+        if self.state["exported"].get(trace_code) == digest:
+            return "unchanged"
+
+        bundle_path = f"{BUNDLE_DIR}/{trace_code}.{digest[:16]}.json"
+        # 先写内容包再切换清单，读取方任何时刻拿到的清单都指向完整文件
+        _write_atomic(os.path.join(self.out_dir, bundle_path), body)
+        manifest = {
+            "trace_code": trace_code,
+            "bundle": bundle_path,
+            "sha256": digest,
+            "signature": self.sign(body),
+            "key_id": self.key_id,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        _write_atomic(
+            os.path.join(self.out_dir, MANIFEST_DIR, f"{trace_code}.json"),
+            json.dumps(manifest, ensure_ascii=False).encode("utf-8")
+        )
+        self.state["exported"][trace_code] = digest
+        return "exported"
+
+    def withdraw(self, trace_code: str):
+        """产品不再符合导出条件（作废/终止等）: 删除清单，前端随即回退到接口"""
+        _remove_manifest(self.out_dir, trace_code)
+        self.state["exported"].pop(trace_code, None)
+
+    def export(self, db: Session, full: bool = False, batch_size: int = 200, progress=None) -> Dict[str, int]:
+        """
+        导出（默认增量）：上次导出以来产品或快照有变化的产品，以及尚未导出过的符合条件产品
+
+        Args:
+            full: 忽略增量起点，检查全部产品（内容未变的仍不重写）
+        """
+        # updated_at 由数据库时钟写入，快照 built_at 由应用时钟写入，分别记录起点
+        started_at, built_started_at = db.query(func.now()).scalar(), datetime.now()
+        since = built_since = None
+        if not full and self.state["since"]:
+            since = datetime.fromisoformat(self.state["since"])
+            built_since = datetime.fromisoformat(self.state["built_since"])
+        retry, self._retry_later = self.state["unavailable"], set()
+        self.write_public_key()
+
+        counts = {"exported": 0, "unchanged": 0, "unavailable": 0, "withdrawn": 0}
+        last_id = 0
+        while True:
+            query = db.query(Product.id, Product.trace_code, Product.current_stage, Product.status).outerjoin(
+                TraceSnapshot, TraceSnapshot.trace_code == Product.trace_code
+            ).filter(Product.id > last_id, Product.trace_code.isnot(None))
+            if since is not None:
+                query = query.filter(or_(
+                    Product.updated_at >= since,
+                    TraceSnapshot.built_at >= built_since,
+                    # 从未生成过快照（快照功能上线前的产品）
+                    Product.current_stage.in_(EXPORTED_STAGES) & TraceSnapshot.built_at.is_(None),
+                    Product.trace_code.in_(retry or [""]),
+                ))
+            rows = query.order_by(Product.id.asc()).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+
+            for row in rows:
+                eligible = row.status == ProductStatus.ON_CHAIN and row.current_stage in EXPORTED_STAGES
+                if eligible:
+                    counts[self.export_one(db, row.trace_code)] += 1
+                elif row.trace_code in self.state["exported"]:
+                    self.withdraw(row.trace_code)
+                    counts["withdrawn"] += 1
+            db.expunge_all()
+            self.save_state()
+            if progress:
+                progress(counts, last_id)
+
+        self.state["since"] = started_at.isoformat()
+        self.state["built_since"] = built_started_at.isoformat()
+        self.state["unavailable"] = sorted(self._retry_later)
+        self.save_state()
+        return counts
+
+    def prune(self, grace_seconds: int) -> int:
+        """删除不再被任何清单引用、且超过保留期的内容包（CDN 上旧清单可能仍在引用）"""
+        bundle_root = os.path.join(self.out_dir, BUNDLE_DIR)
+        if not os.path.isdir(bundle_root):
+            return 0
+        referenced = {f"{code}.{digest[:16]}.json" for code, digest in self.state["exported"].items()}
+        deadline = time.time() - grace_seconds
+        removed = 0
+        for name in os.listdir(bundle_root):
+            path = os.path.join(bundle_root, name)
+            if name.endswith(".json") and name not in referenced and os.path.getmtime(path) < deadline:
+                os.remove(path)
+                removed += 1
+        return removed
+
+
+@contextmanager
+def exporter_lock(state_path: str) -> Iterator[bool]:
+    """导出互斥（同一状态文件同时只有一个导出），返回是否取得锁"""
+    with open(state_path + ".lock", "a") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _export_job():
+    """单次增量导出（在线程池中执行）；签名私钥不存在或其他 worker 正在导出时跳过"""
+    if not os.path.exists(settings.TRACE_BUNDLE_KEY_PATH):
+        return
+    with exporter_lock(settings.TRACE_BUNDLE_STATE_PATH) as acquired:
+        if not acquired:
+            return
+        from app.database import SessionLocal
+        db = SessionLocal()
+        try:
+            exporter = BundleExporter(settings.TRACE_BUNDLE_DIR, load_signing_key(settings.TRACE_BUNDLE_KEY_PATH),
+                                      settings.TRACE_BUNDLE_STATE_PATH)
+            counts = exporter.export(db)
+            if counts["exported"] or counts["withdrawn"]:
+                print(f"📦 静态溯源包导出: {counts}")
+        except Exception as e:
+            print(f"❌ Trace bundle export error: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+
+async def bundle_export_loop():
+    """后台定期增量导出（由应用 lifespan 启动）"""
+    if not os.path.exists(settings.TRACE_BUNDLE_KEY_PATH):
+        print(f"⚠️ 静态溯源包签名密钥不存在（{settings.TRACE_BUNDLE_KEY_PATH}），后台导出在生成密钥后开始")
+    while True:
+        await run_in_threadpool(_export_job)
+        await asyncio.sleep(settings.TRACE_BUNDLE_EXPORT_INTERVAL_SECONDS)
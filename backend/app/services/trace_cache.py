@@ -0,0 +1,182 @@
+"""
+溯源响应缓存
+公开溯源接口（扫码热路径）组装好的响应按溯源码缓存：进程内 LRU，可选 Redis 作为多实例共享层。
+产品或流转记录提交变更后精确失效（由 trace_snapshots 在快照版本自增后调用，Redis 模式下通过发布订阅通知其他实例）；
+每个键维护失效代数，组装期间发生失效的结果不会写回缓存；Redis 模式下代数同时保存在 Redis 中
+（失效时 INCR），写入共享层由 Lua 脚本比对代数后原子执行，其他实例的失效同样能拦住过期写回。
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple, Optional, Set
+
+from app.config import settings
+from app.services.metrics import metrics
+
+REDIS_PREFIX = "trace_cache:"
+INVALIDATION_CHANNEL = "trace_cache:invalidate"
+GENERATION_PREFIX = "trace_cache:gen:"
+GENERATION_TTL = 86400  # Redis 代数键保留时长(秒)，只需长于一次组装耗时
+
+# 代数未变化时才写入: KEYS[1] 代数键, KEYS[2] 缓存键; ARGV 读取时的代数、响应体、TTL
+SET_IF_GENERATION = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class CachedTrace(NamedTuple):
+    """缓存的响应体（JSON 字节）与 ETag"""
+    etag: str
+    body: bytes
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class TraceCache:
+    """溯源响应缓存（进程内 LRU + 可选 Redis）"""
+
+    def __init__(self, maxsize: int = 2048, ttl: int = 300, redis_url: str = ""):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # 溯源码 -> (过期时间, CachedTrace)
+        self._generations = {}  # 溯源码 -> 失效代数
+        self._epoch = 0  # 代数表重置次数
+        self._lock = Lock()
+        self._set_if_generation = None
+        self._redis = self._connect_redis(redis_url) if redis_url else None
+
+    def _connect_redis(self, redis_url: str):
+        try:
+            import redis
+        except ImportError:
+            print("⚠️ 未安装 redis，溯源缓存仅使用进程内 LRU")
+            return None
+        try:
+            client = redis.Redis.from_url(redis_url)
+            client.ping()
+            # 其他实例的失效通知: 清除本地条目
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{INVALIDATION_CHANNEL: self._on_remote_invalidation})
+            pubsub.run_in_thread(sleep_time=1, daemon=True)
+            self._set_if_generation = client.register_script(SET_IF_GENERATION)
+            return client
+        except Exception as e:
+            print(f"⚠️ 溯源缓存 Redis 不可用，仅使用进程内 LRU: {e}")
+            return None
+
+    def generation(self, trace_code: str) -> tuple:
+        """组装响应前读取失效代数（本地 + Redis），写回时比对"""
+        with self._lock:
+            local = self._epoch, self._generations.get(trace_code, 0)
+        return local + (self._redis_generation(trace_code),)
+
+    def _redis_generation(self, trace_code: str) -> Optional[str]:
+        """Redis 中的失效代数，读取失败时为 None（不写共享层）"""
+        if self._redis is None:
+            return None
+        try:
+            value = self._redis.get(GENERATION_PREFIX + trace_code)
+        except Exception as e:
+            print(f"⚠️ 溯源缓存 Redis 读取失败: {e}")
+            return None
+        return value.decode("ascii") if value is not None else "0"
+
+    def get(self, trace_code: str) -> Optional[CachedTrace]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(trace_code)
+            if item is not None:
+                expires_at, cached = item
+                if expires_at > now:
+                    self._entries.move_to_end(trace_code)
+                    return cached
+                del self._entries[trace_code]
+
+        if self._redis is not None:
+            try:
+                body = self._redis.get(REDIS_PREFIX + trace_code)
+            except Exception as e:
+                print(f"⚠️ 溯源缓存 Redis 读取失败: {e}")
+                return None
+            if body is not None:
+                cached = CachedTrace(make_etag(body), body)
+                self._store_local(trace_code, cached)
+                return cached
+        return None
+
+    def set(self, trace_code: str, body: bytes, generation: tuple) -> CachedTrace:
+        """写入缓存（组装期间已被失效则只返回不缓存）"""
+        cached = CachedTrace(make_etag(body), body)
+        with self._lock:
+            if (self._epoch, self._generations.get(trace_code, 0)) != generation[:2]:
+                return cached
+        self._store_local(trace_code, cached)
+        redis_generation = generation[2]
+        if self._redis is not None and redis_generation is not None:
+            try:
+                self._set_if_generation(
+                    keys=[GENERATION_PREFIX + trace_code, REDIS_PREFIX + trace_code],
+                    args=[redis_generation, body, self.ttl]
+                )
+            except Exception as e:
+                print(f"⚠️ 溯源缓存 Redis 写入失败: {e}")
+        return cached
+
+    def _store_local(self, trace_code: str, cached: CachedTrace):
+        with self._lock:
+            self._entries[trace_code] = (time.monotonic() + self.ttl, cached)
+            self._entries.move_to_end(trace_code)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _invalidate_local(self, trace_codes: Set[str]):
+        with self._lock:
+            for code in trace_codes:
+                self._entries.pop(code, None)
+                self._generations[code] = self._generations.get(code, 0) + 1
+            # 代数只需覆盖可能正在组装的键，过多时整体重置（纪元递增使进行中的写回全部作废）
+            if len(self._generations) > self.maxsize * 4:
+                self._generations.clear()
+                self._epoch += 1
+
+    def invalidate(self, trace_codes: Set[str]):
+        """使指定溯源码的缓存失效（本地 + 共享层 + 通知其他实例）"""
+        self._invalidate_local(trace_codes)
+        metrics.inc("trace_cache_invalidations_total", len(trace_codes))
+        if self._redis is not None:
+            try:
+                # 先递增代数再删除，组装中的实例随后的写回都会被脚本拒绝
+                pipe = self._redis.pipeline()
+                for code in trace_codes:
+                    pipe.incr(GENERATION_PREFIX + code)
+                    pipe.expire(GENERATION_PREFIX + code, GENERATION_TTL)
+                pipe.delete(*[REDIS_PREFIX + code for code in trace_codes])
+                pipe.publish(INVALIDATION_CHANNEL, "\n".join(trace_codes))
+                pipe.execute()
+            except Exception as e:
+                print(f"⚠️ 溯源缓存 Redis 失效失败: {e}")
+
+    def _on_remote_invalidation(self, message):
+        data = message.get("data")
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        if data:
+            self._invalidate_local(set(data.split("\n")))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+trace_cache = TraceCache(
+    maxsize=settings.TRACE_CACHE_SIZE,
+    ttl=settings.TRACE_CACHE_TTL_SECONDS,
+    redis_url=settings.TRACE_CACHE_REDIS_URL,
+)
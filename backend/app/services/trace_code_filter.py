@@ -0,0 +1,202 @@
+"""
+溯源码存在性过滤器
+进程内 Bloom 过滤器保存全部已签发的溯源码：公开查询接口（扫码验证 / 链上数据）
+对过滤器判定为“一定不存在”的溯源码直接拒绝，不访问链与数据库。
+
+- 启动时从数据库全量构建，此后按溯源码签发时间（trace_code_issued_at）增量同步，
+  覆盖其他实例签发的溯源码（草稿提交时才签发，产品主键早于已同步位置）；
+  每次回看 TRACE_CODE_FILTER_SYNC_OVERLAP_SECONDS，避免遗漏签发后较晚提交的事务
+- 本进程签发溯源码（generate_trace_code）与产品提交时立即加入
+- 构建完成前不做判定（全部放行）；元素数超过容量时按两倍容量重建，保证误判率
+"""
+import asyncio
+import hashlib
+import math
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Iterable, Optional, Set
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.config import settings
+from app.models.product import Product
+from app.services import trace_events
+from app.services.metrics import metrics
+
+
+class BloomFilter:
+    """Bloom 过滤器（按容量与目标误判率计算位数与哈希次数）"""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = max(capacity, 1)
+        self.fp_rate = fp_rate
+        self.num_bits = max(int(math.ceil(-self.capacity * math.log(fp_rate) / (math.log(2) ** 2))), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # 双重哈希: 由一次 128 位摘要派生 k 个位置
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        """加入元素（已存在的元素不重复计数）"""
+        added = False
+        for pos in self._positions(key):
+            mask = 1 << (pos & 7)
+            if not self.bits[pos >> 3] & mask:
+                self.bits[pos >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def estimated_fp_rate(self) -> float:
+        """按当前元素数估算的误判率"""
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+class TraceCodeFilter:
+    """已签发溯源码过滤器"""
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self._bloom: Optional[BloomFilter] = None
+        self._synced_at: Optional[datetime] = None  # 已同步到的溯源码签发时间
+        self._rebuilding: Optional[Set[str]] = None  # 重建期间新签发的溯源码，重建完成后补入
+        self._lock = Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._bloom is not None
+
+    def add(self, trace_code: str):
+        self.add_many([trace_code])
+
+    def add_many(self, trace_codes: Iterable[str]):
+        with self._lock:
+            for code in trace_codes:
+                if not code:
+                    continue
+                if self._bloom is not None:
+                    self._bloom.add(code)
+                if self._rebuilding is not None:
+                    self._rebuilding.add(code)
+
+    def might_exist(self, trace_code: str) -> bool:
+        """False 表示一定未签发；过滤器尚未构建时返回 True"""
+        bloom = self._bloom
+        if bloom is None:
+            metrics.inc("trace_code_filter_checks_total", result="not_ready")
+            return True
+        if trace_code in bloom:
+            metrics.inc("trace_code_filter_checks_total", result="passed")
+            return True
+        metrics.inc("trace_code_filter_checks_total", result="rejected")
+        return False
+
+    def rebuild(self, db: Session, batch_size: int = 5000):
+        """从数据库全量构建（容量至少为现有溯源码数的两倍），构建期间旧过滤器继续服务"""
+        with self._lock:
+            self._rebuilding = set()
+        try:
+            total = db.query(Product.id).filter(Product.trace_code.isnot(None)).count()
+            synced_at = db.query(func.max(Product.trace_code_issued_at)).scalar()
+            bloom = BloomFilter(max(self.capacity, total * 2), self.fp_rate)
+            last_id = 0
+            while True:
+                rows = db.query(Product.id, Product.trace_code).filter(
+                    Product.id > last_id, Product.trace_code.isnot(None)
+                ).order_by(Product.id.asc()).limit(batch_size).all()
+                if not rows:
+                    break
+                for row in rows:
+                    bloom.add(row.trace_code)
+                last_id = rows[-1].id
+
+            with self._lock:
+                for code in self._rebuilding:
+                    bloom.add(code)
+                self._bloom = bloom
+                if synced_at is not None and (self._synced_at is None or synced_at > self._synced_at):
+                    self._synced_at = synced_at
+                self.capacity = bloom.capacity
+        finally:
+            with self._lock:
+                self._rebuilding = None
+        print(f"✅ 溯源码过滤器已构建: {bloom.count} 个，{len(bloom.bits) / 1024:.0f} KB")
+
+    def refresh(self, db: Session, batch_size: int = 5000):
+        """增量同步上次以来签发的溯源码（含回看窗口）；超出容量时全量重建"""
+        if self._bloom is None or self._bloom.count > self._bloom.capacity:
+            self.rebuild(db, batch_size)
+            return
+        issued_at = Product.trace_code_issued_at
+        query = db.query(Product.id, Product.trace_code, issued_at).filter(
+            issued_at.isnot(None), Product.trace_code.isnot(None)
+        )
+        if self._synced_at is not None:
+            query = query.filter(issued_at >= self._synced_at - timedelta(seconds=settings.TRACE_CODE_FILTER_SYNC_OVERLAP_SECONDS))
+        cursor = None
+        while True:
+            page = query
+            if cursor is not None:
+                page = page.filter(or_(issued_at > cursor[0], and_(issued_at == cursor[0], Product.id > cursor[1])))
+            rows = page.order_by(issued_at.asc(), Product.id.asc()).limit(batch_size).all()
+            if not rows:
+                return
+            self.add_many(row.trace_code for row in rows)
+            last = rows[-1]
+            cursor = (last.trace_code_issued_at, last.id)
+            if self._synced_at is None or last.trace_code_issued_at > self._synced_at:
+                self._synced_at = last.trace_code_issued_at
+
+    def stats(self) -> dict:
+        bloom = self._bloom
+        if bloom is None:
+            return {"ready": False, "target_fp_rate": self.fp_rate}
+        return {
+            "ready": True,
+            "count": bloom.count,
+            "capacity": bloom.capacity,
+            "bits": bloom.num_bits,
+            "hashes": bloom.num_hashes,
+            "memory_bytes": len(bloom.bits),
+            "target_fp_rate": bloom.fp_rate,
+            "estimated_fp_rate": round(bloom.estimated_fp_rate(), 8),
+        }
+
+
+trace_code_filter = TraceCodeFilter(
+    capacity=settings.TRACE_CODE_FILTER_CAPACITY,
+    fp_rate=settings.TRACE_CODE_FILTER_FP_RATE,
+)
+# 本进程提交的新产品（含非 generate_trace_code 生成的溯源码）
+trace_events.subscribe(trace_code_filter.add_many)
+metrics.register_collector("trace_code_filter", trace_code_filter.stats)
+
+
+def _refresh_job():
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        trace_code_filter.refresh(db)
+    except Exception as e:
+        print(f"❌ Trace code filter refresh error: {e}")
+    finally:
+        db.close()
+
+
+async def trace_code_filter_loop():
+    """启动时构建过滤器并定期增量同步（由应用 lifespan 启动）"""
+    while True:
+        await run_in_threadpool(_refresh_job)
+        await asyncio.sleep(settings.TRACE_CODE_FILTER_REFRESH_SECONDS)
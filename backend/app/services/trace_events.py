@@ -0,0 +1,87 @@
+"""
+溯源数据变更事件
+Session 提交后，按本事务中新增/修改的产品与流转记录汇总受影响的溯源码，
+通知订阅者（溯源快照与响应缓存等）。回滚的事务不会产生事件。
+事务内订阅者在每次 flush 后于写入方的同一事务中执行（如快照版本自增），随事务一同提交或回滚。
+"""
+from typing import Callable, List, Set
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.models.product import Product, ProductRecord
+
+_subscribers: List[Callable[[Set[str]], None]] = []
+_transaction_subscribers: List[Callable[[Session, Set[str]], None]] = []
+
+
+def subscribe(callback: Callable[[Set[str]], None]):
+    """订阅溯源数据变更（参数为受影响的溯源码集合）"""
+    _subscribers.append(callback)
+
+
+def subscribe_in_transaction(callback: Callable[[Session, Set[str]], None]):
+    """订阅写入方事务内的变更（参数为会话与本次 flush 受影响的溯源码集合）"""
+    _transaction_subscribers.append(callback)
+
+
+def publish(trace_codes: Set[str]):
+    """通知订阅者（事务提交后调用）"""
+    trace_codes = {code for code in trace_codes if code}
+    if not trace_codes:
+        return
+    for callback in _subscribers:
+        try:
+            callback(trace_codes)
+        except Exception as e:
+            print(f"⚠️ 溯源变更通知失败: {e}")
+
+
+def record_changes(session: Session, trace_codes: Set[str]):
+    """
+    登记本事务中变化的溯源码：执行事务内订阅者，提交后通知订阅者
+
+    after_flush 自动调用；绕过 ORM 的批量写入在提交前手动调用
+    """
+    trace_codes = {code for code in trace_codes if code}
+    if not trace_codes:
+        return
+    for callback in _transaction_subscribers:
+        callback(session, trace_codes)
+    session.info.setdefault("changed_trace_codes", set()).update(trace_codes)
+
+
+def _trace_code_of(session: Session, product_id: int) -> str:
+    """优先从会话中已加载的产品取溯源码，否则查询"""
+    for obj in session.identity_map.values():
+        if isinstance(obj, Product) and obj.id == product_id:
+            return obj.trace_code
+    return session.execute(select(Product.trace_code).where(Product.id == product_id)).scalar()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_traces(session, flush_context):
+    """记录本事务中变化的溯源码（产品字段/状态变化，或新增/修改流转记录）"""
+    codes, record_product_ids = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Product):
+            if obj in session.new or obj in session.deleted or session.is_modified(obj):
+                codes.add(obj.trace_code)
+        elif isinstance(obj, ProductRecord) and obj.product_id:
+            record_product_ids.add(obj.product_id)
+
+    for product_id in record_product_ids:
+        codes.add(_trace_code_of(session, product_id))
+    record_changes(session, codes)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changed_traces(session):
+    codes = session.info.pop("changed_trace_codes", None)
+    if codes:
+        publish(codes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_traces(session):
+    session.info.pop("changed_trace_codes", None)
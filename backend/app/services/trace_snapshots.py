@@ -0,0 +1,358 @@
+"""
+溯源快照服务
+公开溯源响应（产品信息 + 按序流转记录，含交易哈希/区块高度与操作者名称/地址）
+预先渲染保存到 trace_snapshots：产品或流转记录变更时在写入方的事务中使快照版本自增，
+提交后由后台线程合并变更并重建；接口按主键读取有效快照直接返回。
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.blockchain import blockchain_client
+from app.models.product import Product
+from app.models.trace_snapshot import TraceSnapshot
+from app.services import trace_events
+from app.services.metrics import metrics
+from app.services.record_archive import product_history
+from app.services.trace_cache import trace_cache
+from app.services.user_directory import UserLookup
+
+REBUILD_DEBOUNCE_SECONDS = 0.5  # 合并同一批写入触发的重建
+
+# 组装结果来源: chain=产品与记录均来自链上 RPC, database=均为数据库回退, mixed=部分回退
+SOURCE_CHAIN, SOURCE_DATABASE, SOURCE_MIXED = "chain", "database", "mixed"
+
+
+class DbTrace(NamedTuple):
+    """数据库中的溯源数据：链上读取失败时的回退值，以及补充链上记录的交易哈希"""
+    product_info: dict
+    records: List[dict]
+    tx_map: Dict[int, Tuple[Optional[str], Optional[int]]]  # 记录 ID -> (交易哈希, 区块高度)
+
+
+def load_db_trace(db: Session, trace_code: str) -> Optional[DbTrace]:
+    """一次读取产品、全部流转记录与相关用户地址；溯源码不存在时返回 None"""
+    product = db.query(Product).filter(Product.trace_code == trace_code).first()
+    if not product:
+        return None
+    db_records = product_history(db, product.id)
+
+    # 批量加载创建者、持有者与操作者的真实地址
+    users = UserLookup(db).load([product.creator_id, product.current_holder_id] + [r.operator_id for r in db_records])
+
+    product_info = {
+        "name": product.name or "",
+        "category": product.category or "",
+        "origin": product.origin or "",
+        "quantity": int((product.quantity or 0) * 1000),  # 转换为整数
+        "unit": product.unit or "",
+        "currentStage": product.current_stage.value if product.current_stage else 0,
+        "status": product.status.value if product.status else 0,
+        "creator": users.address(product.creator_id),
+        "currentHolder": users.address(product.current_holder_id),
+        "createdAt": int(product.created_at.timestamp()),
+        "recordCountNum": len(db_records)
+    }
+    records = [{
+        "index": i,
+        "recordId": record.id,
+        "stage": record.stage.value if record.stage else 0,
+        "action": record.action.value if record.action else 0,
+        "data": record.data or "",
+        "remark": record.remark or "",
+        "operator": users.address(record.operator_id),
+        "operatorName": record.operator_name or "",
+        "timestamp": int(record.created_at.timestamp()),
+        "previousRecordId": record.previous_record_id or 0,
+        "amendReason": record.amend_reason or "",
+        "txHash": record.tx_hash or "",
+        "blockNumber": record.block_number
+    } for i, record in enumerate(db_records)]
+    tx_map = {r.id: (r.tx_hash, r.block_number) for r in db_records}
+    return DbTrace(product_info, records, tx_map)
+
+
+def combine_trace(trace_code: str, chain_product: Optional[dict], chain_records: Optional[List[dict]],
+                  db_trace: Optional[DbTrace]) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    合并链上与数据库数据：链上读取失败的部分使用数据库回退
+
+    Returns:
+        (响应数据, 来源)；链上与数据库都没有该溯源码时为 (None, None)
+    """
+    product_info, records = chain_product, chain_records
+    if product_info is None:
+        if db_trace is None:
+            return None, None
+        product_info = db_trace.product_info
+
+    if records:
+        # RPC 记录补充 tx_hash（链上合约不存储 tx_hash，从数据库获取）
+        if db_trace:
+            for rec in records:
+                rid = rec.get("recordId")
+                if rid and rid in db_trace.tx_map:
+                    tx, bn = db_trace.tx_map[rid]
+                    if tx: rec["txHash"] = tx
+                    if bn: rec["blockNumber"] = bn
+    elif db_trace:
+        records = db_trace.records
+
+    chain_parts = (chain_product is not None) + bool(chain_records)
+    source = SOURCE_CHAIN if chain_parts == 2 else SOURCE_DATABASE if chain_parts == 0 else SOURCE_MIXED
+    return {
+        "trace_code": trace_code,
+        "exists": True,
+        "product_info": product_info,
+        "chain_records": records,
+        "record_count": len(records) if records else 0,
+        # 应答是否经链上核验（数据库回退时为 False，前端据此提示）
+        "data_source": source,
+        "chain_verified": source == SOURCE_CHAIN
+    }, source
+
+
+def assemble_trace(db: Session, trace_code: str) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    组装产品链上数据（同步读取链上 RPC 与数据库，快照重建使用）
+
+    Returns:
+        (响应数据, 来源 chain / database / mixed)；溯源码不存在时响应数据为 None
+    """
+    chain_product = blockchain_client.get_product_rpc(trace_code)
+    chain_records = blockchain_client.get_product_records_rpc(trace_code)
+    return combine_trace(trace_code, chain_product, chain_records, load_db_trace(db, trace_code))
+
+
+def _load_db_trace_in_session(trace_code: str) -> Optional[DbTrace]:
+    # 读主库：结果可能被缓存，避免缓存只读副本上延迟的数据
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return load_db_trace(db, trace_code)
+    finally:
+        db.close()
+
+
+async def assemble_trace_async(trace_code: str, chain_budget: float) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    并发组装产品链上数据：链上产品、链上记录（异步 RPC）与数据库读取（线程池）同时进行
+
+    链上读取超过 chain_budget 秒仍未完成时不再等待，未完成的部分使用数据库数据。
+
+    Returns:
+        (响应数据, 来源 chain / database / mixed)；溯源码不存在时响应数据为 None
+    """
+    product_task = asyncio.ensure_future(blockchain_client.get_product_rpc_async(trace_code))
+    records_task = asyncio.ensure_future(blockchain_client.get_product_records_rpc_async(trace_code))
+    db_task = asyncio.ensure_future(run_in_threadpool(_load_db_trace_in_session, trace_code))
+    chain_tasks = {product_task, records_task}
+    try:
+        started = time.monotonic()
+        _, pending = await asyncio.wait(chain_tasks, timeout=chain_budget)
+        if pending:
+            metrics.inc("trace_chain_deadline_exceeded_total")
+        else:
+            metrics.observe("trace_chain_read_ms", (time.monotonic() - started) * 1000)
+        db_trace = await db_task
+    finally:
+        for task in chain_tasks:
+            task.cancel()
+
+    def chain_result(task):
+        return task.result() if task.done() and not task.cancelled() and task.exception() is None else None
+
+    return combine_trace(trace_code, chain_result(product_task), chain_result(records_task), db_trace)
+
+
+def render_body(data: dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+def load_fresh_snapshot(db: Session, trace_code: str) -> Optional[bytes]:
+    """按主键读取快照，版本已追上最新变更时返回响应 JSON"""
+    snapshot = db.get(TraceSnapshot, trace_code)
+    if snapshot is None or snapshot.body is None or snapshot.built_version != snapshot.version:
+        return None
+    return snapshot.body.encode("utf-8")
+
+
+def build_snapshot(db: Session, trace_code: str) -> Optional[str]:
+    """
+    重建单个溯源码的快照
+
+    Returns:
+        快照来源（chain / database），溯源码不存在时返回 None
+    """
+    snapshot = db.get(TraceSnapshot, trace_code)
+    version = snapshot.version if snapshot else 1
+    data, source = assemble_trace(db, trace_code)
+    if data is None:
+        return None
+    from_chain = source == SOURCE_CHAIN
+
+    product_id = db.query(Product.id).filter(Product.trace_code == trace_code).scalar()
+    if snapshot is None:
+        snapshot = TraceSnapshot(trace_code=trace_code, product_id=product_id, version=version, built_version=0)
+        db.add(snapshot)
+    snapshot.body = render_body(data).decode("utf-8")
+    snapshot.record_count = data["record_count"]
+    snapshot.source = "chain" if from_chain else "database"
+    snapshot.built_at = datetime.now()
+    db.flush()
+    # 链上数据不可用时保存数据库回退结果但不标记为有效，接口继续实时组装；
+    # 重建期间又有新变更时 version 已自增，条件更新保证不会误标为有效
+    if from_chain:
+        db.execute(
+            update(TraceSnapshot)
+            .where(TraceSnapshot.trace_code == trace_code, TraceSnapshot.version == version)
+            .values(built_version=version)
+        )
+    db.commit()
+    if from_chain:
+        # 变更到重建完成之间缓存的可能是旧快照
+        trace_cache.invalidate({trace_code})
+    return snapshot.source
+
+
+def mark_changed(db: Session, trace_codes: Set[str]):
+    """溯源数据变更: 在写入方的事务中使快照版本自增（随事务提交后快照失效）"""
+    db.connection().execute(
+        update(TraceSnapshot.__table__)
+        .where(TraceSnapshot.__table__.c.trace_code.in_(trace_codes))
+        .values(version=TraceSnapshot.__table__.c.version + 1)
+    )
+
+
+class SnapshotBuilder:
+    """后台重建线程：合并短时间内的变更，逐个重建快照"""
+
+    def __init__(self):
+        self._pending: Set[str] = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, trace_codes: Iterable[str]):
+        with self._cond:
+            self._pending.update(trace_codes)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="trace-snapshot-builder", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        from app.database import SessionLocal
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+            time.sleep(REBUILD_DEBOUNCE_SECONDS)
+            with self._cond:
+                batch, self._pending = self._pending, set()
+
+            db = SessionLocal()
+            try:
+                for trace_code in batch:
+                    try:
+                        source = build_snapshot(db, trace_code)
+                        metrics.inc("trace_snapshot_builds_total", source=source or "missing")
+                    except Exception as e:
+                        print(f"❌ Trace snapshot rebuild error ({trace_code}): {e}")
+                        db.rollback()
+            finally:
+                db.close()
+
+
+snapshot_builder = SnapshotBuilder()
+
+
+def _on_traces_changed(trace_codes: Set[str]):
+    """变更已提交（快照版本已随写入事务自增）：清除响应缓存并排队重建"""
+    trace_cache.invalidate(trace_codes)
+    snapshot_builder.enqueue(trace_codes)
+
+
+trace_events.subscribe_in_transaction(mark_changed)
+trace_events.subscribe(_on_traces_changed)
+
+
+def rebuild_snapshots(db: Session, only_stale: bool = False, batch_size: int = 200) -> Dict[str, int]:
+    """
+    批量重建快照（上线回填 / 手动修复）
+
+    Args:
+        only_stale: 只重建缺失或失效的快照
+    """
+    counts = {"chain": 0, "database": 0, "skipped": 0}
+    last_id = 0
+    while True:
+        rows = db.query(Product.id, Product.trace_code).filter(
+            Product.id > last_id, Product.trace_code.isnot(None)
+        ).order_by(Product.id.asc()).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        codes = [row.trace_code for row in rows]
+        if only_stale:
+            fresh = {
+                code for (code,) in db.query(TraceSnapshot.trace_code).filter(
+                    TraceSnapshot.trace_code.in_(codes),
+                    TraceSnapshot.built_version == TraceSnapshot.version
+                )
+            }
+            counts["skipped"] += len(fresh)
+            codes = [code for code in codes if code not in fresh]
+
+        for code in codes:
+            source = build_snapshot(db, code)
+            counts[source or "skipped"] += 1
+        db.expunge_all()
+    return counts
+
+
+def verify_snapshots(db: Session, batch_size: int = 200) -> List[dict]:
+    """
+    将有效快照与链上核对（产品信息与记录数），不一致的快照标记失效并排队重建
+
+    Returns:
+        不一致列表
+    """
+    mismatches = []
+    last_code = ""
+    while True:
+        snapshots = db.query(TraceSnapshot).filter(
+            TraceSnapshot.trace_code > last_code,
+            TraceSnapshot.built_version == TraceSnapshot.version
+        ).order_by(TraceSnapshot.trace_code.asc()).limit(batch_size).all()
+        if not snapshots:
+            break
+        last_code = snapshots[-1].trace_code
+
+        stale = set()
+        for snapshot in snapshots:
+            chain_product = blockchain_client.get_product_rpc(snapshot.trace_code)
+            data = json.loads(snapshot.body)
+            if chain_product is None:
+                issue = "missing_on_chain"
+            elif chain_product != data["product_info"]:
+                issue = "product_info"
+            elif int(chain_product["recordCountNum"]) != data["record_count"]:
+                issue = "record_count"
+            else:
+                snapshot.verified_at = datetime.now()
+                continue
+            mismatches.append({"trace_code": snapshot.trace_code, "issue": issue})
+            stale.add(snapshot.trace_code)
+        if stale:
+            trace_events.record_changes(db, stale)
+        db.commit()
+        db.expunge_all()
+    return mismatches
@@ -0,0 +1,151 @@
+"""
+用户目录服务
+进程级 LRU 缓存 id -> (名称, 角色, 区块链地址)，请求内按 id 集合一次批量加载，
+本进程的用户信息更新提交后自动失效；其他实例（worker）的更新在条目过期（TTL）后生效。
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Iterable, NamedTuple, Optional, Set
+
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import get_db
+from app.models.user import User, UserRole
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+class UserInfo(NamedTuple):
+    """缓存的用户信息"""
+    id: int
+    username: str
+    real_name: Optional[str]
+    role: UserRole
+    blockchain_address: Optional[str]
+
+    @property
+    def name(self) -> str:
+        return self.real_name or self.username
+
+
+class UserDirectory:
+    """进程级用户信息 LRU 缓存"""
+
+    def __init__(self, maxsize: int = 1024, ttl: int = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (过期时间, UserInfo)
+        self._lock = Lock()
+
+    def get_many(self, db: Session, user_ids: Iterable[int]) -> Dict[int, UserInfo]:
+        """批量获取用户信息，未命中或已过期的 id 用一次查询加载"""
+        wanted = {uid for uid in user_ids if uid}
+        found: Dict[int, UserInfo] = {}
+        now = time.monotonic()
+        with self._lock:
+            for uid in wanted:
+                item = self._cache.get(uid)
+                if item is None:
+                    continue
+                expires_at, info = item
+                if expires_at > now:
+                    self._cache.move_to_end(uid)
+                    found[uid] = info
+                else:
+                    del self._cache[uid]
+
+        missing = wanted - found.keys()
+        if missing:
+            rows = db.query(
+                User.id, User.username, User.real_name, User.role, User.blockchain_address
+            ).filter(User.id.in_(missing)).all()
+            loaded = {row.id: UserInfo(*row) for row in rows}
+            found.update(loaded)
+            expires_at = time.monotonic() + self.ttl
+            with self._lock:
+                for uid, info in loaded.items():
+                    self._cache[uid] = (expires_at, info)
+                    self._cache.move_to_end(uid)
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        return found
+
+    def invalidate(self, user_ids: Iterable[int]):
+        """移除指定用户的缓存"""
+        with self._lock:
+            for uid in user_ids:
+                self._cache.pop(uid, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+user_directory = UserDirectory(maxsize=settings.USER_DIRECTORY_CACHE_SIZE, ttl=settings.USER_DIRECTORY_TTL_SECONDS)
+
+
+class UserLookup:
+    """
+    请求级用户查找：先 load 一批 id，再按 id 取名称/地址
+
+    已 load 过的 id（包括已不存在的用户）不会再次查询，load 之后的读取不访问数据库
+    （可在 AsyncSession.run_sync 中 load，之后在事件循环中读取）
+    """
+
+    def __init__(self, db: Session, directory: UserDirectory = user_directory):
+        self.db = db
+        self.directory = directory
+        self._users: Dict[int, UserInfo] = {}
+        self._requested: Set[int] = set()
+
+    def load(self, user_ids: Iterable[int]) -> "UserLookup":
+        missing = {uid for uid in user_ids if uid and uid not in self._requested}
+        if missing:
+            self._users.update(self.directory.get_many(self.db, missing))
+            self._requested |= missing
+        return self
+
+    def get(self, user_id: Optional[int]) -> Optional[UserInfo]:
+        if not user_id:
+            return None
+        if user_id not in self._requested:
+            self.load([user_id])
+        return self._users.get(user_id)
+
+    def name(self, user_id: Optional[int], default: Optional[str] = None) -> Optional[str]:
+        info = self.get(user_id)
+        return info.name if info else default
+
+    def address(self, user_id: Optional[int], default: str = ZERO_ADDRESS) -> str:
+        info = self.get(user_id)
+        return info.blockchain_address if info and info.blockchain_address else default
+
+
+def get_user_lookup(db: Session = Depends(get_db)) -> UserLookup:
+    """Dependency for request-scoped user lookup"""
+    return UserLookup(db)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    """记录本事务中修改/删除的用户"""
+    changed = {obj.id for obj in list(session.dirty) + list(session.deleted) if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault("changed_user_ids", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    """提交后使用户缓存失效"""
+    changed = session.info.pop("changed_user_ids", None)
+    if changed:
+        user_directory.invalidate(changed)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
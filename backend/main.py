@@ -2,6 +2,7 @@
 Agricultural Traceability Platform - Main Entry
 农链溯源平台 - 主入口
 """
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
@@ -11,8 +12,17 @@ from dotenv import load_dotenv
 load_dotenv()
 
 from app.config import settings
-from app.database import engine, Base, SessionLocal
-from app.api import auth, producer, blockchain, processor, inspector, seller, ai
+from app.database import engine, async_engine, Base, SessionLocal
+from app.blockchain import blockchain_client
+from app.services.ai_provider import ai_provider
+from app.services.ai_pregenerate import summary_pregenerator
+from app.services.read_routing import pin_writes_middleware
+from app.services.record_archive import archive_loop
+from app.services.chain_reconciler import reconcile_loop
+from app.services.trace_code_filter import trace_code_filter_loop
+from app.services.trace_bundles import bundle_export_loop
+from app.services.sql_profiler import profile_requests_middleware
+from app.api import auth, producer, blockchain, processor, inspector, seller, ai, metrics, jobs
 from app.models.user import User, UserRole
 from passlib.context import CryptContext
 
@@ -25,8 +35,27 @@ async def lifespan(app: FastAPI):
     # Startup: Create database tables
     Base.metadata.create_all(bind=engine)
     print("✅ Database tables created")
+    # AI 服务商连接池（HTTP/2 长连接）
+    await ai_provider.start()
+
+    # 后台归档已售出/已作废产品的流转记录
+    archive_task = asyncio.create_task(archive_loop()) if settings.ARCHIVE_ENABLED else None
+    # 后台对账上链失败/中断的产品
+    reconcile_task = asyncio.create_task(reconcile_loop()) if settings.CHAIN_RECONCILE_ENABLED else None
+    # 构建并同步溯源码存在性过滤器
+    filter_task = asyncio.create_task(trace_code_filter_loop()) if settings.TRACE_CODE_FILTER_ENABLED else None
+    # 销售阶段产品的 AI 简报预生成
+    pregenerate_task = asyncio.create_task(summary_pregenerator.run()) if settings.AI_PREGENERATE_ENABLED else None
+    # 销售阶段产品的静态溯源包增量导出
+    bundle_task = asyncio.create_task(bundle_export_loop()) if settings.TRACE_BUNDLE_EXPORT_ENABLED else None
     yield
     # Shutdown
+    for task in (archive_task, reconcile_task, filter_task, pregenerate_task, bundle_task):
+        if task:
+            task.cancel()
+    await blockchain_client.aclose()
+    await ai_provider.aclose()
+    await async_engine.dispose()
     print("👋 Application shutting down")
 
 
@@ -46,6 +75,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 写请求后将该用户的读请求暂时固定到主库（读写分离）
+app.middleware("http")(pin_writes_middleware)
+
+# SQL 性能分析（每请求查询次数 / 数据库耗时 / 慢查询 / N+1）
+app.middleware("http")(profile_requests_middleware)
+
 # Include Routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(producer.router, prefix="/api")
@@ -54,6 +89,8 @@ app.include_router(processor.router, prefix="/api")
 app.include_router(inspector.router, prefix="/api")
 app.include_router(seller.router, prefix="/api")
 app.include_router(ai.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
 
 
 @app.get("/")
@@ -0,0 +1,13 @@
+-- 创建 AI 溯源简报缓存表（按溯源码 + 溯源数据内容哈希命中，新增记录后自动失效）
+
+USE agri_trace;
+
+CREATE TABLE IF NOT EXISTS ai_summaries (
+    trace_code VARCHAR(50) NOT NULL PRIMARY KEY COMMENT '溯源码',
+    content_hash VARCHAR(64) NOT NULL COMMENT '产品信息与流转记录的内容哈希',
+    summary TEXT NOT NULL COMMENT '简报内容',
+    model VARCHAR(100) NULL COMMENT '生成所用模型',
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '生成时间'
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+SELECT '数据库迁移完成：已创建 AI 简报缓存表' AS message;
@@ -0,0 +1,24 @@
+-- 创建上链操作表（后台上链任务的意图记录，供对账任务补偿失败/中断的写入）
+
+USE agri_trace;
+
+CREATE TABLE IF NOT EXISTS chain_operations (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    product_id INT NOT NULL COMMENT '产品ID',
+    kind VARCHAR(64) NOT NULL COMMENT '后台任务函数名',
+    arguments TEXT NULL COMMENT '任务参数 JSON',
+    status ENUM('RUNNING', 'FAILED', 'SUCCEEDED', 'SUPERSEDED', 'ABANDONED') NOT NULL DEFAULT 'RUNNING' COMMENT '状态',
+    attempts INT NOT NULL DEFAULT 0 COMMENT '已执行次数',
+    baseline_record_count INT NULL COMMENT '首次执行前链上记录数',
+    tx_hashes TEXT NULL COMMENT '已提交交易哈希 JSON 列表',
+    last_error VARCHAR(500) NULL COMMENT '最近一次错误',
+    next_retry_at DATETIME NULL COMMENT '下次重试时间',
+    created_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    INDEX ix_chain_operations_id (id),
+    INDEX ix_chain_operations_product_id (product_id),
+    INDEX ix_chain_operations_status_retry (status, next_retry_at),
+    CONSTRAINT fk_chain_operations_product FOREIGN KEY (product_id) REFERENCES products(id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+SELECT '数据库迁移完成：已创建上链操作表' AS message;
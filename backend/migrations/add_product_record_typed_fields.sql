@@ -0,0 +1,20 @@
+-- 为 product_records 添加从 data(JSON) 提取的热点字段
+-- 执行后运行 scripts/backfill_record_fields.py 回填历史记录
+
+USE agri_trace;
+
+ALTER TABLE product_records
+ADD COLUMN quantity DOUBLE NULL COMMENT '数量（入库/销售）',
+ADD COLUMN warehouse VARCHAR(100) NULL COMMENT '仓库',
+ADD COLUMN process_type VARCHAR(50) NULL COMMENT '加工类型',
+ADD COLUMN result_product VARCHAR(200) NULL COMMENT '加工产出',
+ADD COLUMN result_quantity DOUBLE NULL COMMENT '加工产出数量',
+ADD COLUMN inspection_type VARCHAR(50) NULL COMMENT '质检类型',
+ADD COLUMN qualified TINYINT(1) NULL COMMENT '是否合格',
+ADD COLUMN quality_grade VARCHAR(10) NULL COMMENT '质量等级';
+
+-- 聚合查询索引
+CREATE INDEX ix_product_records_product_action ON product_records(product_id, action);
+CREATE INDEX ix_product_records_operator_action ON product_records(operator_id, action);
+
+SELECT '数据库迁移完成：已添加流转记录提取字段' AS message;
@@ -0,0 +1,36 @@
+-- 创建流转记录归档表（冷数据，压缩行格式）
+-- 已售出/已作废超过保留期的产品记录由后台任务或 scripts/archive_records.py 迁入
+
+USE agri_trace;
+
+-- 列与 product_records 一致（不含外键约束），索引与 ProductRecordArchive 模型声明一致
+CREATE TABLE IF NOT EXISTS product_records_archive (
+    id INT NOT NULL PRIMARY KEY COMMENT '原记录ID',
+    product_id INT NOT NULL COMMENT '产品ID',
+    stage ENUM('PRODUCER', 'PROCESSOR', 'INSPECTOR', 'SELLER', 'SOLD') NOT NULL COMMENT '阶段',
+    action ENUM('CREATE', 'HARVEST', 'RECEIVE', 'PROCESS', 'SEND_INSPECT', 'START_INSPECT', 'INSPECT',
+                'REJECT', 'TERMINATE', 'STOCK_IN', 'SELL', 'AMEND') NOT NULL COMMENT '动作',
+    data TEXT NULL COMMENT '操作数据 JSON',
+    remark TEXT NULL COMMENT '备注',
+    quantity DOUBLE NULL COMMENT '数量（入库/销售）',
+    warehouse VARCHAR(100) NULL COMMENT '仓库',
+    process_type VARCHAR(50) NULL COMMENT '加工类型',
+    result_product VARCHAR(200) NULL COMMENT '加工产出',
+    result_quantity DOUBLE NULL COMMENT '加工产出数量',
+    inspection_type VARCHAR(50) NULL COMMENT '质检类型',
+    qualified TINYINT(1) NULL COMMENT '是否合格',
+    quality_grade VARCHAR(10) NULL COMMENT '质量等级',
+    operator_id INT NULL COMMENT '操作人ID',
+    operator_name VARCHAR(100) NULL COMMENT '操作人名称',
+    tx_hash VARCHAR(100) NULL COMMENT '交易哈希',
+    block_number INT NULL COMMENT '区块高度',
+    previous_record_id INT NULL COMMENT '修正前记录ID',
+    amend_reason TEXT NULL COMMENT '修正原因',
+    created_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP,
+    archived_at DATETIME NULL DEFAULT CURRENT_TIMESTAMP COMMENT '归档时间',
+    INDEX ix_product_records_archive_id (id),
+    INDEX ix_product_records_archive_product (product_id),
+    INDEX ix_product_records_archive_operator_action (operator_id, action)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8;
+
+SELECT '数据库迁移完成：已创建流转记录归档表' AS message;
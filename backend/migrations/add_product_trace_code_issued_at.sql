@@ -0,0 +1,15 @@
+-- 添加溯源码签发时间（溯源码过滤器按此增量同步其他实例签发的溯源码）
+
+USE agri_trace;
+
+ALTER TABLE products
+ADD COLUMN trace_code_issued_at DATETIME NULL COMMENT '溯源码签发时间';
+
+-- 已有溯源码按最近更新时间回填
+UPDATE products
+SET trace_code_issued_at = COALESCE(updated_at, created_at)
+WHERE trace_code IS NOT NULL AND trace_code_issued_at IS NULL;
+
+CREATE INDEX ix_products_trace_code_issued_at ON products(trace_code_issued_at);
+
+SELECT '数据库迁移完成：已添加溯源码签发时间' AS message;
@@ -0,0 +1,19 @@
+-- 创建溯源快照表（预渲染的公开溯源响应，按溯源码主键读取）
+-- 首次上线后执行 scripts/rebuild_trace_snapshots.py 回填
+
+USE agri_trace;
+
+CREATE TABLE IF NOT EXISTS trace_snapshots (
+    trace_code VARCHAR(50) NOT NULL PRIMARY KEY COMMENT '溯源码',
+    product_id INT NOT NULL COMMENT '产品ID',
+    body MEDIUMTEXT NULL COMMENT '溯源响应 JSON',
+    record_count INT NOT NULL DEFAULT 0 COMMENT '记录数',
+    source VARCHAR(20) NULL COMMENT '来源: chain / database',
+    version INT NOT NULL DEFAULT 1 COMMENT '数据变更版本',
+    built_version INT NOT NULL DEFAULT 0 COMMENT '快照对应的版本',
+    built_at DATETIME NULL COMMENT '重建时间',
+    verified_at DATETIME NULL COMMENT '最近与链上核对时间',
+    INDEX ix_trace_snapshots_product_id (product_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+SELECT '数据库迁移完成：已创建溯源快照表' AS message;
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+归档流转记录
+将已售出/已作废超过保留期的产品流转记录迁移到 product_records_archive
+（与应用内后台归档任务逻辑相同，可用于首次上线或手动执行）
+
+用法:
+  python3 scripts/archive_records.py            # 使用配置的保留期
+  python3 scripts/archive_records.py --days 30  # 指定保留期(天)
+"""
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import Base, engine, SessionLocal
+from app.services.record_archive import run_archive
+
+
+def main():
+    parser = argparse.ArgumentParser(description="归档流转记录")
+    parser.add_argument("--days", type=int, default=None, help="保留期(天)，默认使用 ARCHIVE_AFTER_DAYS")
+    parser.add_argument("--batch-size", type=int, default=None, help="每批归档的产品数")
+    args = parser.parse_args()
+
+    # 确保归档表存在
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        products, records = run_archive(db, older_than_days=args.days, batch_size=args.batch_size)
+        print(f"✅ 已归档 {products} 个产品的 {records} 条流转记录")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+数据库与链上数据一致性审计（全量 / 增量）
+分块读取已上链产品，并发通过 RPC 读取链上产品信息，对比产品字段与记录数，
+差异逐行写入 NDJSON 报告；检查点记录进度，中断后重跑从断点继续，
+完成后再次运行只审计有变化的产品。
+
+用法:
+  python3 scripts/audit_db_chain.py                      # 增量审计（首次为全量）
+  python3 scripts/audit_db_chain.py --full               # 忽略检查点，全量审计
+  python3 scripts/audit_db_chain.py --workers 16 --chunk-size 1000 --report audit.ndjson
+
+报告每行格式:
+  {"product_id": 1, "trace_code": "...", "status": "ON_CHAIN", "issues": [{"type": "field_mismatch", ...}]}
+  type: missing_on_chain / field_mismatch / record_count / chain_error
+"""
+import argparse
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import SessionLocal
+from app.services.chain_audit import AuditCheckpoint, audit_products
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库与链上数据一致性审计")
+    parser.add_argument("--checkpoint", default="audit_checkpoint.json", help="检查点文件")
+    parser.add_argument("--report", default=None, help="差异报告文件（NDJSON），默认 audit_report_<时间>.ndjson")
+    parser.add_argument("--full", action="store_true", help="忽略检查点，全量审计")
+    parser.add_argument("--workers", type=int, default=8, help="并发 RPC 数")
+    parser.add_argument("--chunk-size", type=int, default=500, help="每块读取的产品数")
+    args = parser.parse_args()
+
+    if args.full and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint = AuditCheckpoint(args.checkpoint)
+    if not checkpoint.completed:
+        print(f"📦 从检查点继续: 已审计至产品 ID {checkpoint.last_id}")
+    elif checkpoint.run_started_at:
+        print(f"📦 增量审计: {checkpoint.run_started_at} 之后有变化的产品")
+
+    report_path = args.report or f"audit_report_{time.strftime('%Y%m%d_%H%M%S')}.ndjson"
+    started = time.time()
+
+    def progress(summary, last_id):
+        print(f"  ... 已审计 {summary['audited']} 个产品（至 ID {last_id}），差异 {summary['discrepant']}")
+
+    db = SessionLocal()
+    try:
+        with open(report_path, "a", encoding="utf-8") as report:
+            summary = audit_products(db, checkpoint, report, chunk_size=args.chunk_size,
+                                     workers=args.workers, progress=progress)
+        print(f"✅ 审计完成（{time.time() - started:.1f}s）: 审计 {summary['audited']}，一致 {summary['consistent']}，"
+              f"差异 {summary['discrepant']}，链上查询失败 {summary['errors']}")
+        print(f"   报告: {report_path}")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+回填库存流水
+为已有的入库/销售流转记录补写 inventory_movements（需先回填记录提取字段）
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import Base, engine, SessionLocal
+from app.services.inventory import backfill_inventory_ledger
+
+
+def main():
+    # 确保流水表存在
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        count = backfill_inventory_ledger(db)
+        print(f"✅ 已补写 {count} 条库存流水")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
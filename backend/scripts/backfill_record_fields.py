@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+回填流转记录提取字段
+解析历史 product_records.data，填充 quantity / warehouse / process_type 等独立列
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import SessionLocal
+from app.models.product import ProductRecord, extract_record_fields
+
+BATCH_SIZE = 500
+
+
+def backfill_record_fields():
+    """分批回填所有记录"""
+    db = SessionLocal()
+    try:
+        last_id = 0
+        total = 0
+        while True:
+            records = db.query(ProductRecord).filter(
+                ProductRecord.id > last_id
+            ).order_by(ProductRecord.id.asc()).limit(BATCH_SIZE).all()
+            if not records:
+                break
+
+            for record in records:
+                for name, value in extract_record_fields(record.data).items():
+                    setattr(record, name, value)
+            db.commit()
+
+            last_id = records[-1].id
+            total += len(records)
+            print(f"  已处理 {total} 条记录")
+
+        print(f"✅ 回填完成，共 {total} 条记录")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    backfill_record_fields()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+并发请求吞吐基准
+对指定接口发起固定数量的并发请求，输出吞吐量与延迟分位数，
+用于对比同步 Session 与 AsyncSession 路由在并发下的表现。
+
+用法:
+  python3 scripts/bench_concurrency.py http://localhost:8000/api/blockchain/products -n 500 -c 50
+  python3 scripts/bench_concurrency.py http://localhost:8000/api/seller/statistics -H "Authorization: Bearer <token>"
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def run_benchmark(url: str, total: int, concurrency: int, headers: dict) -> dict:
+    """并发请求 url 共 total 次，返回统计结果"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(timeout=60.0, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def one_request():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.get(url, headers=headers)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发请求吞吐基准")
+    parser.add_argument("url", help="目标接口 URL")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="请求总数")
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="并发数")
+    parser.add_argument("-H", "--header", action="append", default=[], help="请求头, 如 'Authorization: Bearer xxx'")
+    args = parser.parse_args()
+
+    headers = {}
+    for header in args.header:
+        key, _, value = header.partition(":")
+        headers[key.strip()] = value.strip()
+
+    result = asyncio.run(run_benchmark(args.url, args.requests, args.concurrency, headers))
+    print(f"\n{'='*60}")
+    print(f"基准测试: {args.url}")
+    print('='*60)
+    for key, value in result.items():
+        print(f"  {key:16} {value}")
+    print('='*60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+AI 简报提示词基准测试：用合成的流转历史（含修正、加工 / 质检返工循环）
+对比逐条输出与压缩后的提示词大小及构建耗时，可选实际调用 AI 测量响应时延
+
+用法:
+  python3 scripts/benchmark_summary_prompt.py                        # 默认 10 / 50 / 200 / 1000 条记录
+  python3 scripts/benchmark_summary_prompt.py --sizes 20,500 --repeat 50
+  python3 scripts/benchmark_summary_prompt.py --call-ai              # 额外调用 AI（需配置 GLM_API_KEY，产生费用）
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.config import settings
+from app.services.summary_prompt import CHAIN_ACTIONS, CHAIN_STAGES, build_summary_prompt, estimate_tokens
+
+OPERATORS = ["张三农场", "李四食品加工厂", "王五质检中心", "赵六生鲜超市"]
+CREATED_AT = 1_766_920_466_216  # 毫秒
+MINUTE_MS = 60_000
+HOUR_MS = 60 * MINUTE_MS
+REMARKS = ["按标准流程操作", "批次抽检，冷链运输全程温度记录正常", "补充上一条记录的批次号与仓位信息", "客户要求复检"]
+
+
+def _record(index: int, stage: str, action: str, timestamp: int, data: dict = None, remark: str = None) -> dict:
+    return {
+        "recordId": index + 1,
+        "stage": CHAIN_STAGES.index(stage),
+        "action": CHAIN_ACTIONS.index(action),
+        "data": json.dumps(data or {}, ensure_ascii=False),
+        "remark": remark if remark is not None else random.choice(REMARKS),
+        "operatorName": OPERATORS[CHAIN_STAGES.index(stage) % len(OPERATORS)],
+        "timestamp": timestamp,
+    }
+
+
+def synthetic_trace(size: int, seed: int = 0) -> dict:
+    """
+    生成约 size 条记录的溯源数据：原料 → 若干轮加工 / 质检返工 → 入库销售，穿插修正记录
+    格式与链上读取一致：阶段 / 动作为枚举序号，时间戳为毫秒（block.timestamp）
+    """
+    random.seed(seed)
+    ts = CREATED_AT
+    records = [
+        _record(0, "producer", "create", ts, {"origin": "山东烟台"}, "创建产品"),
+        _record(1, "producer", "harvest", ts + HOUR_MS, {"warehouse": "1号冷库"}),
+    ]
+    while len(records) < size - 3:
+        ts += 2 * HOUR_MS
+        loop = [
+            ("processor", "receive", {}),
+            ("processor", "process", {"process_type": "清洗分级", "result_product": "精品苹果"}),
+            ("inspector", "send_inspect", {}),
+            ("inspector", "inspect", {"inspect_result": "不合格", "quality_grade": "C", "reason": "农残超标，退回复检"}),
+            ("inspector", "reject", {"reason": "退回加工环节重新处理"}),
+        ]
+        for stage, action, data in loop:
+            if len(records) >= size - 3:
+                break
+            records.append(_record(len(records), stage, action, ts, data))
+            ts += 10 * MINUTE_MS
+            if random.random() < 0.3:
+                records.append(_record(len(records), stage, "amend", ts, {"reason": "更正批次号"}))
+    ts += 2 * HOUR_MS
+    records.append(_record(len(records), "inspector", "inspect", ts, {"inspect_result": "合格", "quality_grade": "A"}, "质检: 合格"))
+    records.append(_record(len(records), "seller", "stock_in", ts + 10 * MINUTE_MS, {"warehouse": "城东门店"}))
+    records.append(_record(len(records), "seller", "sell", ts + 20 * MINUTE_MS, {"buyer_name": "消费者"}))
+    return {
+        "product_info": {
+            "name": "红富士苹果", "category": "水果", "origin": "山东烟台", "quantity": 500, "unit": "kg",
+            "createdAt": CREATED_AT, "recordCountNum": len(records),
+        },
+        "chain_records": records,
+    }
+
+
+def measure(chain_data: dict, compact: bool, repeat: int) -> dict:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        prompt = build_summary_prompt("TRACE-BENCH", chain_data, compact=compact)
+        timings.append((time.perf_counter() - started) * 1000)
+    return {"prompt": prompt, "chars": len(prompt), "tokens": estimate_tokens(prompt), "build_ms": statistics.median(timings)}
+
+
+async def call_ai(prompts: list) -> list:
+    """依次调用 AI，返回 (耗时秒, 实际输入 token 数)"""
+    from app.services.ai_provider import ai_provider
+    results = []
+    await ai_provider.start()
+    try:
+        for prompt in prompts:
+            started = time.perf_counter()
+            data = await ai_provider.chat([{"role": "user", "content": prompt}], max_tokens=300)
+            results.append((time.perf_counter() - started, (data.get("usage") or {}).get("prompt_tokens")))
+    finally:
+        await ai_provider.aclose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 简报提示词基准测试")
+    parser.add_argument("--sizes", default="10,50,200,1000", help="记录数，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=20, help="每种情况构建次数（取中位数）")
+    parser.add_argument("--call-ai", action="store_true", help="实际调用 AI 测量响应时延")
+    args = parser.parse_args()
+
+    try:
+        sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+        print(f"📦 记录部分 token 预算: {settings.AI_PROMPT_RECORD_TOKEN_BUDGET}")
+        print(f"{'记录数':>6} | {'逐条 字符':>9} {'逐条 token':>10} {'逐条 ms':>8} | "
+              f"{'压缩 字符':>9} {'压缩 token':>10} {'压缩 ms':>8} | {'缩减':>6}")
+        rows = []
+        for size in sizes:
+            chain_data = synthetic_trace(size)
+            full = measure(chain_data, False, args.repeat)
+            compact = measure(chain_data, True, args.repeat)
+            rows.append((size, full, compact))
+            print(f"{size:>6} | {full['chars']:>9} {full['tokens']:>10} {full['build_ms']:>8.2f} | "
+                  f"{compact['chars']:>9} {compact['tokens']:>10} {compact['build_ms']:>8.2f} | "
+                  f"{1 - compact['tokens'] / full['tokens']:>6.1%}")
+
+        if args.call_ai:
+            if not settings.AI_API_KEY:
+                print("❌ 未配置 AI 密钥（GLM_API_KEY）")
+                return
+            prompts = [row[key]["prompt"] for row in rows for key in (1, 2)]
+            results = asyncio.run(call_ai(prompts))
+            print(f"{'记录数':>6} | {'逐条 时延s':>10} {'输入token':>9} | {'压缩 时延s':>10} {'输入token':>9}")
+            for i, (size, _, _) in enumerate(rows):
+                (full_s, full_tokens), (compact_s, compact_tokens) = results[2 * i], results[2 * i + 1]
+                print(f"{size:>6} | {full_s:>10.2f} {str(full_tokens):>9} | {compact_s:>10.2f} {str(compact_tokens):>9}")
+        print("✅ 基准测试完成")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
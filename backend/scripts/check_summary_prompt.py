@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+AI 简报提示词检查：用链上返回格式的溯源数据（阶段 / 动作为枚举序号，时间戳为毫秒）构建提示词，
+确认能正常生成且时间换算正确；指定溯源码时改用服务端实际读取的溯源数据
+
+用法:
+  python3 scripts/check_summary_prompt.py                      # 内置的链上格式样例
+  python3 scripts/check_summary_prompt.py --trace-code TRACE-XXXX
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.services.summary_prompt import CHAIN_ACTIONS, CHAIN_STAGES, build_summary_prompt
+
+# 合约 block.timestamp 为毫秒（见 client.py 区块解析注释）
+SAMPLE_CREATED_AT = 1766920466216
+
+
+def sample_chain_data() -> dict:
+    """与 AgriTraceClient._product_from_result / _record_from_result 输出一致的溯源数据"""
+    def record(index: int, stage: str, action: str, offset_ms: int, data: dict, remark: str) -> dict:
+        return {
+            "index": index, "recordId": index + 1,
+            "stage": CHAIN_STAGES.index(stage), "action": CHAIN_ACTIONS.index(action),
+            "data": json.dumps(data, ensure_ascii=False), "remark": remark,
+            "operator": "0x" + "0" * 40, "operatorName": "张三农场",
+            "timestamp": SAMPLE_CREATED_AT + offset_ms, "previousRecordId": 0, "amendReason": "",
+        }
+
+    return {
+        "exists": True,
+        "product_info": {
+            "name": "红富士苹果", "category": "水果", "origin": "山东烟台", "quantity": 500, "unit": "kg",
+            "currentStage": CHAIN_STAGES.index("seller"), "status": 0, "creator": "0x" + "0" * 40,
+            "currentHolder": "0x" + "0" * 40, "createdAt": SAMPLE_CREATED_AT, "recordCountNum": 3,
+        },
+        "chain_records": [
+            record(0, "producer", "create", 0, {"origin": "山东烟台"}, "创建产品"),
+            record(1, "inspector", "inspect", 86_400_000, {"inspect_result": "合格", "quality_grade": "A"}, "质检: 合格"),
+            record(2, "seller", "stock_in", 2 * 86_400_000, {"warehouse": "城东门店"}, "入库"),
+        ],
+    }
+
+
+async def load_trace_data(trace_code: str) -> dict:
+    from app.api.ai import load_trace_data as load
+    return await load(trace_code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 简报提示词检查")
+    parser.add_argument("--trace-code", default=None, help="改用该溯源码的实际溯源数据")
+    args = parser.parse_args()
+
+    try:
+        if args.trace_code:
+            trace_code = args.trace_code
+            chain_data = asyncio.run(load_trace_data(trace_code))
+        else:
+            trace_code = "TRACE-CHECK"
+            chain_data = sample_chain_data()
+
+        prompt = build_summary_prompt(trace_code, chain_data)
+        print(prompt)
+
+        if not args.trace_code:
+            expected = datetime.fromtimestamp(SAMPLE_CREATED_AT / 1000).strftime("%Y年%m月%d日")
+            if f"创建时间：{expected}" not in prompt:
+                print(f"❌ 创建时间换算错误，应为 {expected}")
+                sys.exit(1)
+        print("✅ 提示词构建正常")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+导出静态溯源包（销售阶段 / 已售出产品），供静态服务器或 CDN 分发
+默认增量导出；应用运行时已由 lifespan 定期增量导出（TRACE_BUNDLE_EXPORT_INTERVAL_SECONDS），
+本脚本用于首次生成密钥、全量核对与清理
+
+用法:
+  python3 scripts/export_trace_bundles.py --init-key        # 首次: 生成签名密钥并输出前端配置用的公钥
+  python3 scripts/export_trace_bundles.py                   # 增量导出
+  python3 scripts/export_trace_bundles.py --full --prune    # 全量核对导出，并清理过期内容包
+  python3 scripts/export_trace_bundles.py --out /var/www/trace
+
+CDN / 静态服务器缓存建议:
+  bundles/*          Cache-Control: public, max-age=31536000, immutable
+  traces/*           Cache-Control: public, max-age=60（清单，需短于 TRACE_BUNDLE_PRUNE_GRACE_SECONDS）
+  需允许前端域名跨域读取（Access-Control-Allow-Origin）
+"""
+import argparse
+import base64
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.config import settings
+from app.database import Base, engine, SessionLocal
+from app.services.trace_bundles import (
+    BundleExporter, exporter_lock, generate_signing_key, load_signing_key, public_key_der
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="导出静态溯源包")
+    parser.add_argument("--out", default=settings.TRACE_BUNDLE_DIR, help="导出目录")
+    parser.add_argument("--key", default=settings.TRACE_BUNDLE_KEY_PATH, help="签名私钥路径")
+    parser.add_argument("--state", default=settings.TRACE_BUNDLE_STATE_PATH, help="增量导出状态文件")
+    parser.add_argument("--init-key", action="store_true", help="生成签名密钥（已存在则不覆盖）")
+    parser.add_argument("--full", action="store_true", help="检查全部产品（忽略增量起点）")
+    parser.add_argument("--prune", action="store_true", help="清理不再引用且超过保留期的内容包")
+    args = parser.parse_args()
+
+    try:
+        if args.init_key:
+            if os.path.exists(args.key):
+                print(f"⚠️ 密钥已存在，未覆盖: {args.key}")
+                private_key = load_signing_key(args.key)
+            else:
+                private_key = generate_signing_key(args.key)
+                print(f"✅ 已生成签名密钥: {args.key}")
+            spki = base64.b64encode(public_key_der(private_key)).decode("ascii")
+            print(f"📦 前端配置: VITE_TRACE_BUNDLE_PUBLIC_KEY={spki}")
+            return
+
+        if not os.path.exists(args.key):
+            print(f"❌ 签名密钥不存在: {args.key}（先执行 --init-key）")
+            return
+        private_key = load_signing_key(args.key)
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+        return
+
+    # 确保快照表存在
+    Base.metadata.create_all(bind=engine)
+
+    with exporter_lock(args.state) as acquired:
+        if not acquired:
+            print("⚠️ 另一个导出正在进行（应用后台导出或其他脚本），请稍后重试")
+            return
+        exporter = BundleExporter(args.out, private_key, args.state)
+        db = SessionLocal()
+        try:
+            def progress(counts, last_id):
+                print(f"  📦 产品 ID ≤ {last_id}: {counts}")
+
+            counts = exporter.export(db, full=args.full, progress=progress)
+            print(f"✅ 导出完成: 新增/更新 {counts['exported']}，未变化 {counts['unchanged']}，"
+                  f"链上数据不可用 {counts['unavailable']}，撤下 {counts['withdrawn']}")
+            if counts["unavailable"]:
+                print("⚠️ 部分产品链上数据暂不可用，下次导出时重试")
+            if args.prune:
+                removed = exporter.prune(settings.TRACE_BUNDLE_PRUNE_GRACE_SECONDS)
+                print(f"✅ 清理过期内容包 {removed} 个")
+        except Exception as e:
+            print(f"❌ 错误: {e}")
+            import traceback
+            traceback.print_exc()
+        finally:
+            db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+重建用户统计计数
+按产品表和流转记录全量重新计算 user_statistics（上线回填 / 计数校正）
+"""
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import Base, engine, SessionLocal
+from app.services.statistics import rebuild_statistics
+
+
+def main():
+    # 确保统计表存在
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        count = rebuild_statistics(db)
+        print(f"✅ 已重建 {count} 个用户的统计计数")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
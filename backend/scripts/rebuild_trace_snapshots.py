@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+重建 / 核对溯源快照
+（上线回填、修复；应用运行时快照随写入自动重建）
+
+用法:
+  python3 scripts/rebuild_trace_snapshots.py            # 重建全部快照
+  python3 scripts/rebuild_trace_snapshots.py --stale    # 只重建缺失或失效的快照
+  python3 scripts/rebuild_trace_snapshots.py --verify   # 与链上核对，不一致的重新标记并重建
+"""
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import Base, engine, SessionLocal
+from app.services.trace_snapshots import rebuild_snapshots, verify_snapshots
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建 / 核对溯源快照")
+    parser.add_argument("--stale", action="store_true", help="只重建缺失或失效的快照")
+    parser.add_argument("--verify", action="store_true", help="与链上核对现有快照")
+    args = parser.parse_args()
+
+    # 确保快照表存在
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        if args.verify:
+            mismatches = verify_snapshots(db)
+            for item in mismatches:
+                print(f"  ❌ {item['trace_code']}: {item['issue']}")
+            # 不一致的快照已标记失效，在此同步重建
+            counts = rebuild_snapshots(db, only_stale=True)
+            print(f"✅ 核对完成: 不一致 {len(mismatches)} 个，重建 {counts}")
+        else:
+            counts = rebuild_snapshots(db, only_stale=args.stale)
+            print(f"✅ 快照重建完成: 链上 {counts['chain']}，数据库回退 {counts['database']}，跳过 {counts['skipped']}")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
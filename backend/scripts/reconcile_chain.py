@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+上链对账
+补偿上链失败（CHAIN_FAILED）或中断（长时间 PENDING_CHAIN）的产品：
+写入已落链的采用链上结果，否则重试（与应用内后台对账任务逻辑相同，可手动执行一轮）
+
+用法:
+  python3 scripts/reconcile_chain.py
+  python3 scripts/reconcile_chain.py --limit 200
+"""
+import argparse
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.database import Base, engine, SessionLocal
+# 导入接口模块以注册各后台上链任务
+from app.api import producer, processor, inspector, seller  # noqa: F401
+from app.services.chain_reconciler import reconcile_once
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上链对账")
+    parser.add_argument("--limit", type=int, default=None, help="本轮处理的操作数，默认使用 CHAIN_RECONCILE_BATCH_SIZE")
+    args = parser.parse_args()
+
+    # 确保操作表存在
+    Base.metadata.create_all(bind=engine)
+
+    db = SessionLocal()
+    try:
+        outcomes = reconcile_once(db, limit=args.limit)
+        print(f"✅ 对账完成: {outcomes or '无待处理操作'}")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+为已有的销售阶段 / 已售出产品批量预生成 AI 溯源简报（上线回填）
+已缓存且溯源数据未变化的产品直接跳过，可重复执行
+
+用法:
+  python3 scripts/warm_ai_summaries.py                    # 全部销售阶段 / 已售出产品
+  python3 scripts/warm_ai_summaries.py --per-minute 10    # 降低生成速率
+  python3 scripts/warm_ai_summaries.py --limit 100
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app.config import settings
+from app.database import Base, engine, SessionLocal
+from app.models.product import Product
+from app.services.ai_pregenerate import PREGENERATE_STAGES, summary_pregenerator
+from app.services.ai_provider import ai_provider
+
+
+def load_trace_codes(limit: int = None) -> list:
+    db = SessionLocal()
+    try:
+        query = db.query(Product.trace_code).filter(
+            Product.current_stage.in_(PREGENERATE_STAGES), Product.trace_code.isnot(None)
+        ).order_by(Product.id.asc())
+        if limit:
+            query = query.limit(limit)
+        return [row.trace_code for row in query]
+    finally:
+        db.close()
+
+
+async def warm(trace_codes: list, per_minute: int) -> dict:
+    interval = 60 / max(per_minute, 1)
+    counts = {"generated": 0, "cached": 0, "unavailable": 0, "error": 0}
+    await ai_provider.start()
+    try:
+        for i, trace_code in enumerate(trace_codes, 1):
+            started = time.monotonic()
+            try:
+                result = await summary_pregenerator.process(trace_code)
+            except Exception as e:
+                print(f"  ⚠️ {trace_code}: {e}")
+                result = "error"
+            counts[result] += 1
+            if i % 20 == 0:
+                print(f"  📦 {i}/{len(trace_codes)}: {counts}")
+            # 速率限制：只有调用了 AI 才占用配额
+            if result in ("generated", "error"):
+                await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+    finally:
+        await ai_provider.aclose()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量预生成 AI 溯源简报")
+    parser.add_argument("--per-minute", type=int, default=settings.AI_PREGENERATE_PER_MINUTE, help="每分钟最多生成数")
+    parser.add_argument("--limit", type=int, default=None, help="最多处理的产品数")
+    args = parser.parse_args()
+
+    if not settings.AI_API_KEY:
+        print("❌ 未配置 AI 密钥（GLM_API_KEY）")
+        return
+
+    # 确保简报缓存表存在
+    Base.metadata.create_all(bind=engine)
+
+    try:
+        trace_codes = load_trace_codes(args.limit)
+        print(f"📦 待处理产品 {len(trace_codes)} 个，每分钟最多生成 {args.per_minute} 份")
+        counts = asyncio.run(warm(trace_codes, args.per_minute))
+        print(f"✅ 预生成完成: 新生成 {counts['generated']}，已缓存 {counts['cached']}，"
+              f"溯源数据不可用 {counts['unavailable']}，失败 {counts['error']}")
+        if counts["unavailable"] or counts["error"]:
+            print("⚠️ 部分产品未生成，可稍后重新执行")
+    except Exception as e:
+        print(f"❌ 错误: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == "__main__":
+    main()
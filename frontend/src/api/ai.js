@@ -6,18 +6,55 @@ import api from './index'
 
 export const aiApi = {
   /**
-   * 生成产品溯源 AI 简报
+   * 生成产品溯源 AI 简报（溯源数据由服务端读取）
    * @param {string} traceCode - 溯源码
-   * @param {object} chainData - 区块链数据（可选）
-   * @returns {Promise<{summary: string, trace_code: string, success: boolean}>}
+   * @returns {Promise<{summary: string, trace_code: string, success: boolean, cached: boolean}>}
    */
-  generateSummary(traceCode, chainData = null) {
+  generateSummary(traceCode) {
     return api.post('/ai/summary', {
-      trace_code: traceCode,
-      chain_data: chainData
+      trace_code: traceCode
     })
   },
 
+  /**
+   * 流式生成产品溯源 AI 简报（Server-Sent Events）
+   * @param {string} traceCode - 溯源码
+   * @param {object} options - onDelta(text) 增量回调；signal 用于取消（页面离开时中断上游生成）
+   * @returns {Promise<{summary: string, trace_code: string, cached: boolean}>}
+   */
+  async streamSummary(traceCode, { onDelta, signal } = {}) {
+    const response = await fetch(`${api.defaults.baseURL}/ai/summary/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ trace_code: traceCode }),
+      signal
+    })
+    if (!response.ok || !response.body) {
+      throw new Error(`AI简报生成失败: ${response.status}`)
+    }
+
+    const reader = response.body.getReader()
+    const decoder = new TextDecoder()
+    let buffer = ''
+    while (true) {
+      const { value, done } = await reader.read()
+      if (done) break
+      buffer += decoder.decode(value, { stream: true })
+      // 事件之间以空行分隔
+      let boundary
+      while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+        const raw = buffer.slice(0, boundary)
+        buffer = buffer.slice(boundary + 2)
+        const event = raw.match(/^event: (.*)$/m)?.[1]
+        const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}')
+        if (event === 'delta') onDelta?.(data.content)
+        else if (event === 'done') return data
+        else if (event === 'error') throw new Error(data.detail)
+      }
+    }
+    throw new Error('AI简报生成中断')
+  },
+
   /**
    * 检查 AI API 服务状态
    */
@@ -2,6 +2,7 @@
  * 区块链 API
  */
 import api from './index'
+import { loadTraceBundle } from './traceBundle'
 
 export const blockchainApi = {
   // 获取链信息
@@ -25,7 +26,12 @@ export const blockchainApi = {
   },
 
   // 获取产品链上数据(需要较长时间,增加超时)
-  getProductChainData(traceCode) {
+  // 默认优先读取 CDN 上的静态溯源包（销售阶段/已售出产品），live=true 时直接查询接口
+  async getProductChainData(traceCode, { live = false } = {}) {
+    if (!live) {
+      const bundle = await loadTraceBundle(traceCode)
+      if (bundle) return bundle
+    }
     return api.get(`/blockchain/product/${traceCode}/chain-data`, {
       timeout: 30000  // 30秒超时
     })
@@ -0,0 +1,77 @@
+/**
+ * 静态溯源包（CDN）
+ * 后端 scripts/export_trace_bundles.py 导出销售阶段/已售出产品的溯源数据：
+ *   traces/{溯源码}.json  清单（内容包路径 + SHA-256 + ECDSA P-256 签名）
+ *   bundles/...          内容包，与 chain-data 接口响应一致
+ * 未配置 VITE_TRACE_BUNDLE_URL、清单不存在或校验失败时返回 null，由调用方回退到接口
+ */
+const BUNDLE_BASE_URL = (import.meta.env.VITE_TRACE_BUNDLE_URL || '').replace(/\/+$/, '')
+const PUBLIC_KEY = import.meta.env.VITE_TRACE_BUNDLE_PUBLIC_KEY || ''
+const MANIFEST_TIMEOUT = 3000  // 静态包只是加速路径，超时尽快回退
+
+let publicKeyPromise = null
+
+const base64ToBytes = (value) => Uint8Array.from(atob(value), c => c.charCodeAt(0))
+
+const toHex = (buffer) => Array.from(new Uint8Array(buffer))
+  .map(b => b.toString(16).padStart(2, '0'))
+  .join('')
+
+const fetchWithTimeout = async (url, timeout) => {
+  const controller = new AbortController()
+  const timer = setTimeout(() => controller.abort(), timeout)
+  try {
+    return await fetch(url, { signal: controller.signal })
+  } finally {
+    clearTimeout(timer)
+  }
+}
+
+const getPublicKey = () => {
+  if (!publicKeyPromise) {
+    publicKeyPromise = crypto.subtle.importKey(
+      'spki', base64ToBytes(PUBLIC_KEY), { name: 'ECDSA', namedCurve: 'P-256' }, false, ['verify']
+    )
+  }
+  return publicKeyPromise
+}
+
+// 校验内容包：哈希与清单一致；配置了公钥时同时验证签名
+const verifyBundle = async (manifest, body) => {
+  const digest = toHex(await crypto.subtle.digest('SHA-256', body))
+  if (digest !== manifest.sha256) return false
+  if (!PUBLIC_KEY) return true
+  return crypto.subtle.verify(
+    { name: 'ECDSA', hash: 'SHA-256' }, await getPublicKey(), base64ToBytes(manifest.signature), body
+  )
+}
+
+/**
+ * 读取静态溯源包
+ * @returns {Promise<object|null>} 与 chain-data 接口相同结构的数据；不可用时为 null
+ */
+export async function loadTraceBundle(traceCode) {
+  // WebCrypto 仅在安全上下文（HTTPS / localhost）可用
+  if (!BUNDLE_BASE_URL || !globalThis.crypto?.subtle) return null
+
+  try {
+    const manifestResponse = await fetchWithTimeout(
+      `${BUNDLE_BASE_URL}/traces/${encodeURIComponent(traceCode)}.json`, MANIFEST_TIMEOUT
+    )
+    if (!manifestResponse.ok) return null
+    const manifest = await manifestResponse.json()
+    if (manifest.trace_code !== traceCode) return null
+
+    const bundleResponse = await fetchWithTimeout(`${BUNDLE_BASE_URL}/${manifest.bundle}`, MANIFEST_TIMEOUT)
+    if (!bundleResponse.ok) return null
+    const body = await bundleResponse.arrayBuffer()
+    if (!(await verifyBundle(manifest, body))) {
+      console.warn('静态溯源包校验失败，改用接口查询:', traceCode)
+      return null
+    }
+    return JSON.parse(new TextDecoder('utf-8').decode(body))
+  } catch (e) {
+    console.warn('静态溯源包读取失败，改用接口查询:', e.message)
+    return null
+  }
+}